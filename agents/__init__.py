@@ -0,0 +1,5 @@
+from dotenv import load_dotenv
+
+# Load environment variables (GOOGLE_API_KEY, cache settings, etc.) once,
+# before any agent reads its configuration
+load_dotenv()
@@ -1,19 +1,15 @@
 import os
-from dotenv import load_dotenv
-from langchain.prompts import PromptTemplate
-from langchain_google_genai.chat_models import ChatGoogleGenerativeAI
+from functools import lru_cache
+from tools.concurrency import llm_slot
+from tools.tracing import span, record_llm_usage
+from tools.llm import build_chain
 
-# Load environment vars
-load_dotenv()
 
-# Load prompt template
-prompt_template = PromptTemplate.from_file("prompts/chat_prompt.txt")
+@lru_cache(maxsize=None)
+def get_chat_chain():
+    """Chat prompt + Gemini model, built on first use."""
+    return build_chain("chat_prompt.txt")
 
-# Gemeni model
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash")
-
-# Compose prompt + LLM
-chat_chain = prompt_template | llm
 
 def chat_agent(state: dict) -> dict:
     """
@@ -26,7 +22,23 @@ def chat_agent(state: dict) -> dict:
       - 'history': updated list
     """
     user_text = state["user_input"]
-    result = chat_chain.invoke({"user_input": user_text})
+    with span("llm_call") as s:
+        result = get_chat_chain().invoke({"user_input": user_text})
+        record_llm_usage(s, result)
+    return _chat_update(state, result)
+
+
+async def achat_agent(state: dict) -> dict:
+    """Async variant of chat_agent, bounded by the shared LLM concurrency limit."""
+    async with llm_slot():
+        with span("llm_call") as s:
+            result = await get_chat_chain().ainvoke({"user_input": state["user_input"]})
+            record_llm_usage(s, result)
+    return _chat_update(state, result)
+
+
+def _chat_update(state: dict, result) -> dict:
+    user_text = state["user_input"]
     ack = result.content if hasattr(result, "content") else result
     history = state.get("history", []) + [{"user": user_text, "assistant": ack}]
-    return {"ack": ack, "forwarded": user_text, "history": history}
\ No newline at end of file
+    return {"ack": ack, "forwarded": user_text, "history": history}
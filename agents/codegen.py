@@ -1,40 +1,127 @@
 import os
 import json
-from dotenv import load_dotenv
-from langchain.prompts import PromptTemplate
-from langchain_google_genai.chat_models import ChatGoogleGenerativeAI
+from functools import lru_cache
+from tools.cache import TieredCache, file_hash, make_key
+from tools.concurrency import llm_slot
+from tools.tracing import span, annotate, record_llm_usage
+from tools.metrics import registry, cache_samples
+from tools.llm import build_chain, prompt_path
+from tools.sweep import guard_assignments
+from tools.templates import get_template_registry, templates_enabled, HIT
 
-# Load environment variables (GOOGLE_API_KEY, etc.)
-load_dotenv()
+PROMPT_NAME = "codegen_prompt.txt"
+PROMPT_PATH = prompt_path(PROMPT_NAME)
+MODEL_NAME = "gemini-2.0-flash"
 
-# Load the external prompt for code generation
-prompt_template = PromptTemplate.from_file("prompts/codegen_prompt.txt")
 
-# Initialize the Gemini LLM for code generation
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash") # Using Pro for better coding ability
+@lru_cache(maxsize=None)
+def get_codegen_chain():
+    """Code generation prompt + Gemini model, built on first use."""
+    return build_chain(PROMPT_NAME, MODEL_NAME)
+
+
+# Scripts are cached by spec, prompt content and model, so editing the
+# prompt or switching models naturally invalidates old entries.
+PROMPT_HASH = file_hash(PROMPT_PATH)
+codegen_cache = TieredCache(
+    directory=os.getenv("CODEGEN_CACHE_DIR", os.path.join(".cache", "codegen")),
+    max_entries=int(os.getenv("CODEGEN_CACHE_MAX_ENTRIES", "256")),
+    max_disk_entries=int(os.getenv("CODEGEN_CACHE_MAX_DISK_ENTRIES", "5000")),
+    ttl=float(os.getenv("CODEGEN_CACHE_TTL", str(7 * 24 * 3600))),
+)
+registry.register_collector(lambda: cache_samples("codegen", codegen_cache.snapshot()))
+
+
+def codegen_cache_key(spec: dict) -> str:
+    return make_key(codegen_spec(spec), PROMPT_HASH, MODEL_NAME)
+
+
+def codegen_spec(spec: dict) -> dict:
+    """
+    The spec as the code generator sees it. A sweep is reduced to the names
+    of the swept parameters: their values are injected at execution time,
+    so one script (and one cache entry) serves every range of the sweep.
+    """
+    spec = dict(spec)
+    sweep = spec.pop("sweep", None)
+    if sweep:
+        spec["sweep"] = list(sweep)
+    return spec
 
-# Compose the prompt template and LLM into a runnable chain
-codegen_chain = prompt_template | llm
 
 def codegen_agent(state: dict) -> dict:
     """
     Code-Generator Agent: generates a GNU Octave .m script based on the JSON spec.
     Expects in state:
-      - 'spec': a dict with keys 'task', 'want_gif', and 'params'
+      - 'spec': a dict with keys 'task', 'want_gif', and 'params', and
+        optionally 'sweep'
     Returns:
-      - 'script': a string containing the complete .m file content
+      - 'script': a string containing the complete .m file content. For a
+        sweep, swept parameters are only assigned when not already set, so
+        the executor can inject each combination's values.
+
+    Tasks with a vetted template (see tools.templates) whose params fit its
+    schema are rendered from it without an LLM call.
     """
+    spec, cached = _lookup(state)
+    if cached is not None:
+        return {"script": cached}
+
+    # Invoke the chain to generate the script
+    with span("llm_call") as s:
+        result = get_codegen_chain().invoke({"spec": json.dumps(codegen_spec(spec))})
+        record_llm_usage(s, result)
+    return {"script": _store(spec, result)}
+
+
+async def acodegen_agent(state: dict) -> dict:
+    """Async variant of codegen_agent, bounded by the shared LLM concurrency limit."""
+    spec, cached = _lookup(state)
+    if cached is not None:
+        return {"script": cached}
+
+    async with llm_slot():
+        with span("llm_call") as s:
+            result = await get_codegen_chain().ainvoke({"spec": json.dumps(codegen_spec(spec))})
+            record_llm_usage(s, result)
+    return {"script": _store(spec, result)}
+
+
+def _cache_enabled() -> bool:
+    return os.getenv("CODEGEN_CACHE", "1") != "0"
+
+
+def _from_template(spec: dict):
+    """The script rendered from the task's template, or None to ask the LLM."""
+    if not templates_enabled():
+        return None
+    script, outcome, reason = get_template_registry().lookup(spec)
+    annotate(template=outcome)
+    if reason:
+        annotate(template_mismatch=reason)
+    return script if outcome == HIT else None
+
+
+def _lookup(state: dict):
+    """Return the spec and its templated or cached script (or None on a miss)."""
     spec = state.get("spec")
     if spec is None:
         raise ValueError("No 'spec' found in state for code generation")
-    
-    # Serialize the specification to JSON for the prompt
-    spec_json = json.dumps(spec)
-    
-    # Invoke the chain to generate the script
-    result = codegen_chain.invoke({"spec": spec_json})
+
+    script = _from_template(spec)
+    if script is not None:
+        return spec, script
+
+    if _cache_enabled():
+        cached = codegen_cache.get(codegen_cache_key(spec))
+        annotate(cache_hit=cached is not None)
+        return spec, cached
+    return spec, None
+
+
+def _store(spec: dict, result) -> str:
     llm_output = result.content if hasattr(result, "content") else result
-    
+
     # Strip ```octave ... ``` or ``` ... ``` fences from LLM output
     script = llm_output.strip()
     if script.startswith("```"):
@@ -44,4 +131,12 @@ def codegen_agent(state: dict) -> dict:
         script = script.rsplit('```', 1)[0]
         script = script.strip()
 
-    return {"script": script}
\ No newline at end of file
+    # Swept parameters must yield to the values injected per combination,
+    # even where the model assigned them unconditionally
+    if spec.get("sweep"):
+        script = guard_assignments(script, list(spec["sweep"]))
+
+    if _cache_enabled() and script:
+        codegen_cache.set(codegen_cache_key(spec), script)
+
+    return script
@@ -0,0 +1,38 @@
+import os
+from tools.digest import digest_outputs
+from tools.tracing import annotate
+
+# Hard budget for the run output passed to the summariser, in tokens
+DIGEST_MAX_TOKENS = int(os.getenv("DIGEST_MAX_TOKENS", "2000"))
+
+
+def digest_agent(state: dict) -> dict:
+    """
+    Digest Agent: condenses the run's output for the summariser (see
+    tools.digest). The full stdout/stderr stay on disk in the run directory
+    as stdout.log and stderr.log.
+    Expects in state:
+      - 'stdout', 'stderr': captured output of the run
+      - 'run_dir': the run directory (optional, e.g. absent after a
+        preflight rejection)
+      - 'sweep_results': per-combination results (optional); the budget is
+        shared between the combinations
+    Returns:
+      - 'stdout_digest', 'stderr_digest': the output within DIGEST_MAX_TOKENS
+      - 'sweep_results': for a sweep, each result with its own digests
+    """
+    sweep_results = state.get("sweep_results")
+    if sweep_results:
+        budget = max(1, DIGEST_MAX_TOKENS // len(sweep_results))
+        digested = []
+        for result in sweep_results:
+            stdout, stderr = digest_outputs(result["stdout"], result["stderr"], result["run_dir"], budget)
+            digested.append({**result, "stdout_digest": stdout, "stderr_digest": stderr})
+        annotate(digest_chars=sum(len(r["stdout_digest"]) + len(r["stderr_digest"]) for r in digested))
+        return {"sweep_results": digested}
+
+    stdout, stderr = digest_outputs(state.get("stdout", ""), state.get("stderr", ""),
+                                    state.get("run_dir"), DIGEST_MAX_TOKENS)
+    annotate(output_chars=len(state.get("stdout", "")) + len(state.get("stderr", "")),
+             digest_chars=len(stdout) + len(stderr))
+    return {"stdout_digest": stdout, "stderr_digest": stderr}
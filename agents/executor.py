@@ -1,58 +1,418 @@
 import os
+import json
+import time
 import uuid
-from dotenv import load_dotenv
-from tools.octave_runner import run_octave
-from tools.gif_utils import make_gif
+import sqlite3
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional
+import numpy as np
+from langgraph.config import get_stream_writer
+from tools.octave_runner import run_octave, arun_octave, BOOTSTRAP_VERSION
+from tools.octave_pool import get_pool
+from tools.gif_utils import iter_new_frames, stream_gif, animation_options
+from tools.frame_channel import RAW_FRAMES_FILE, iter_raw_frames
+from tools.cache import make_key
+from tools.result_cache import ResultCache, is_deterministic
+from tools.concurrency import octave_slot, octave_concurrency
+from tools.tracing import span, annotate
+from tools.metrics import registry, cache_samples
+from tools.run_catalog import get_catalog, dir_size
+from tools.sweep import combinations, assignment_code, label
+
+# Results of previous runs, keyed by script content
+result_cache = ResultCache(
+    directory=os.getenv("EXEC_CACHE_DIR", os.path.join(".cache", "exec")),
+    max_bytes=int(os.getenv("EXEC_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+)
+registry.register_collector(lambda: cache_samples("exec", dict(result_cache.stats)))
+
+# Minimum seconds between live frame previews sent to the stream
+PREVIEW_INTERVAL = float(os.getenv("PREVIEW_INTERVAL", "0.5"))
+
+# Per-combination results of a sweep, written to the sweep's run directory
+SWEEP_MANIFEST = "sweep.json"
+
+
+def _catalog(method: str, *args) -> None:
+    """Record a run in the run catalog; a catalog failure never fails the run."""
+    try:
+        getattr(get_catalog(), method)(*args)
+    except sqlite3.Error as e:
+        print(f"Error updating run catalog: {e}")
 
-# Load environment variables (e.g., GNUTERM, if needed)
-load_dotenv()
 
 def executor_agent(state: dict) -> dict:
     """
     Execution Agent: runs a GNU Octave .m script and returns artifacts.
     Expects in state:
       - 'script': the Octave .m script content as a string
-      - 'spec': dict containing at least 'want_gif': bool
+      - 'spec': dict containing at least 'want_gif': bool, and optionally
+        'frame_transport': 'png' (default) or 'raw'
+      - 'exec_cache': bool (optional) - set to False to always run Octave
+      - 'run_id': str (optional) - the pipeline run, whose id names run_dir
     Returns:
+      - 'run_dir': directory holding script.m and the run's artifacts
       - 'stdout': captured standard output from Octave
       - 'stderr': captured error output from Octave
       - 'frames': list of file paths to generated PNG frames
       - 'gif': file path to the combined GIF (or None if want_gif is False)
+      - 'animation': for a GIF, its 'frames', 'gif_bytes', 'encode_seconds'
+        and any extra formats written alongside it (ANIMATION_FORMATS), as
+        {format: {'path', 'bytes'}} under 'formats'; see animation_options.
+        A cached result only has 'gif_bytes' and 'cached'.
+
+    When the spec has a 'sweep', the script runs once per parameter
+    combination, with that combination's values assigned ahead of it, in
+    parallel across the Octave workers (see tools.sweep). Each combination
+    gets a sweep_NNN/ directory inside run_dir, and the update also holds:
+      - 'sweep_results': one dict per combination with 'params', 'run_dir',
+        'stdout', 'stderr', 'frames', 'gif' and 'completed'
+    'stdout'/'stderr' then concatenate the combinations' output, 'frames'
+    lists all their frames and 'gif' is the first GIF produced.
+
+    While Octave runs, frames are reported as they land through the graph's
+    custom stream (stream_mode="custom"), at most every PREVIEW_INTERVAL
+    seconds, as {'type': 'frame', 'run_dir', 'frame' (a file path or an
+    RGB array for raw frames), 'count', 'fps'} events.
+    """
+    if state.get("spec", {}).get("sweep"):
+        return _execute_sweep(state)
+
+    run, cached = _prepare(state)
+    if cached is not None:
+        return cached
+
+    # Invoke Octave (on a warm pooled worker when enabled) and collect frames.
+    # When a GIF is wanted, frames are encoded as they land in run_dir while
+    # Octave is still running, rather than all at once afterwards.
+    with ThreadPoolExecutor(max_workers=1) as runner:
+        # Copy the context so the Octave run is recorded in this node's trace
+        future = runner.submit(contextvars.copy_context().run, run_octave,
+                               run["script_path"], run["run_dir"], pool=get_pool())
+        gif_path = _encode_gif(run, future.done) if run["want_gif"] else _watch_frames(run, future.done)
+        result = future.result()
+
+    return _finish(run, result, gif_path)
+
+
+async def aexecutor_agent(state: dict) -> dict:
     """
+    Async variant of executor_agent, bounded by the shared Octave
+    concurrency limit. GIF encoding runs in a worker thread alongside the
+    Octave subprocess.
+    """
+    if state.get("spec", {}).get("sweep"):
+        return await _aexecute_sweep(state)
+
+    run, cached = _prepare(state)
+    if cached is not None:
+        return cached
+
+    async with octave_slot():
+        done = threading.Event()
+        octave = asyncio.ensure_future(arun_octave(run["script_path"], run["run_dir"], pool=get_pool()))
+        octave.add_done_callback(lambda _: done.set())
+        try:
+            encode = _encode_gif if run["want_gif"] else _watch_frames
+            gif_path = await asyncio.to_thread(encode, run, done.is_set)
+        except asyncio.CancelledError:
+            # Kill Octave (e.g. the job was cancelled) instead of waiting for it
+            octave.cancel()
+            raise
+        finally:
+            result = await octave
+
+    return _finish(run, result, gif_path)
+
+
+def _inputs(state: dict):
     script = state.get("script")
-    spec = state.get("spec", {})
     if script is None:
         raise ValueError("Executor requires 'script' in state")
+    return script, state.get("spec", {})
 
-    want_gif = spec.get("want_gif", False)
 
-    # Create a unique run directory under test_runs/
-    run_id = uuid.uuid4().hex
+def _new_run_dir(run_id: Optional[str] = None) -> tuple:
+    """
+    Create a run directory under test_runs/; returns (run_id, run_dir).
+
+    A pipeline run with a 'run_id' executes in test_runs/<run_id>, next to its
+    checkpoints (see pipeline.checkpoint_path). Later executions of the same
+    run (after a repair or a resume) get <run_id>-2, <run_id>-3, ...
+    """
+    base = run_id or uuid.uuid4().hex
+    run_id, attempt = base, 1
+    while os.path.exists(os.path.join("test_runs", run_id, "script.m")):
+        attempt += 1
+        run_id = f"{base}-{attempt}"
     run_dir = os.path.join("test_runs", run_id)
     os.makedirs(run_dir, exist_ok=True)
+    return run_id, run_dir
+
+
+def _prepare(state: dict):
+    """
+    Create the run directory and write the script.
+
+    Returns:
+        A (run, cached) tuple: `run` describes the run for the later steps,
+        and `cached` is a previous identical result, if any.
+    """
+    script, spec = _inputs(state)
+    run_id, run_dir = _new_run_dir(state.get("run_id"))
+    run, cached = _new_run(script, spec, run_dir, state.get("exec_cache", True))
+    run["run_id"] = run_id
+    _catalog("record_start", run_id, run_dir, make_key(spec), make_key(script))
+    if cached is not None:
+        _catalog("record_finish", run_id, "cached", dir_size(run_dir))
+    return run, cached
+
+
+def _new_run(script: str, spec: dict, run_dir: str, exec_cache: bool = True):
+    """Write the script into `run_dir` and look for a cached result; see _prepare."""
+    want_gif = spec.get("want_gif", False)
+    raw_frames = spec.get("frame_transport", "png") == "raw"
+    options = animation_options() if want_gif else {}
 
     # Write the script to disk
+    os.makedirs(run_dir, exist_ok=True)
     script_path = os.path.join(run_dir, "script.m")
     with open(script_path, "w") as f:
         f.write(script)
 
-    # Invoke Octave to execute the script and collect frames
-    result = run_octave(script_path, run_dir)
-    frames = result.get("frames", [])
+    # Reuse a previous run of the identical script when it is deterministic
+    run = {
+        "run_dir": run_dir,
+        "script_path": script_path,
+        "want_gif": want_gif,
+        "raw_frames": raw_frames,
+        "animation_options": options,
+        "use_cache": (
+            exec_cache
+            and os.getenv("EXEC_CACHE", "1") != "0"
+            and is_deterministic(script)
+        ),
+        "cache_key": make_key(script, BOOTSTRAP_VERSION, want_gif, raw_frames, options),
+        "stream_writer": _stream_writer(),
+    }
+    cached = result_cache.get(run["cache_key"], run_dir) if run["use_cache"] else None
+    if run["use_cache"]:
+        annotate(cache_hit=cached is not None)
+    if cached is not None:
+        cached["run_dir"] = run_dir
+        # Only the GIF is cached; extra formats are not restored
+        cached["animation"] = cached["gif"] and {"gif_bytes": os.path.getsize(cached["gif"]), "cached": True}
+    return run, cached
+
+
+def _stream_writer():
+    """The graph's custom stream writer, or a no-op outside a graph run."""
+    try:
+        return get_stream_writer()
+    except (RuntimeError, KeyError):
+        return lambda _: None
+
+
+def _frame_source(run: dict, is_done) -> Iterator:
+    """Frames of the run as they appear, reported to the stream as they pass."""
+    run_dir = run["run_dir"]
+    if run["raw_frames"]:
+        frames = iter_raw_frames(os.path.join(run_dir, RAW_FRAMES_FILE), is_done)
+    else:
+        frames = iter_new_frames(run_dir, is_done)
+    return _report_frames(run, frames)
+
 
-    # Optionally build a GIF from frames
-    gif_path = None
-    if want_gif and frames:
-        gif_path = os.path.join(run_dir, "output.gif")
+def _report_frames(run: dict, frames: Iterable) -> Iterator:
+    writer = run["stream_writer"]
+    first = last_sent = None
+    count = 0
+    for frame in frames:
+        count += 1
+        now = time.monotonic()
+        first = first or now
+        if last_sent is None or now - last_sent >= PREVIEW_INTERVAL:
+            last_sent = now
+            _send_frame(writer, run, frame, count, now - first)
+        yield frame
+    # Always report the final count
+    if count and now != last_sent:
+        _send_frame(writer, run, frame, count, now - first)
+
+
+def _send_frame(writer, run: dict, frame, count: int, elapsed: float) -> None:
+    writer({
+        "type": "frame",
+        "run_dir": run["run_dir"],
+        # Raw frames are views of a file that keeps growing; send a copy
+        "frame": frame if isinstance(frame, str) else np.array(frame),
+        "count": count,
+        # Rate at which Octave produces frames, from the first one on
+        "fps": (count - 1) / elapsed if elapsed > 0 else 0.0,
+    })
+
+
+def _watch_frames(run: dict, is_done) -> None:
+    """Report frames to the stream while Octave runs, without encoding a GIF."""
+    try:
+        for _ in _frame_source(run, is_done):
+            pass
+    except Exception as e:
+        print(f"Error watching frames: {e}")
+    return None
+
+
+def _encode_gif(run: dict, is_done) -> Optional[str]:
+    """
+    Encode frames into output.gif as they appear; returns its path or None.
+    The size and encode time are left in run['animation'].
+    """
+    run_dir = run["run_dir"]
+    gif_path = os.path.join(run_dir, "output.gif")
+    options = dict(run["animation_options"])
+    try:
+        frame_source = _frame_source(run, is_done)
+        # Encoding overlaps the Octave run, so this span includes waiting on it
+        with span("gif_encode") as s:
+            stats = stream_gif(frame_source, gif_path, delete_frames=True, **options)
+            s.update(gif_frames=stats["frames"], gif_bytes=stats["bytes"])
+        if not stats["frames"]:
+            return None
+        run["animation"] = _animation_report(gif_path, stats)
+    except Exception as e:
+        print(f"Error creating GIF: {e}")
+        return None # No GIF if creation fails
+
+    # The raw frame buffer is not needed once the GIF exists
+    if run["raw_frames"]:
         try:
-            make_gif(frames, gif_path)
-        except Exception as e:
-            print(f"Error creating GIF: {e}")
-            gif_path = None # Set to None if GIF creation fails
+            os.remove(os.path.join(run_dir, RAW_FRAMES_FILE))
+        except OSError:
+            pass
+    return gif_path
+
 
+def _animation_report(gif_path: str, stats: dict) -> dict:
     return {
-        "stdout": result.get("stdout", ""),
-        "stderr": result.get("stderr", ""),
+        "frames": stats["frames"],
+        "gif_bytes": os.path.getsize(gif_path),
+        "encode_seconds": round(stats["seconds"], 3),
+        "formats": stats["outputs"],
+    }
+
+
+def _finish(run: dict, result: dict, gif_path: Optional[str]) -> dict:
+    frames = result.get("frames", [])
+    stdout = result.get("stdout", "")
+    stderr = result.get("stderr", "")
+    if run["use_cache"] and result.get("completed"):
+        result_cache.put(run["cache_key"], stdout, stderr, frames, gif_path)
+    if run.get("run_id"):
+        status = "completed" if result.get("completed") else "failed"
+        _catalog("record_finish", run["run_id"], status, dir_size(run["run_dir"]))
+
+    return {
+        "run_dir": run["run_dir"],
+        "stdout": stdout,
+        "stderr": stderr,
         "frames": frames,
         "gif": gif_path,
-    }
\ No newline at end of file
+        "animation": run.get("animation") if gif_path else None,
+    }
+
+
+# --- Parameter sweeps ---
+
+def _prepare_sweep(state: dict):
+    """
+    Create the sweep's run directory, holding the parameterized script, and
+    one sub-run per parameter combination.
+
+    Returns:
+        (sweep, items): the sweep's run id and directory, and a (run,
+        cached) tuple per combination, as returned by _prepare.
+    """
+    script, spec = _inputs(state)
+    run_id, run_dir = _new_run_dir(state.get("run_id"))
+    with open(os.path.join(run_dir, "script.m"), "w") as f:
+        f.write(script)
+    _catalog("record_start", run_id, run_dir, make_key(spec), make_key(script))
+
+    items = []
+    for index, params in enumerate(combinations(spec["sweep"])):
+        run, cached = _new_run(assignment_code(params) + script, spec,
+                               os.path.join(run_dir, f"sweep_{index:03d}"), state.get("exec_cache", True))
+        run["params"] = params
+        items.append((run, cached))
+    return {"run_id": run_id, "run_dir": run_dir}, items
+
+
+def _execute_sweep(state: dict) -> dict:
+    sweep, items = _prepare_sweep(state)
+    workers = max(1, min(len(items), octave_concurrency()))
+    with ThreadPoolExecutor(max_workers=workers) as runners:
+        # Each run gets its own copy of the context, so it is traced in this node
+        futures = [runners.submit(contextvars.copy_context().run, _execute_combination, run, cached)
+                   for run, cached in items]
+        results = [future.result() for future in futures]
+    return _finish_sweep(sweep, items, results)
+
+
+def _execute_combination(run: dict, cached: Optional[dict]) -> dict:
+    if cached is not None:
+        return {**cached, "completed": True}
+    with span("sweep_run", params=label(run["params"])):
+        result = run_octave(run["script_path"], run["run_dir"], pool=get_pool())
+        gif_path = _encode_gif(run, lambda: True) if run["want_gif"] else None
+    return {**_finish(run, result, gif_path), "completed": bool(result.get("completed"))}
+
+
+async def _aexecute_sweep(state: dict) -> dict:
+    sweep, items = _prepare_sweep(state)
+
+    async def execute(run: dict, cached: Optional[dict]) -> dict:
+        if cached is not None:
+            return {**cached, "completed": True}
+        with span("sweep_run", params=label(run["params"])):
+            async with octave_slot():
+                result = await arun_octave(run["script_path"], run["run_dir"], pool=get_pool())
+            gif_path = await asyncio.to_thread(_encode_gif, run, lambda: True) if run["want_gif"] else None
+        return {**_finish(run, result, gif_path), "completed": bool(result.get("completed"))}
+
+    results = await asyncio.gather(*(execute(run, cached) for run, cached in items))
+    return _finish_sweep(sweep, items, results)
+
+
+def _finish_sweep(sweep: dict, items: list, results: list) -> dict:
+    sweep_results = [{"params": run["params"], **result} for (run, _), result in zip(items, results)]
+
+    manifest = [{
+        "params": r["params"],
+        "run_dir": r["run_dir"],
+        "gif": r["gif"],
+        "animation": r.get("animation"),
+        "frames": len(r["frames"]),
+        "completed": r["completed"],
+    } for r in sweep_results]
+    with open(os.path.join(sweep["run_dir"], SWEEP_MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    failed = sum(not r["completed"] for r in sweep_results)
+    _catalog("record_finish", sweep["run_id"], "failed" if failed else "completed", dir_size(sweep["run_dir"]))
+
+    def joined(key: str) -> str:
+        return "\n".join(f"% --- {label(r['params'])} ---\n{r[key]}" for r in sweep_results if r[key])
+
+    gifs = [r["gif"] for r in sweep_results if r["gif"]]
+    return {
+        "run_dir": sweep["run_dir"],
+        "stdout": joined("stdout"),
+        "stderr": joined("stderr"),
+        "frames": [frame for r in sweep_results for frame in r["frames"]],
+        "gif": gifs[0] if gifs else None,
+        "animation": next((r["animation"] for r in sweep_results if r.get("animation")), None),
+        "sweep_results": sweep_results,
+    }
@@ -1,29 +1,119 @@
 import os
 import json
-from dotenv import load_dotenv
-from langchain.prompts import PromptTemplate
-from langchain_google_genai.chat_models import ChatGoogleGenerativeAI
-from pydantic import BaseModel, Field, ValidationError
-from typing import Any, Dict
+from functools import lru_cache
+from tools.concurrency import llm_slot
+from tools.tracing import span, annotate, record_llm_usage
+from tools.similarity import SpecIndex
+from tools.metrics import registry, cache_samples
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from typing import Any, Dict, Literal
+from tools.llm import build_chain
+from tools.sweep import combinations
+
+FRAME_TRANSPORTS = ("png", "raw")
+
+
+def default_frame_transport() -> str:
+    """How animation frames reach Python unless a spec says otherwise (FRAME_TRANSPORT, default 'png')."""
+    transport = os.getenv("FRAME_TRANSPORT", "png")
+    if transport not in FRAME_TRANSPORTS:
+        raise ValueError(f"FRAME_TRANSPORT must be one of {FRAME_TRANSPORTS}, got {transport!r}")
+    return transport
 
-# Load environment variables
-load_dotenv()
 
 class SimulationSpec(BaseModel):
     task: str = Field(..., description="Simulation type discriminator, e.g., 'plot_signal' or 'run_simulation'")
     want_gif: bool = Field(default=False, description="Whether to produce a GIF output")
     params: Dict[str, Any] = Field(default_factory=dict, description="Additional parameters for the simulation")
+    frame_transport: Literal["png", "raw"] = Field(
+        # Defaults are not validated, so the factory checks the value itself
+        default_factory=default_frame_transport,
+        description="How animation frames reach Python: 'png' files or the raw RGB frame channel",
+    )
+    sweep: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="Parameters to run over several values: a list, or a {start, stop, step|num} range, per name",
+    )
+
+    @field_validator("sweep")
+    @classmethod
+    def _check_sweep(cls, sweep: Dict[str, Any]) -> Dict[str, Any]:
+        # Raises ValueError for bad names, empty ranges or too many combinations
+        combinations(sweep)
+        return sweep
+
+
+# Validated specs of previous requests, matched by near-duplicate text
+spec_index = SpecIndex(
+    path=os.getenv("SPEC_INDEX_PATH", os.path.join(".cache", "interpret", "spec_index.sqlite3")),
+    threshold=float(os.getenv("SPEC_SIMILARITY_THRESHOLD", "0.8")),
+    max_entries=int(os.getenv("SPEC_INDEX_MAX_ENTRIES", "5000")),
+)
+registry.register_collector(lambda: cache_samples("interpret", spec_index.snapshot()))
+
+
+@lru_cache(maxsize=None)
+def get_interpreter_chain():
+    """Interpreter prompt + Gemini model, built on first use."""
+    return build_chain("interpreter_prompt.txt")
 
-# Initialize the Gemini-based LLM
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash")
-prompt_template = PromptTemplate.from_file("prompts/interpreter_prompt.txt")
-interpreter_chain = prompt_template | llm
 
 def interpret_spec(state: dict) -> dict:
     """
     Convert free-form user input in state into a dict with key 'spec'
     containing a validated SimulationSpec.
+
+    Requests that closely match an earlier one (see tools.similarity) reuse
+    its spec without calling the LLM.
     """
+    user_input = _clean_input(state)
+    cached = _lookup(user_input)
+    if cached is not None:
+        return cached
+
+    # Invoke the LLM chain
+    with span("llm_call") as s:
+        result = get_interpreter_chain().invoke({"user_input": user_input})
+        record_llm_usage(s, result)
+    return _parse_spec(result, user_input)
+
+
+async def ainterpret_spec(state: dict) -> dict:
+    """Async variant of interpret_spec, bounded by the shared LLM concurrency limit."""
+    user_input = _clean_input(state)
+    cached = _lookup(user_input)
+    if cached is not None:
+        return cached
+
+    async with llm_slot():
+        with span("llm_call") as s:
+            result = await get_interpreter_chain().ainvoke({"user_input": user_input})
+            record_llm_usage(s, result)
+    return _parse_spec(result, user_input)
+
+
+def _cache_enabled() -> bool:
+    return os.getenv("SPEC_CACHE", "1") != "0"
+
+
+def _lookup(user_input: str):
+    """Return a {'spec': ...} update for a near-duplicate request, or None."""
+    if not _cache_enabled():
+        return None
+    match = spec_index.lookup(user_input)
+    annotate(cache_hit=match is not None)
+    if match is None:
+        return None
+    spec, similarity = match
+    annotate(similarity=similarity)
+    try:
+        # Re-validate, so entries written by an older schema cannot leak through
+        return {"spec": SimulationSpec(**spec).dict()}
+    except ValidationError:
+        return None
+
+
+def _clean_input(state: dict) -> str:
     # Extract raw user input from state
     raw = state.get("forwarded", state.get("user_input", ""))
     # Clean up Markdown code fences if present
@@ -35,8 +125,10 @@ def interpret_spec(state: dict) -> dict:
         if lines and lines[-1].startswith("```"):
             lines = lines[:-1]
         raw_clean = "\n".join(lines)
-    # Invoke the LLM chain
-    result = interpreter_chain.invoke({"user_input": raw_clean})
+    return raw_clean
+
+
+def _parse_spec(result, user_input: str = None) -> dict:
     raw = result.content if hasattr(result, "content") else result
     # Strip ```json ... ``` or ``` ... ``` fences from LLM output if present
     raw_output = raw.strip()
@@ -54,6 +146,9 @@ def interpret_spec(state: dict) -> dict:
     try:
         spec_dict = json.loads(raw_output)
         spec = SimulationSpec(**spec_dict)
+        if user_input and _cache_enabled():
+            # frame_transport comes from the environment, not the request
+            spec_index.add(user_input, spec.dict(exclude={"frame_transport"}))
         return {"spec": spec.dict()}
     except (json.JSONDecodeError, ValidationError) as e:
         raise ValueError(f"Failed to parse simulation spec: {e}\nLLM output:\n{raw}")
@@ -0,0 +1,52 @@
+from tools.preflight import preflight, PreflightError
+from tools.tracing import annotate
+from agents.repair import can_repair, settle_repair
+
+REJECTED_MESSAGE = "PreflightError: the script was not run because it is malformed: {problems}"
+
+
+def preflight_agent(state: dict) -> dict:
+    """
+    Preflight Agent: statically checks the generated script before it is run.
+    Blocking or interactive calls are neutralized, figures are kept headless
+    and frame file names are normalised (see tools.preflight); every rewrite
+    is logged and recorded in the node's trace span.
+    Expects in state:
+      - 'script': the Octave .m script content as a string
+      - 'spec': dict with 'want_gif' and optionally 'frame_transport'
+    Returns:
+      - 'script': the rewritten script
+      - 'preflight': list of rewrites and warnings
+    or, when the script is too broken to run (unbalanced blocks or brackets,
+    unterminated strings):
+      - 'preflight_error': the problems found
+      - 'run_dir', 'stdout', 'stderr', 'frames', 'gif': an empty result
+        whose stderr reports the problems, so the run can be summarised
+        without Octave
+    """
+    try:
+        script, findings = preflight(state.get("script", ""), state.get("spec", {}))
+    except PreflightError as e:
+        annotate(preflight_rejected=1, problems=str(e))
+        return {
+            "preflight_error": str(e),
+            # Nothing ran; do not report an earlier run's directory
+            "run_dir": None,
+            "stdout": "",
+            "stderr": REJECTED_MESSAGE.format(problems=e),
+            "frames": [],
+            "gif": None,
+        }
+
+    rewrites = [f for f in findings if f["action"] == "rewrite"]
+    annotate(preflight_rewrites=len(rewrites), findings=findings)
+    return {"script": script, "preflight": findings, "preflight_error": None}
+
+
+def route_after_preflight(state: dict) -> str:
+    """Skip the Octave run for a rejected script, repairing it if the budget allows."""
+    if not state.get("preflight_error"):
+        return "execute"
+    # A patch that left the script malformed is not worth caching
+    settle_repair(state, failed=True)
+    return "repair" if can_repair(state) else "digest"
@@ -0,0 +1,170 @@
+import os
+import json
+from functools import lru_cache
+from tools.cache import TieredCache, file_hash, make_key
+from tools.concurrency import llm_slot
+from tools.tracing import span, annotate, record_llm_usage
+from tools.metrics import registry, cache_samples
+from tools.llm import build_chain, prompt_path, DEFAULT_MODEL
+from tools.repair import find_error, error_signature, error_location, trim_error, apply_patch, PatchError
+from tools.sweep import guard_assignments
+from agents.codegen import codegen_spec
+
+PROMPT_NAME = "repair_prompt.txt"
+PROMPT_HASH = file_hash(prompt_path(PROMPT_NAME))
+
+# Error text sent to the repair prompt; the message and call stack come first
+REPAIR_ERROR_CHARS = int(os.getenv("REPAIR_ERROR_CHARS", "2000"))
+
+
+@lru_cache(maxsize=None)
+def get_repair_chain():
+    """Repair prompt + Gemini model, built on first use."""
+    return build_chain(PROMPT_NAME)
+
+
+# Patches are cached by failing script and error signature, so a recurring
+# failure is fixed without another LLM call. Only patches whose re-run
+# succeeded are kept (see settle_repair).
+repair_cache = TieredCache(
+    directory=os.getenv("REPAIR_CACHE_DIR", os.path.join(".cache", "repair")),
+    max_entries=int(os.getenv("REPAIR_CACHE_MAX_ENTRIES", "256")),
+    max_disk_entries=int(os.getenv("REPAIR_CACHE_MAX_DISK_ENTRIES", "5000")),
+    ttl=float(os.getenv("REPAIR_CACHE_TTL", str(7 * 24 * 3600))),
+)
+registry.register_collector(lambda: cache_samples("repair", repair_cache.snapshot()))
+
+
+def max_repair_attempts() -> int:
+    """Repairs tried per request before a failure is reported (REPAIR_MAX_ATTEMPTS, default 2)."""
+    return int(os.getenv("REPAIR_MAX_ATTEMPTS", "2"))
+
+
+def can_repair(state: dict) -> bool:
+    """Whether the last run failed in a way a repair may fix, within the attempt budget."""
+    return (state.get("repair_attempts", 0) < max_repair_attempts()
+            and find_error(state.get("stderr", "")) is not None)
+
+
+def settle_repair(state: dict, failed: bool) -> None:
+    """
+    Cache the patch behind the script just checked or run, now that its
+    outcome is known: kept when the re-run succeeded, dropped (along with
+    any cached copy it was replayed from) when the script failed again.
+    """
+    pending = state.get("pending_repair")
+    if not pending or not _cache_enabled():
+        return
+    if failed:
+        repair_cache.delete(pending["key"])
+    else:
+        repair_cache.set(pending["key"], pending["patch"])
+
+
+def route_after_execute(state: dict) -> str:
+    settle_repair(state, failed=find_error(state.get("stderr", "")) is not None)
+    return "repair" if can_repair(state) else "digest"
+
+
+def route_after_repair(state: dict) -> str:
+    """Re-check and re-run a patched script; report a repair that could not be applied."""
+    return "digest" if state.get("repair_error") else "preflight"
+
+
+def repair_agent(state: dict) -> dict:
+    """
+    Repair Agent: patches a script that failed instead of regenerating it.
+    Only the failing script, the error location and the trimmed error are
+    sent to the repair prompt, which answers with SEARCH/REPLACE blocks.
+    Expects in state:
+      - 'script': the script that failed
+      - 'stderr': its error output (from the executor or the preflight check)
+      - 'spec': the simulation spec
+      - 'repair_attempts': repairs made so far (optional)
+    Returns:
+      - 'script': the patched script
+      - 'repair_attempts': incremented
+      - 'repairs': the attempts so far, each with 'attempt', 'signature',
+        'error' (first line), 'location' and 'patch'
+      - 'repair_error': why the patch could not be applied, or None
+      - 'pending_repair': the cache key and patch, cached only once the
+        patched script runs without an error (see settle_repair)
+    """
+    request, patch = _lookup(state)
+    if patch is None:
+        with span("llm_call") as s:
+            result = get_repair_chain().invoke(request["inputs"])
+            record_llm_usage(s, result)
+        patch = _content(result)
+    return _apply(state, request, patch)
+
+
+async def arepair_agent(state: dict) -> dict:
+    """Async variant of repair_agent, bounded by the shared LLM concurrency limit."""
+    request, patch = _lookup(state)
+    if patch is None:
+        async with llm_slot():
+            with span("llm_call") as s:
+                result = await get_repair_chain().ainvoke(request["inputs"])
+                record_llm_usage(s, result)
+        patch = _content(result)
+    return _apply(state, request, patch)
+
+
+def _cache_enabled() -> bool:
+    return os.getenv("REPAIR_CACHE", "1") != "0"
+
+
+def _lookup(state: dict):
+    """Build the repair request and return it with its cached patch (or None on a miss)."""
+    script = state.get("script", "")
+    error = find_error(state.get("stderr", "")) or state.get("stderr", "")
+    signature = error_signature(error)
+    location = error_location(error, script)
+    request = {
+        "key": make_key(script, signature, PROMPT_HASH, DEFAULT_MODEL),
+        "signature": signature,
+        "error": error.splitlines()[0] if error else "",
+        "location": location,
+        "inputs": {
+            "spec": json.dumps(codegen_spec(state.get("spec", {}))),
+            "script": script,
+            "location": location,
+            "error": trim_error(error, REPAIR_ERROR_CHARS),
+        },
+    }
+    annotate(signature=signature)
+    if not _cache_enabled():
+        return request, None
+    cached = repair_cache.get(request["key"])
+    annotate(cache_hit=cached is not None)
+    return request, cached
+
+
+def _content(result) -> str:
+    return result.content if hasattr(result, "content") else result
+
+
+def _apply(state: dict, request: dict, patch: str) -> dict:
+    attempt = state.get("repair_attempts", 0) + 1
+    record = {"attempt": attempt, "signature": request["signature"], "error": request["error"],
+              "location": request["location"], "patch": patch}
+    script = state.get("script", "")
+    try:
+        repaired = apply_patch(script, patch)
+        # Swept parameters must stay overridable (see agents.codegen)
+        spec = state.get("spec", {})
+        if spec.get("sweep"):
+            repaired = guard_assignments(repaired, list(spec["sweep"]))
+        if repaired == script:
+            raise PatchError("the repair does not change the script")
+    except PatchError as e:
+        print(f"Error applying repair: {e}")
+        record["failed"] = str(e)
+        if _cache_enabled():
+            repair_cache.delete(request["key"])
+        return {"repair_attempts": attempt, "repairs": state.get("repairs", []) + [record],
+                "repair_error": str(e), "pending_repair": None}
+
+    return {"script": repaired, "repair_attempts": attempt, "repairs": state.get("repairs", []) + [record],
+            "repair_error": None, "pending_repair": {"key": request["key"], "patch": patch}}
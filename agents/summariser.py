@@ -1,22 +1,23 @@
 import os
 import json
+from functools import lru_cache
 from typing import Any, Dict, List
-from dotenv import load_dotenv
-from langchain.prompts import PromptTemplate
-from langchain_google_genai.chat_models import ChatGoogleGenerativeAI
+from tools.concurrency import llm_slot
+from tools.tracing import span, record_llm_usage
+from tools.llm import build_chain
 import base64
 
-# Load environment variables (GOOGLE_API_KEY, etc.)
-load_dotenv()
 
-# Load the external prompt for summarization
-prompt_template = PromptTemplate.from_file("prompts/summariser_prompt.txt")
+# Output kept per combination of a sweep, so the aggregated context stays
+# small however many combinations ran
+SWEEP_OUTPUT_CHARS = int(os.getenv("SWEEP_OUTPUT_CHARS", "1500"))
 
-# Initialize the Gemini LLM for summarization
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash")
 
-# Compose the prompt template and LLM into a runnable chain
-summariser_chain = prompt_template | llm
+@lru_cache(maxsize=None)
+def get_summariser_chain():
+    """Summariser prompt + Gemini model, built on first use."""
+    return build_chain("summariser_prompt.txt")
+
 
 def summariser_agent(state: dict) -> dict:
     """
@@ -25,11 +26,39 @@ def summariser_agent(state: dict) -> dict:
       - 'spec': dict with simulation parameters
       - 'stdout': str from Octave execution
       - 'stderr': str from Octave execution
+      - 'stdout_digest', 'stderr_digest': bounded versions of the above
+        (optional, see agents.digest); used instead when present
       - 'frames': list of file paths to PNG frames
       - 'gif': file path to the output GIF (or None)
+      - 'sweep_results': per-combination results of a parameter sweep
+        (optional); summarised together in a single call
+      - 'repairs': automatic repairs of a failing script (optional)
     Returns:
       - 'response': a string containing markdown-formatted summary
     """
+    # Stream the summarization chain; graphs run with stream_mode="messages"
+    # forward each token to the caller as it arrives
+    with span("llm_call") as s:
+        message = None
+        for chunk in get_summariser_chain().stream({"context": build_context(state)}):
+            message = _merge_chunk(message, chunk)
+        record_llm_usage(s, message)
+    return _summary_update(state, _chunk_text(message) if message is not None else "")
+
+
+async def asummariser_agent(state: dict) -> dict:
+    """Async variant of summariser_agent, bounded by the shared LLM concurrency limit."""
+    message = None
+    async with llm_slot():
+        with span("llm_call") as s:
+            async for chunk in get_summariser_chain().astream({"context": build_context(state)}):
+                message = _merge_chunk(message, chunk)
+            record_llm_usage(s, message)
+    return _summary_update(state, _chunk_text(message) if message is not None else "")
+
+
+def build_context(state: dict) -> str:
+    """Serialise the parts of the state the summariser prompt needs."""
     spec = state.get("spec", {})
     stdout = state.get("stdout", "")
     stderr = state.get("stderr", "")
@@ -38,7 +67,7 @@ def summariser_agent(state: dict) -> dict:
 
     # Include the user's original request for context
     history = state.get("history", [])
-    user_query = history[-1]["user"] if history else ""
+    user_query = history[-1]["user"] if history else state.get("user_input", "")
 
     # Calculate boolean for gif production and integer for frames generated
     gif_produced = bool(gif_path_from_executor and os.path.exists(gif_path_from_executor))
@@ -48,16 +77,51 @@ def summariser_agent(state: dict) -> dict:
     context = {
         "spec": spec,
         "user_query": user_query,
-        "stdout": stdout,
-        "stderr": stderr,
+        "stdout": state.get("stdout_digest", stdout),
+        "stderr": state.get("stderr_digest", stderr),
         "frames_generated": frames_generated, # Pass as integer
         "gif_produced": gif_produced # Pass as boolean
     }
-    context_str = json.dumps(context)
 
-    # Invoke the summarization chain
-    result = summariser_chain.invoke({"context": context_str})
-    response = result.content if hasattr(result, "content") else result
+    # Failures fixed (or not) by the repair loop, without the patches themselves
+    repairs = state.get("repairs")
+    if repairs:
+        context["repairs"] = [{"attempt": r["attempt"], "error": r["error"], "applied": "failed" not in r}
+                              for r in repairs]
+
+    # A sweep is summarised as one comparison rather than one report per run
+    sweep_results = state.get("sweep_results")
+    if sweep_results:
+        del context["stdout"], context["stderr"]
+        context["sweep"] = [{
+            "params": r["params"],
+            "completed": r["completed"],
+            "stdout": r.get("stdout_digest", _clip(r["stdout"])),
+            "stderr": r.get("stderr_digest", _clip(r["stderr"])),
+            "frames_generated": len(r["frames"]),
+            "gif_produced": bool(r["gif"] and os.path.exists(r["gif"])),
+        } for r in sweep_results]
+    return json.dumps(context)
+
+
+def _clip(text: str, limit: int = None) -> str:
+    """The end of `text`, where errors and final results usually are."""
+    limit = SWEEP_OUTPUT_CHARS if limit is None else limit
+    return text if len(text) <= limit else "..." + text[-limit:]
+
+
+def _merge_chunk(message, chunk):
+    # Adding message chunks concatenates their content and sums token usage
+    return chunk if message is None else message + chunk
+
+
+def _chunk_text(chunk) -> str:
+    content = chunk.content if hasattr(chunk, "content") else chunk
+    return content if isinstance(content, str) else ""
+
+
+def _summary_update(state: dict, response: str) -> dict:
+    gif_path_from_executor = state.get("gif")
 
     # # If a GIF was produced, embed it as a base64 data URI in the response
     # if gif:
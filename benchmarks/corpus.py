@@ -0,0 +1,98 @@
+import re
+from typing import Optional, Tuple
+
+# Each case is a recorded request/spec/script/summary, so the fake LLM can
+# replay it. The `% bench:` header tells the synthetic Octave runner how many
+# frames of which size to produce; real Octave treats it as a comment.
+
+
+def _animation(name: str, frames: int, width: int, height: int, body: str) -> str:
+    return f"""% bench: frames={frames} size={width}x{height}
+% {name}
+fig = figure('visible', 'off', 'position', [0 0 {width} {height}]);
+nframes = {frames};
+for k = 1:nframes
+  clf;
+{body}
+  drawnow;
+  print(fig, sprintf('frame_%04d.png', k), '-dpng', '-r0');
+end
+disp(nframes);
+"""
+
+
+CASES = [
+    {
+        "name": "static_plot",
+        "request": "Plot sin(x) and cos(x) between 0 and 2*pi.",
+        "spec": {"task": "plot_sin_cos", "want_gif": False, "params": {"x_max": 6.283}},
+        "script": """% bench: frames=0
+x = linspace(0, 2*pi, 200);
+figure('visible', 'off');
+plot(x, sin(x), x, cos(x));
+legend('sin', 'cos');
+print('plot.png', '-dpng');
+disp(max(sin(x)));
+""",
+        "summary": "**1. User Request** Plot sin and cos.\n**2. Result** One static plot was produced.",
+    },
+    {
+        "name": "oscillator_20",
+        "request": "Animate a damped harmonic oscillator over 20 frames.",
+        "spec": {"task": "damped_oscillator", "want_gif": True, "params": {"frames": 20, "zeta": 0.1}},
+        "script": _animation("damped oscillator", 20, 320, 240,
+                             "  t = linspace(0, 10, 200);\n"
+                             "  plot(t(1:10*k), exp(-0.1*t(1:10*k)) .* cos(2*t(1:10*k)));\n"
+                             "  axis([0 10 -1 1]);"),
+        "summary": "**1. User Request** Damped oscillator.\n**2. Result** 20 frames were animated.",
+    },
+    {
+        "name": "wave_100",
+        "request": "Show a travelling wave on a string for 100 frames.",
+        "spec": {"task": "travelling_wave", "want_gif": True, "params": {"frames": 100, "speed": 1.5}},
+        "script": _animation("travelling wave", 100, 480, 360,
+                             "  x = linspace(0, 4*pi, 400);\n"
+                             "  plot(x, sin(x - 0.15*k));\n"
+                             "  axis([0 4*pi -1.2 1.2]);"),
+        "summary": "**1. User Request** Travelling wave.\n**2. Result** 100 frames were animated.",
+    },
+    {
+        "name": "heat_250",
+        "request": "Simulate 2D heat diffusion on a plate and animate 250 steps.",
+        "spec": {"task": "heat_diffusion_2d", "want_gif": True, "params": {"frames": 250, "alpha": 0.2}},
+        "script": _animation("heat diffusion", 250, 480, 360,
+                             "  [X, Y] = meshgrid(linspace(-1, 1, 80));\n"
+                             "  imagesc(exp(-(X.^2 + Y.^2) / (0.05 + 0.01*k)));\n"
+                             "  colorbar;"),
+        "summary": "**1. User Request** Heat diffusion.\n**2. Result** 250 frames were animated.",
+    },
+    {
+        "name": "particles_500",
+        "request": "Animate 200 particles in a box with elastic walls for 500 frames.",
+        "spec": {"task": "particle_box", "want_gif": True, "params": {"frames": 500, "particles": 200}},
+        "script": _animation("particles in a box", 500, 640, 480,
+                             "  rand('seed', k);\n"
+                             "  scatter(rand(200, 1), rand(200, 1), 8, 'filled');\n"
+                             "  axis([0 1 0 1]);"),
+        "summary": "**1. User Request** Particles in a box.\n**2. Result** 500 frames were animated.",
+    },
+]
+
+
+def frame_plan(script: str) -> Tuple[int, Optional[Tuple[int, int]]]:
+    """Read the frame count and (width, height) from a script's `% bench:` header."""
+    match = re.search(r"^% bench: frames=(\d+)(?: size=(\d+)x(\d+))?", script, re.MULTILINE)
+    if not match:
+        return 0, None
+    size = (int(match.group(2)), int(match.group(3))) if match.group(2) else None
+    return int(match.group(1)), size
+
+
+def get_cases(names=None):
+    """Return the corpus, optionally restricted to the given case names."""
+    if not names:
+        return list(CASES)
+    unknown = set(names) - {case["name"] for case in CASES}
+    if unknown:
+        raise ValueError(f"Unknown benchmark cases: {sorted(unknown)}")
+    return [case for case in CASES if case["name"] in names]
@@ -0,0 +1,128 @@
+import json
+import time
+import asyncio
+from typing import Any, Iterator, AsyncIterator, List, Optional, Tuple
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class ReplayChatModel(BaseChatModel):
+    """
+    A deterministic stand-in for the Gemini chat model.
+
+    Responses are replayed from a recording: the first `(needle, response)`
+    pair whose needle occurs in the prompt wins, otherwise `default` is
+    returned. Every call sleeps for `latency` seconds (split between the
+    first token and the remaining chunks when streaming), so pipeline
+    timings include a realistic model round-trip without any network.
+    """
+
+    recordings: List[Tuple[str, str]] = []
+    default: str = ""
+    latency: float = 0.0
+    # Portion of the latency spent before the first streamed chunk
+    first_token_share: float = 0.5
+    chunk_words: int = 4
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(m.content) for m in messages)
+        for needle, response in self.recordings:
+            if needle in prompt:
+                return response
+        return self.default
+
+    def _usage(self, messages: List[BaseMessage], text: str) -> dict:
+        # Rough whitespace token counts, enough to exercise usage reporting
+        prompt_tokens = sum(len(str(m.content).split()) for m in messages)
+        output_tokens = len(text.split())
+        return {"input_tokens": prompt_tokens, "output_tokens": output_tokens,
+                "total_tokens": prompt_tokens + output_tokens}
+
+    def _chunks(self, text: str) -> List[str]:
+        words = text.split(" ")
+        return [" ".join(words[i:i + self.chunk_words]) + (" " if i + self.chunk_words < len(words) else "")
+                for i in range(0, len(words), self.chunk_words)] or [""]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        text = self._respond(messages)
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        text = self._respond(messages)
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        text = self._respond(messages)
+        chunks = self._chunks(text)
+        time.sleep(self.latency * self.first_token_share)
+        for i, piece in enumerate(chunks):
+            if i:
+                time.sleep(self.latency * (1 - self.first_token_share) / len(chunks))
+            usage = self._usage(messages, text) if i == len(chunks) - 1 else None
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        text = self._respond(messages)
+        chunks = self._chunks(text)
+        await asyncio.sleep(self.latency * self.first_token_share)
+        for i, piece in enumerate(chunks):
+            if i:
+                await asyncio.sleep(self.latency * (1 - self.first_token_share) / len(chunks))
+            usage = self._usage(messages, text) if i == len(chunks) - 1 else None
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+
+def install_fake_llm(cases: List[dict], latency: float = 0.0) -> None:
+    """
+    Replace the agents' chains with replaying models built from the corpus.
+
+    Args:
+        cases: Benchmark cases (see benchmarks.corpus) providing the recorded
+            spec, script and summary for each request.
+        latency: Seconds each simulated LLM call takes.
+    """
+    import agents.chat_agent as chat_agent
+    import agents.interpreter as interpreter
+    import agents.codegen as codegen
+    import agents.summariser as summariser
+    from tools.llm import load_prompt
+    from tools.llm_gateway import LLMGateway
+
+    def replay(prompt_name, recordings, default):
+        # Behind a gateway like the real model, minus the rate limits
+        model = ReplayChatModel(recordings=recordings, default=default, latency=latency)
+        chain = load_prompt(prompt_name) | LLMGateway(model)
+        return lambda: chain
+
+    def task_needle(case):
+        # Codegen and summariser prompts embed the spec as JSON; every case
+        # has a distinct task name
+        return json.dumps({"task": case["spec"]["task"]})[1:-1]
+
+    chat_agent.get_chat_chain = replay(
+        "chat_prompt.txt", [], "Got it - setting up that simulation now.")
+    interpreter.get_interpreter_chain = replay(
+        "interpreter_prompt.txt", [(case["request"], json.dumps(case["spec"])) for case in cases], "{}")
+    codegen.get_codegen_chain = replay(
+        codegen.PROMPT_NAME, [(task_needle(case), "```octave\n" + case["script"] + "\n```") for case in cases], "")
+    summariser.get_summariser_chain = replay(
+        "summariser_prompt.txt", [(task_needle(case), case["summary"]) for case in cases], "Simulation finished.")
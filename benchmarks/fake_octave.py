@@ -0,0 +1,76 @@
+import os
+import time
+import asyncio
+from typing import Any, Dict
+import numpy as np
+from PIL import Image
+from tools.octave_runner import discover_frames
+from tools.tracing import span
+from benchmarks.corpus import frame_plan
+
+DEFAULT_SIZE = (320, 240)
+
+
+def synthetic_frame(index: int, width: int, height: int) -> np.ndarray:
+    """A deterministic plot-like RGB frame: white background, moving curve and grid."""
+    frame = np.full((height, width, 3), 255, dtype=np.uint8)
+    frame[::max(1, height // 8), :] = 220
+    frame[:, ::max(1, width // 8)] = 220
+    x = np.arange(width)
+    y = (height / 2 + 0.4 * height * np.sin(2 * np.pi * (x / width) + 0.15 * index)).astype(int)
+    for dy in (-1, 0, 1):
+        frame[np.clip(y + dy, 0, height - 1), x] = (0, 114, 189)
+    return frame
+
+
+def synthetic_run_octave(script_path: str, run_dir: str, timeout: int = 300, pool=None,
+                         startup: float = 0.0, frame_interval: float = 0.0) -> Dict[str, Any]:
+    """
+    Drop-in replacement for tools.octave_runner.run_octave that writes the
+    frames announced by the script's `% bench:` header instead of running
+    Octave.
+
+    Args:
+        startup: Seconds to sleep before the first frame (interpreter start).
+        frame_interval: Seconds to sleep between frames (plotting work).
+    """
+    os.makedirs(run_dir, exist_ok=True)
+    with open(script_path) as f:
+        frames, size = frame_plan(f.read())
+    width, height = size or DEFAULT_SIZE
+
+    with span("octave", synthetic=True) as s:
+        time.sleep(startup)
+        for k in range(1, frames + 1):
+            path = os.path.join(run_dir, f"frame_{k:04d}.png")
+            # Write under a temporary name so watchers never see partial files
+            Image.fromarray(synthetic_frame(k, width, height)).save(path + ".tmp", format="PNG")
+            os.replace(path + ".tmp", path)
+            time.sleep(frame_interval)
+        stdout = f"ans = {frames}\n"
+        s["stdout_bytes"] = len(stdout)
+        s["stderr_bytes"] = 0
+
+    return {"stdout": stdout, "stderr": "", "frames": discover_frames(run_dir), "completed": True}
+
+
+async def asynthetic_run_octave(script_path: str, run_dir: str, timeout: int = 300, pool=None,
+                                startup: float = 0.0, frame_interval: float = 0.0) -> Dict[str, Any]:
+    """Async variant of synthetic_run_octave; frames are written from a worker thread."""
+    return await asyncio.to_thread(synthetic_run_octave, script_path, run_dir, timeout, pool,
+                                   startup, frame_interval)
+
+
+def install_fake_octave(startup: float = 0.0, frame_interval: float = 0.0) -> None:
+    """Route the executor agent's Octave calls to the synthetic runner."""
+    import agents.executor as executor
+
+    def run(script_path, run_dir, timeout=300, pool=None):
+        return synthetic_run_octave(script_path, run_dir, timeout, pool, startup, frame_interval)
+
+    async def arun(script_path, run_dir, timeout=300, pool=None):
+        return await asynthetic_run_octave(script_path, run_dir, timeout, pool, startup, frame_interval)
+
+    executor.run_octave = run
+    executor.arun_octave = arun
+    executor.get_pool = lambda: None
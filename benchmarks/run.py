@@ -0,0 +1,346 @@
+"""
+Offline pipeline benchmarks: no Gemini calls and, except for the startup
+suite, no Octave install needed.
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --suite gif --gif-frames 10,100,500
+    python -m benchmarks.run --output new.json --compare bench.json
+
+Run from the repository root.
+"""
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import itertools
+import subprocess
+import statistics
+import tracemalloc
+from datetime import datetime, timezone
+
+SUITES = ("e2e", "throughput", "gif", "startup", "coldstart")
+
+
+def percentile(samples, pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def latency_stats(samples) -> dict:
+    return {
+        "p50_seconds": percentile(samples, 50),
+        "p95_seconds": percentile(samples, 95),
+        "mean_seconds": statistics.mean(samples),
+    }
+
+
+def node_seconds(state: dict) -> dict:
+    """Per-node wall time from a final state's trace (see tools.tracing)."""
+    totals = {}
+    for record in state.get("trace", []):
+        if record["name"] == record["node"]:
+            totals[record["node"]] = totals.get(record["node"], 0) + record["wall_seconds"]
+    return totals
+
+
+def _cleanup(state: dict) -> None:
+    if state.get("run_dir"):
+        shutil.rmtree(state["run_dir"], ignore_errors=True)
+
+
+# --- Suites ---
+
+def bench_e2e(cases, repeats: int) -> dict:
+    """Sequential end-to-end latency of each corpus case."""
+    from pipeline import build_graph
+
+    graph = build_graph()
+    results = {}
+    for case in cases:
+        samples, nodes = [], []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            state = graph.invoke({"user_input": case["request"]})
+            samples.append(time.perf_counter() - start)
+            nodes.append(node_seconds(state))
+            frames = len(state.get("frames", []))
+            _cleanup(state)
+        results[case["name"]] = {
+            **latency_stats(samples),
+            "frames": frames,
+            "node_mean_seconds": {
+                node: statistics.mean(n.get(node, 0) for n in nodes) for node in nodes[0]
+            },
+        }
+        print(f"  e2e {case['name']}: p50={results[case['name']]['p50_seconds']:.3f}s")
+    return results
+
+
+def bench_throughput(cases, levels, requests: int) -> dict:
+    """Requests per second through the async graph at each concurrency level."""
+    from pipeline import build_graph
+
+    graph = build_graph(use_async=True)
+
+    async def run_level(concurrency: int):
+        semaphore = asyncio.Semaphore(concurrency)
+        samples = []
+
+        async def one(case):
+            async with semaphore:
+                start = time.perf_counter()
+                state = await graph.ainvoke({"user_input": case["request"]})
+                samples.append(time.perf_counter() - start)
+                _cleanup(state)
+
+        batch = list(itertools.islice(itertools.cycle(cases), max(requests, concurrency)))
+        start = time.perf_counter()
+        await asyncio.gather(*(one(case) for case in batch))
+        return len(batch), time.perf_counter() - start, samples
+
+    results = {}
+    for concurrency in levels:
+        count, elapsed, samples = asyncio.run(run_level(concurrency))
+        results[str(concurrency)] = {
+            "requests": count,
+            "wall_seconds": elapsed,
+            "requests_per_second": count / elapsed,
+            **latency_stats(samples),
+        }
+        print(f"  throughput x{concurrency}: {count / elapsed:.2f} req/s")
+    return results
+
+
+def bench_gif(frame_counts, size) -> dict:
+    """make_gif wall time and traced peak memory versus frame count."""
+    from PIL import Image
+    from tools.gif_utils import make_gif
+    from benchmarks.fake_octave import synthetic_frame
+
+    def write_frames(directory: str, count: int):
+        paths = []
+        for k in range(1, count + 1):
+            path = os.path.join(directory, f"frame_{k:04d}.png")
+            Image.fromarray(synthetic_frame(k, *size)).save(path)
+            paths.append(path)
+        return paths
+
+    results = {}
+    for count in frame_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            gif_path = os.path.join(tmp, "output.gif")
+
+            # Timed without tracemalloc, whose hooks slow allocation down
+            paths = write_frames(tmp, count)
+            start = time.perf_counter()
+            make_gif(paths, gif_path)
+            elapsed = time.perf_counter() - start
+            gif_bytes = os.path.getsize(gif_path)
+
+            paths = write_frames(tmp, count)
+            tracemalloc.start()
+            make_gif(paths, gif_path)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        results[str(count)] = {
+            "wall_seconds": elapsed,
+            "per_frame_seconds": elapsed / count,
+            "peak_traced_bytes": peak,
+            "gif_bytes": gif_bytes,
+        }
+        print(f"  gif {count} frames: {elapsed:.3f}s, peak {peak / 1e6:.1f} MB")
+    return results
+
+
+def bench_startup(repeats: int) -> dict:
+    """One-shot versus pooled run_octave overhead on a trivial script."""
+    from tools.octave_runner import run_octave, OCTAVE_CMD
+    from tools.octave_pool import OctavePool
+
+    if shutil.which(OCTAVE_CMD[0]) is None:
+        print(f"  startup: skipped ({OCTAVE_CMD[0]} not found)")
+        return {"skipped": f"{OCTAVE_CMD[0]} not found on PATH"}
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        script_path = os.path.join(tmp, "script.m")
+        with open(script_path, "w") as f:
+            f.write("x = 1 + 1;\ndisp(x);\n")
+
+        pool = OctavePool(size=1, max_runs=repeats + 1)
+        try:
+            start = time.perf_counter()
+            run_octave(script_path, tmp, pool=pool)
+            results["pool_spawn_seconds"] = time.perf_counter() - start
+            for label, kwargs in (("cold", {}), ("pool", {"pool": pool})):
+                samples = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    run_octave(script_path, tmp, **kwargs)
+                    samples.append(time.perf_counter() - start)
+                results[label] = latency_stats(samples)
+                print(f"  startup {label}: p50={results[label]['p50_seconds'] * 1000:.1f} ms")
+        finally:
+            pool.close()
+    return results
+
+
+def bench_coldstart(repeats: int) -> dict:
+    """Wall time of fresh interpreters: `cli_app.py --help` and importing the pipeline."""
+    commands = {
+        "cli_help": [sys.executable, "cli_app.py", "--help"],
+        "import_pipeline": [sys.executable, "-c", "import pipeline"],
+    }
+    results = {}
+    for label, command in commands.items():
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run(command, capture_output=True, check=True)
+            samples.append(time.perf_counter() - start)
+        results[label] = latency_stats(samples)
+        print(f"  coldstart {label}: p50={results[label]['p50_seconds'] * 1000:.0f} ms")
+    return results
+
+
+# --- Comparison ---
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def _direction(metric: str) -> int:
+    """+1 if higher is better, -1 if lower is better, 0 if informational."""
+    if metric.endswith("_per_second"):
+        return 1
+    if metric.endswith("_seconds") or metric.endswith("_bytes"):
+        return -1
+    return 0
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """
+    Print metric changes against a baseline results file.
+
+    Returns:
+        The names of metrics that got worse by more than `threshold`.
+    """
+    now, before = flatten(current["results"]), flatten(baseline["results"])
+    regressions = []
+    print(f"\nComparison with {baseline['meta'].get('commit') or 'baseline'} (threshold {threshold:.0%}):")
+    for metric in sorted(now.keys() & before.keys()):
+        direction = _direction(metric)
+        if not direction or not before[metric]:
+            continue
+        change = (now[metric] - before[metric]) / before[metric]
+        worse = -direction * change > threshold
+        if worse:
+            regressions.append(metric)
+        marker = "REGRESSION" if worse else ("improved" if direction * change > threshold else "")
+        print(f"  {metric:<60} {before[metric]:>12.4g} -> {now[metric]:>12.4g}  {change:+7.1%}  {marker}")
+    return regressions
+
+
+def _meta(args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+    }
+
+
+def _int_list(value: str):
+    return [int(v) for v in value.split(",") if v]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the offline pipeline benchmarks.")
+    parser.add_argument("--suite", action="append", choices=SUITES, help="Suite to run (repeatable). Default: all.")
+    parser.add_argument("--cases", type=lambda v: v.split(","), help="Comma-separated corpus case names.")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per case for latency suites.")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Simulated seconds per LLM call.")
+    parser.add_argument("--octave-startup", type=float, default=0.3, help="Simulated Octave start-up seconds.")
+    parser.add_argument("--frame-interval", type=float, default=0.005, help="Simulated seconds of plotting per frame.")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4, 16], help="Concurrency levels for the throughput suite.")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per throughput level.")
+    parser.add_argument("--gif-frames", type=_int_list, default=[10, 50, 100, 250, 500], help="Frame counts for the GIF suite.")
+    parser.add_argument("--gif-size", default="480x360", help="Frame size (WxH) for the GIF suite.")
+    parser.add_argument("--cold-start-budget", type=float, default=1.0,
+                        help="Maximum p50 seconds for `cli_app.py --help` in the coldstart suite.")
+    parser.add_argument("--output", metavar="FILE", help="Write results as JSON to FILE.")
+    parser.add_argument("--compare", metavar="FILE", help="Baseline results JSON to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression.")
+    args = parser.parse_args()
+    suites = args.suite or list(SUITES)
+
+    # Every request must reach the (fake) LLM and Octave layers
+    os.environ["SPEC_CACHE"] = "0"
+    os.environ["CODEGEN_CACHE"] = "0"
+    os.environ["EXEC_CACHE"] = "0"
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+    from benchmarks.corpus import get_cases
+    from benchmarks.fake_llm import install_fake_llm
+    from benchmarks.fake_octave import install_fake_octave
+
+    cases = get_cases(args.cases)
+    install_fake_llm(cases, latency=args.llm_latency)
+    install_fake_octave(startup=args.octave_startup, frame_interval=args.frame_interval)
+
+    results = {}
+    if "e2e" in suites:
+        results["e2e"] = bench_e2e(cases, args.repeats)
+    if "throughput" in suites:
+        results["throughput"] = bench_throughput(cases, args.concurrency, args.requests)
+    if "gif" in suites:
+        width, height = (int(v) for v in args.gif_size.split("x"))
+        results["gif"] = bench_gif(args.gif_frames, (width, height))
+    if "startup" in suites:
+        results["startup"] = bench_startup(args.repeats)
+    if "coldstart" in suites:
+        results["coldstart"] = bench_coldstart(args.repeats)
+
+    report = {"meta": _meta(args), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    failed = False
+    if "coldstart" in results and results["coldstart"]["cli_help"]["p50_seconds"] > args.cold_start_budget:
+        print(f"cli_app --help took {results['coldstart']['cli_help']['p50_seconds']:.2f}s, "
+              f"over the {args.cold_start_budget:.2f}s start-up budget.")
+        failed = True
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed.")
+            failed = True
+
+    if failed:
+        sys.exit(1)
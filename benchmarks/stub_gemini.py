@@ -0,0 +1,114 @@
+"""
+A local stand-in for the Gemini REST API, for exercising the LLM gateway
+(connection reuse, rate limiting, retries, coalescing) without network
+access or quota.
+
+    python -m benchmarks.stub_gemini --port 8765 --latency 0.2 --fail-every 5
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8765 GOOGLE_API_KEY=stub python cli_app.py "..."
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    """Request counters and failure injection shared by the handler threads."""
+
+    def __init__(self, latency: float = 0.0, fail_every: int = 0, reply: str = "stub reply"):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.reply = reply
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.connections = set()
+
+    def admit(self, client) -> bool:
+        """Count a request; returns False when it should get a 429."""
+        with self.lock:
+            self.requests += 1
+            self.connections.add(client)
+            if self.fail_every and self.requests % self.fail_every == 0:
+                self.failures += 1
+                return False
+            return True
+
+
+def _response(text: str, prompt_tokens: int) -> dict:
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": len(text.split()),
+            "totalTokenCount": prompt_tokens + len(text.split()),
+        },
+    }
+
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, so clients that pool connections reuse them
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status: int, payload) -> None:
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not state.admit(self.client_address):
+                self._send_json(429, {"error": {"code": 429, "message": "Resource has been exhausted (stub).",
+                                                "status": "RESOURCE_EXHAUSTED"}})
+                return
+
+            time.sleep(state.latency)
+            prompt = " ".join(part.get("text", "") for content in request.get("contents", [])
+                              for part in content.get("parts", []))
+            prompt_tokens = len(prompt.split())
+
+            if ":streamGenerateContent" in self.path:
+                words = state.reply.split(" ")
+                chunks = [_response(word + (" " if i < len(words) - 1 else ""), prompt_tokens)
+                          for i, word in enumerate(words)]
+                self._send_json(200, chunks)
+            elif ":generateContent" in self.path:
+                self._send_json(200, _response(state.reply, prompt_tokens))
+            else:
+                self._send_json(404, {"error": {"code": 404, "message": f"Unknown path {self.path}"}})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_stub(port: int = 0, **kwargs):
+    """Start the stub server in a background thread; returns (server, state)."""
+    state = StubState(**kwargs)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a stub Gemini REST API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each response.")
+    parser.add_argument("--fail-every", type=int, default=0, help="Answer every Nth request with HTTP 429.")
+    parser.add_argument("--reply", default="stub reply", help="Text returned for every prompt.")
+    args = parser.parse_args()
+
+    server, state = start_stub(args.port, latency=args.latency, fail_every=args.fail_every, reply=args.reply)
+    print(f"Stub Gemini API on http://127.0.0.1:{server.server_port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"requests={state.requests} failures={state.failures} connections={len(state.connections)}")
+    except KeyboardInterrupt:
+        server.shutdown()
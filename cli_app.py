@@ -1,99 +1,326 @@
 import os
+import csv
+import json
+import math
+import time
+import uuid
+import asyncio
 import argparse
 import traceback
+from contextlib import ExitStack
+from functools import lru_cache
+from typing import Optional
 from dotenv import load_dotenv
-from langgraph.graph import StateGraph, START, END
-from typing_extensions import TypedDict
-
-# Import your agent functions
-from agents.chat_agent import chat_agent
-from agents.interpreter import interpret_spec
-from agents.codegen import codegen_agent
-from agents.executor import executor_agent
-from agents.summariser import summariser_agent
+from tools.metrics import registry
+from tools.tracing import TRACE_FILE
+from tools.sweep import label as sweep_label
 
 # Load environment variables (GOOGLE_API_KEY, etc.)
 load_dotenv()
 
-# Define the state for the graph
-class SimulationState(TypedDict, total=False):
-    user_input: str
-    ack: str
-    forwarded: str
-    history: list
-    spec: dict
-    script: str
-    stdout: str
-    stderr: str
-    frames: list
-    gif: str
-    response: str
-
-# --- Build and Compile the LangGraph Pipeline ---
-graph = StateGraph(SimulationState)
-graph.add_node("chat", chat_agent)
-graph.add_node("interpret", interpret_spec)
-graph.add_node("codegen", codegen_agent)
-graph.add_node("execute", executor_agent)
-graph.add_node("summarise", summariser_agent)
-
-graph.add_edge(START, "chat")
-graph.add_edge("chat", "interpret")
-graph.add_edge("interpret", "codegen")
-graph.add_edge("codegen", "execute")
-graph.add_edge("execute", "summarise")
-graph.add_edge("summarise", END)
-
-compiled_graph = graph.compile()
-
-def run_cli_simulation(user_input: str) -> dict:
+# The pipeline (LangGraph, LangChain and the agents) is imported on first
+# use, so argument parsing and `--help` do not pay for it.
+
+
+@lru_cache(maxsize=None)
+def get_graph(use_async: bool = False):
+    """Build and compile the LangGraph pipeline on first use."""
+    from pipeline import build_graph
+    return build_graph(use_async=use_async)
+
+
+def run_cli_simulation(user_input: Optional[str] = None, resume: Optional[str] = None,
+                       node: Optional[str] = None, edits: Optional[dict] = None) -> dict:
     """
     Runs the full agentic pipeline for CLI, returning the final state.
+
+    Unless CHECKPOINTS=0, the state is saved after every node, next to the
+    run's artifacts (see pipeline.checkpoint_path). `resume` continues such a
+    run instead of starting one: from the node that failed, or from `node`,
+    with `edits` applied to the state first (see pipeline.resume_config).
     """
-    print(f"Starting simulation for: \"{user_input}\"")
+    from pipeline import build_graph, checkpoints_enabled, checkpoint_path, run_checkpointer, run_config, resume_config
+
+    checkpointed = resume is not None or checkpoints_enabled()
+    run_id = resume or uuid.uuid4().hex
+    if resume:
+        print(f"Resuming run {run_id}" + (f" from {node}" if node else ""))
+    else:
+        print(f"Starting simulation for: \"{user_input}\"")
     print("-" * 30)
 
-    final_state = None
+    final_state = {}
     try:
-        # Stream the graph execution to show intermediate steps
-        for i, chunk in enumerate(compiled_graph.stream({"user_input": user_input})):
-            node_name = list(chunk.keys())[0]
-            print(f"Step {i+1}: {node_name} completed.")
-            final_state = list(chunk.values())[0]
-            
+        with ExitStack() as stack:
+            if resume and not os.path.exists(checkpoint_path(resume)):
+                raise ValueError(f"No checkpoints found for run {resume}")
+            if checkpointed:
+                graph = build_graph(checkpointer=stack.enter_context(run_checkpointer(run_id)))
+                config = resume_config(graph, run_id, node, edits) if resume else run_config(run_id)
+                graph_input = None if resume else {"user_input": user_input, "run_id": run_id}
+            else:
+                graph, config, graph_input = get_graph(), None, {"user_input": user_input}
+
+            # Stream the graph execution to show intermediate steps. Branches
+            # (e.g. chat running alongside interpret) report separately, so the
+            # updates are merged rather than taking the last one.
+            step = 0
+            for chunk in graph.stream(graph_input, config):
+                for node_name, update in chunk.items():
+                    step += 1
+                    print(f"Step {step}: {node_name} completed.")
+                    if node_name == "chat" and update.get("ack"):
+                        print(f"  {update['ack']}")
+                    final_state.update(update or {})
+
+            # A resumed run only streams the nodes it re-ran
+            if checkpointed:
+                final_state = dict(graph.get_state(run_config(run_id)).values)
+
         print("-" * 30)
         print("Simulation complete!")
 
     except Exception as e:
         error_message = f"An error occurred during the simulation:\n\n```\n{traceback.format_exc()}\n```"
         print(f"--- ERROR TRACEBACK ---\n{traceback.format_exc()}\n-----------------------")
+        if checkpointed:
+            print(f"Resume with: python cli_app.py --resume {run_id}")
         return {"response": error_message, "gif": None}
     
     return final_state
 
 
+# --- Batch Mode ---
+
+def batch_stages() -> list:
+    """The pipeline's nodes, in the order they were added (chat first, summarise last)."""
+    return [name for name in get_graph(use_async=True).nodes if not name.startswith("__")]
+
+
+def load_requests(path: str) -> list:
+    """
+    Read batch requests from a JSONL or CSV file.
+
+    JSONL lines may be plain strings or objects with a 'query' (or
+    'user_input') field and an optional 'id'. CSV files need a header with a
+    'query' (or 'user_input') column; otherwise the first column is used.
+    """
+    requests = []
+    with open(path, newline="") as f:
+        if path.lower().endswith(".csv"):
+            reader = csv.DictReader(f)
+            column = next((c for c in ("query", "user_input") if c in reader.fieldnames), reader.fieldnames[0])
+            rows = [(row.get("id"), row[column]) for row in reader]
+        else:
+            rows = []
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if isinstance(item, str):
+                    rows.append((None, item))
+                else:
+                    rows.append((item.get("id"), item.get("query", item.get("user_input", ""))))
+
+    for index, (request_id, query) in enumerate(rows):
+        if query and query.strip():
+            requests.append({"id": request_id or str(index + 1), "query": query.strip()})
+    return requests
+
+
+def _dedup_key(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def _has_octave_error(stderr: str) -> bool:
+    return stderr.startswith("TimeoutExpired") or any(
+        line.lstrip().lower().startswith("error") for line in stderr.splitlines()
+    )
+
+
+def _percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+async def _run_batch_request(graph, request: dict, slots: asyncio.Semaphore) -> dict:
+    """Run one request through the async graph, timing each stage."""
+    from pipeline import chat_mode
+
+    async with slots:
+        state = {}
+        latency = {}
+        # A stage's latency runs from the completion of the previous stage
+        # on the critical path; a parallel chat branch starts with the run.
+        chat_on_path = chat_mode() == "serial"
+        started = last = time.perf_counter()
+        try:
+            async for chunk in graph.astream({"user_input": request["query"]}):
+                now = time.perf_counter()
+                for node_name, update in chunk.items():
+                    off_path = node_name == "chat" and not chat_on_path
+                    # Nodes that run again (preflight/execute/repair in a
+                    # repair loop) accumulate their time
+                    latency[node_name] = latency.get(node_name, 0) + now - (started if off_path else last)
+                    state.update(update or {})
+                    if not off_path:
+                        last = now
+            status = "octave_error" if _has_octave_error(state.get("stderr", "")) else "ok"
+            error = None
+        except Exception as e:
+            status = "failed"
+            error = f"{type(e).__name__}: {e}"
+
+    run_dir = state.get("run_dir")
+    return {
+        "id": request["id"],
+        "query": request["query"],
+        "status": status,
+        "error": error,
+        "spec": state.get("spec"),
+        "script_path": os.path.join(run_dir, "script.m") if run_dir else None,
+        "gif_path": state.get("gif"),
+        "latency": latency,
+        "total_seconds": time.perf_counter() - started,
+    }
+
+
+async def run_batch(requests: list, output_path: str, jobs: int) -> list:
+    """
+    Run many requests concurrently, writing one JSON result per line.
+
+    Identical requests (ignoring case and whitespace) run once; the
+    duplicates are written with the same result and a 'duplicate_of' field.
+    """
+    graph = get_graph(use_async=True)
+    slots = asyncio.Semaphore(jobs)
+
+    unique = {}
+    for request in requests:
+        unique.setdefault(_dedup_key(request["query"]), request)
+
+    results = []
+    with open(output_path, "w") as out:
+        tasks = [asyncio.create_task(_run_batch_request(graph, r, slots)) for r in unique.values()]
+        for task in asyncio.as_completed(tasks):
+            result = await task
+            results.append(result)
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            print(f"[{len(results)}/{len(tasks)}] {result['id']}: {result['status']}")
+
+        by_key = {_dedup_key(r["query"]): r for r in results}
+        for request in requests:
+            original = by_key[_dedup_key(request["query"])]
+            if original["id"] != request["id"]:
+                duplicate = dict(original, id=request["id"], query=request["query"], duplicate_of=original["id"])
+                out.write(json.dumps(duplicate) + "\n")
+    return results
+
+
+def print_batch_report(results: list, total_requests: int, elapsed: float) -> None:
+    statuses = {}
+    for result in results:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+
+    print("\n--- Batch Report ---")
+    print(f"Requests: {total_requests} ({len(results)} unique, {total_requests - len(results)} duplicates)")
+    print("Status: " + ", ".join(f"{k}={v}" for k, v in sorted(statuses.items())))
+    print(f"Elapsed: {elapsed:.1f} s  Throughput: {len(results) / elapsed if elapsed else 0:.2f} runs/s")
+    print(f"{'stage':<10} {'n':>5} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    for stage in batch_stages() + ["total"]:
+        if stage == "total":
+            values = [r["total_seconds"] for r in results]
+        else:
+            values = [r["latency"][stage] for r in results if stage in r["latency"]]
+        if values:
+            print(f"{stage:<10} {len(values):>5} {_percentile(values, 50):>7.2f}s {_percentile(values, 90):>7.2f}s "
+                  f"{_percentile(values, 99):>7.2f}s {max(values):>7.2f}s")
+
+    # Codegen calls served by templates, and the tasks that went to the LLM
+    from tools.templates import get_template_registry
+    template_stats = get_template_registry().stats()
+    if template_stats:
+        hits = sum(row.get("hit", 0) for row in template_stats)
+        print(f"Templates: {hits}/{sum(row['lookups'] for row in template_stats)} scripts rendered without the LLM")
+        fallbacks = [f"{row['task']} ({row['lookups'] - row.get('hit', 0)})"
+                     for row in template_stats[:5] if row["lookups"] > row.get("hit", 0)]
+        if fallbacks:
+            print("LLM fallbacks by task: " + ", ".join(fallbacks))
+    print("--------------------")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run an Octave simulation agent from the command line.")
-    parser.add_argument("query", type=str, help="The natural language request for the Octave simulation.")
-    
+    parser.add_argument("query", type=str, nargs="?", help="The natural language request for the Octave simulation.")
+    parser.add_argument("--batch", metavar="FILE", help="Run every request in a JSONL or CSV file instead of a single query.")
+    parser.add_argument("--output", metavar="FILE", default="batch_results.jsonl", help="Where batch results are written (JSONL).")
+    parser.add_argument("--jobs", type=int, default=32, help="Batch requests in flight at once.")
+    parser.add_argument("--llm-concurrency", type=int, help="Concurrent LLM calls in batch mode (LLM_CONCURRENCY).")
+    parser.add_argument("--octave-concurrency", type=int, help="Concurrent Octave runs in batch mode (OCTAVE_CONCURRENCY).")
+    parser.add_argument("--metrics-file", metavar="FILE", help="Write Prometheus-format metrics for this invocation to FILE.")
+    parser.add_argument("--resume", metavar="RUN_ID", help="Continue a checkpointed run from the node that failed (or --from NODE).")
+    parser.add_argument("--from", dest="from_node", metavar="NODE", help="With --resume, re-run this node and everything after it (e.g. codegen, execute, summarise).")
+    parser.add_argument("--script", metavar="FILE", help="With --resume, replace the run's script with FILE and re-run from preflight.")
+    parser.add_argument("--update", metavar="JSON", help="With --resume, a JSON object of state keys to overwrite first.")
+
     args = parser.parse_args()
+    if not args.query and not args.batch and not args.resume:
+        parser.error("either a query, --batch FILE or --resume RUN_ID is required")
+    if (args.from_node or args.script or args.update) and not args.resume:
+        parser.error("--from, --script and --update need --resume RUN_ID")
 
     # Ensure the directory for runs exists
     os.makedirs("test_runs", exist_ok=True)
 
-    final_results = run_cli_simulation(args.query)
+    if args.batch:
+        if args.llm_concurrency:
+            os.environ["LLM_CONCURRENCY"] = str(args.llm_concurrency)
+        if args.octave_concurrency:
+            os.environ["OCTAVE_CONCURRENCY"] = str(args.octave_concurrency)
+        # Long batches enforce the test_runs/ quota as they go
+        from tools.run_catalog import get_janitor
+        get_janitor().start()
+        batch_requests = load_requests(args.batch)
+        batch_start = time.perf_counter()
+        batch_results = asyncio.run(run_batch(batch_requests, args.output, args.jobs))
+        print_batch_report(batch_results, len(batch_requests), time.perf_counter() - batch_start)
+        print(f"Results written to {args.output}")
+    else:
+        edits = json.loads(args.update) if args.update else {}
+        if args.script:
+            with open(args.script) as f:
+                # A fresh script gets a fresh repair budget
+                edits.update(script=f.read(), repair_attempts=0, repair_error=None, pending_repair=None)
+        from_node = args.from_node or ("preflight" if args.script else None)
+        final_results = run_cli_simulation(args.query, resume=args.resume, node=from_node, edits=edits)
 
-    print("\n--- Final Results ---")
-    response_summary = final_results.get("response", "No summary generated.")
-    gif_output_path = final_results.get("gif", None)
+        print("\n--- Final Results ---")
+        response_summary = final_results.get("response", "No summary generated.")
+        gif_output_path = final_results.get("gif", None)
 
-    print(f"Summary:\n{response_summary}")
+        print(f"Summary:\n{response_summary}")
     
-    if gif_output_path and os.path.exists(gif_output_path):
-        print(f"GIF Generated: {gif_output_path}")
-    elif gif_output_path:
-        print(f"GIF Path was set to {gif_output_path}, but the file does not exist.")
-    else:
-        print("No GIF was generated.")
+        if gif_output_path and os.path.exists(gif_output_path):
+            print(f"GIF Generated: {gif_output_path}")
+        elif gif_output_path:
+            print(f"GIF Path was set to {gif_output_path}, but the file does not exist.")
+        else:
+            print("No GIF was generated.")
+
+        for result in final_results.get("sweep_results") or []:
+            print(f"  {sweep_label(result['params'])}: {result['gif'] or result['run_dir']}")
+
+        trace_path = os.path.join(final_results.get("run_dir") or "", TRACE_FILE)
+        if final_results.get("run_dir") and os.path.exists(trace_path):
+            print(f"Stage timings: {trace_path}")
+        if final_results.get("run_id"):
+            print(f"Run id (for --resume): {final_results['run_id']}")
+
+        print("---------------------")
 
-    print("---------------------") 
\ No newline at end of file
+    if args.metrics_file:
+        registry.write(args.metrics_file)
+        print(f"Metrics written to {args.metrics_file}") 
\ No newline at end of file
@@ -1,54 +1,66 @@
 # In gradio_app.py
 import os
+import asyncio
+import sqlite3
 import traceback
 from dotenv import load_dotenv
 import gradio as gr
-from langgraph.graph import StateGraph, START, END
-from typing_extensions import TypedDict
-
-# Import your agent functions
-from agents.chat_agent import chat_agent
-from agents.interpreter import interpret_spec
-from agents.codegen import codegen_agent
-from agents.executor import executor_agent
-from agents.summariser import summariser_agent
+from pipeline import build_graph
+from tools.octave_pool import get_pool
+from tools.metrics import start_metrics_server
+from tools.run_catalog import get_catalog, get_janitor
+from tools.job_queue import get_job_queue, QueueFull, LLM_LANE, FINAL_STATUSES, poll_interval, max_queued
 
 # Load environment variables (GOOGLE_API_KEY, etc.)
 load_dotenv()
 
-# Define the state for the graph
-class SimulationState(TypedDict, total=False):
-    user_input: str
-    ack: str
-    forwarded: str
-    history: list
-    spec: dict
-    script: str
-    stdout: str
-    stderr: str
-    frames: list
-    gif: str
-    response: str
+# With JOB_QUEUE=1, requests are submitted to the job queue and run by the
+# worker service (python worker.py) instead of inside this process
+USE_JOB_QUEUE = os.getenv("JOB_QUEUE", "0") == "1"
 
 # --- Build and Compile the LangGraph Pipeline ---
-graph = StateGraph(SimulationState)
-graph.add_node("chat", chat_agent)
-graph.add_node("interpret", interpret_spec)
-graph.add_node("codegen", codegen_agent)
-graph.add_node("execute", executor_agent)
-graph.add_node("summarise", summariser_agent)
+# The async agent variants let concurrent sessions share the event loop
+# instead of each blocking a worker thread
+compiled_graph = None if USE_JOB_QUEUE else build_graph(use_async=True)
+
+# Runs shown in a session are protected from the janitor for this long at
+# most; the pin is released earlier when the session ends
+RUN_PIN_TTL = float(os.getenv("RUN_PIN_TTL", str(6 * 3600)))
+
+GIF_LABEL = "Simulation Output (GIF)"
+
+STEPS = {
+    "interpret": "Interpreting request...",
+    "codegen": "Generating Octave script...",
+    "preflight": "Checking script...",
+    "execute": "Running simulation...",
+    "repair": "Repairing script...",
+    "digest": "Condensing output...",
+    "summarise": "Creating summary..."
+}
 
-graph.add_edge(START, "chat")
-graph.add_edge("chat", "interpret")
-graph.add_edge("interpret", "codegen")
-graph.add_edge("codegen", "execute")
-graph.add_edge("execute", "summarise")
-graph.add_edge("summarise", END)
 
-compiled_graph = graph.compile()
+def pin_run(request: gr.Request, run_dir: str) -> None:
+    """Keep the run a session is displaying from being evicted."""
+    if request is None or not request.session_hash:
+        return
+    try:
+        get_catalog().pin(os.path.basename(run_dir), request.session_hash, RUN_PIN_TTL)
+    except sqlite3.Error as e:
+        print(f"Error pinning run: {e}")
+
+
+def release_session(request: gr.Request) -> None:
+    """Release a session's pinned run when its page is closed."""
+    if request is None or not request.session_hash:
+        return
+    try:
+        get_catalog().release(request.session_hash)
+    except sqlite3.Error as e:
+        print(f"Error releasing session runs: {e}")
 
 
-def run_simulation(user_input: str, progress=gr.Progress(track_tqdm=True)):
+async def run_simulation(user_input: str, request: gr.Request, progress=gr.Progress(track_tqdm=True)):
     """
     Runs the full agentic pipeline, yielding UI updates for a responsive experience.
     """
@@ -56,27 +68,57 @@ def run_simulation(user_input: str, progress=gr.Progress(track_tqdm=True)):
     yield {
         results_group: gr.update(visible=True),
         output_text: gr.update(value="Starting simulation...", visible=True),
-        output_image: gr.update(value=None, visible=False)
+        output_image: gr.update(value=None, visible=False, label=GIF_LABEL)
     }
 
-    final_state = None
+    if USE_JOB_QUEUE:
+        async for update in run_queued_simulation(user_input, request, progress):
+            yield update
+        return
+
+    final_state = {}
     try:
-        steps = {
-            "interpret": "Interpreting request...",
-            "codegen": "Generating Octave script...",
-            "execute": "Running simulation...",
-            "summarise": "Creating summary..."
-        }
-        
-        # Stream the graph execution
-        for chunk in compiled_graph.stream({"user_input": user_input}):
+        summary_tokens = []
+        gif_shown = False
+
+        # Stream the graph execution: node updates, the summariser's tokens
+        # and live frame previews from the executor
+        async for mode, payload in compiled_graph.astream({"user_input": user_input},
+                                                          stream_mode=["updates", "messages", "custom"]):
+            if mode == "custom":
+                if payload.get("type") == "frame" and not gif_shown:
+                    yield {output_image: gr.update(
+                        value=payload["frame"], visible=True,
+                        label=f"Live preview: frame {payload['count']} ({payload['fps']:.1f} fps)")}
+                continue
+
+            if mode == "messages":
+                message, metadata = payload
+                if metadata.get("langgraph_node") == "summarise" and isinstance(message.content, str):
+                    summary_tokens.append(message.content)
+                    yield {output_text: gr.update(value="".join(summary_tokens), visible=True)}
+                continue
+
             # The key of the chunk is the name of the node that just finished
-            node_name = list(chunk.keys())[0]
-            if node_name in steps:
-                progress(list(steps.keys()).index(node_name) / len(steps), desc=steps[node_name])
-            
-            # The final result is the last chunk yielded from the graph
-            final_state = list(chunk.values())[0]
+            for node_name, update in payload.items():
+                if node_name in STEPS:
+                    progress(list(STEPS.keys()).index(node_name) / len(STEPS), desc=STEPS[node_name])
+
+                # The chat acknowledgement runs alongside interpretation;
+                # show it as soon as it arrives
+                if node_name == "chat" and update.get("ack"):
+                    yield {output_text: gr.update(value=f"{update['ack']}\n\nStarting simulation...", visible=True)}
+
+                if node_name == "execute" and update.get("run_dir"):
+                    pin_run(request, update["run_dir"])
+
+                # Show the GIF as soon as it exists instead of after the summary
+                if node_name == "execute" and update.get("gif") and os.path.exists(update["gif"]):
+                    gif_shown = True
+                    yield {output_image: gr.update(value=update["gif"], visible=True, label=GIF_LABEL)}
+
+                # Branches report separately, so merge every update
+                final_state.update(update or {})
 
         progress(1.0, desc="Done!")
 
@@ -95,7 +137,7 @@ def run_simulation(user_input: str, progress=gr.Progress(track_tqdm=True)):
         # 4. Yield the final results
         yield {
             output_text: gr.update(value=summary, visible=True),
-            output_image: gr.update(value=gif_path if display_gif else None, visible=display_gif)
+            output_image: gr.update(value=gif_path if display_gif else None, visible=display_gif, label=GIF_LABEL)
         }
 
     except Exception as e:
@@ -107,6 +149,76 @@ def run_simulation(user_input: str, progress=gr.Progress(track_tqdm=True)):
         }
 
 
+async def run_queued_simulation(user_input: str, request: gr.Request, progress):
+    """
+    Submit the request to the job queue and poll the job, yielding the same
+    UI updates as the in-process pipeline. The job is cancelled if the
+    session cancels or leaves while it is still running.
+    """
+    queue = get_job_queue()
+    try:
+        job_id = await asyncio.to_thread(queue.submit, LLM_LANE, {"user_input": user_input}, None, max_queued())
+    except QueueFull as e:
+        yield {output_text: gr.update(value=f"**The simulation queue is full.** {e}", visible=True)}
+        return
+
+    job = None
+    shown = {}
+    try:
+        while True:
+            job = await asyncio.to_thread(queue.get, job_id)
+            if job["status"] in FINAL_STATUSES:
+                break
+            state = job["progress"]
+            if job["status"] == "queued":
+                progress(0, desc=f"Waiting in queue (position {job['position']})...")
+            elif state.get("stage") in STEPS:
+                progress(list(STEPS).index(state["stage"]) / len(STEPS), desc=STEPS[state["stage"]])
+
+            updates = {}
+            text = state.get("summary") or (f"{state['ack']}\n\nStarting simulation..." if state.get("ack") else None)
+            if text and text != shown.get("text"):
+                shown["text"] = text
+                updates[output_text] = gr.update(value=text, visible=True)
+            if state.get("run_dir") and state["run_dir"] != shown.get("run_dir"):
+                shown["run_dir"] = state["run_dir"]
+                pin_run(request, state["run_dir"])
+            if state.get("gif") and state["gif"] != shown.get("gif") and os.path.exists(state["gif"]):
+                shown["gif"] = state["gif"]
+                updates[output_image] = gr.update(value=state["gif"], visible=True, label=GIF_LABEL)
+            elif state.get("preview") and not shown.get("gif") and state.get("frames") != shown.get("frames"):
+                shown["frames"] = state.get("frames")
+                updates[output_image] = gr.update(
+                    value=state["preview"], visible=True,
+                    label=f"Live preview: frame {state['frames']} ({state['fps']:.1f} fps)")
+            if updates:
+                yield updates
+            await asyncio.sleep(poll_interval())
+    finally:
+        if job is None or job["status"] not in FINAL_STATUSES:
+            queue.cancel(job_id)
+
+    progress(1.0, desc="Done!")
+    if job["status"] != "done":
+        if job["status"] == "cancelled":
+            message = "**The simulation was cancelled.**"
+        else:
+            message = f"**An error occurred during the simulation:**\n\n```\n{job['error']}\n```"
+        yield {
+            output_text: gr.update(value=message, visible=True),
+            output_image: gr.update(value=None, visible=False)
+        }
+        return
+
+    result = job["result"]
+    gif_path = result.get("gif")
+    display_gif = bool(gif_path and os.path.exists(gif_path))
+    yield {
+        output_text: gr.update(value=result.get("response") or "No summary was generated.", visible=True),
+        output_image: gr.update(value=gif_path if display_gif else None, visible=display_gif, label=GIF_LABEL)
+    }
+
+
 # --- Create the Gradio Interface ---
 with gr.Blocks(theme=gr.themes.Soft(), css="""
 footer {display: none !important}
@@ -129,22 +241,39 @@ footer {display: none !important}
             lines=2
         )
         run_button = gr.Button("Run Simulation", variant="primary", scale=1)
+        cancel_button = gr.Button("Cancel", variant="stop", scale=1)
     # Results section in a visually distinct box
     with gr.Group(visible=False, elem_classes="results-box") as results_group:
         with gr.Row():
             with gr.Column(scale=1):
                 output_text = gr.Markdown(label="Summary", elem_id="output-summary")
             with gr.Column(scale=1, elem_classes="results-gif"):
-                output_image = gr.Image(type="filepath", label="Simulation Output (GIF)", interactive=False)
-    run_button.click(
+                output_image = gr.Image(type="filepath", label=GIF_LABEL, interactive=False)
+    run_event = run_button.click(
         fn=run_simulation,
         inputs=[input_box],
         outputs=[results_group, output_text, output_image]
     )
+    # Stops the session's run; a queued job is cancelled with it
+    cancel_button.click(fn=None, cancels=[run_event])
+    demo.unload(release_session)
 
 # --- CRUCIAL CHANGE FOR SERVING THE GIF ---
 # Launch the app, allowing Gradio to serve files from the 'test_runs' directory.
 if __name__ == "__main__":
     # Ensure the directory for runs exists
     os.makedirs("test_runs", exist_ok=True)
+    # Bootstrap the Octave workers before the first request arrives (with
+    # the job queue, Octave runs in the worker service instead)
+    pool = None if USE_JOB_QUEUE else get_pool()
+    if pool is not None:
+        pool.warm()
+    # Enforce the test_runs/ disk quota and age limit in the background
+    get_janitor().start()
+    # Prometheus scrape endpoint at http://<host>:METRICS_PORT/metrics
+    if os.getenv("METRICS_PORT"):
+        start_metrics_server(int(os.getenv("METRICS_PORT")))
+    # LLM and Octave work is bounded by LLM_CONCURRENCY / OCTAVE_CONCURRENCY,
+    # so many more sessions than that can be in flight at once.
+    demo.queue(default_concurrency_limit=int(os.getenv("GRADIO_CONCURRENCY", "64")))
     demo.launch(allowed_paths=["test_runs", "public"])
\ No newline at end of file
@@ -0,0 +1,236 @@
+import os
+import operator
+from contextlib import contextmanager, asynccontextmanager
+from typing import Annotated, Optional
+from langgraph.errors import InvalidUpdateError
+from langgraph.graph import StateGraph, START, END
+from typing_extensions import TypedDict
+
+# Import your agent functions
+from agents.chat_agent import chat_agent, achat_agent
+from agents.interpreter import interpret_spec, ainterpret_spec
+from agents.codegen import codegen_agent, acodegen_agent
+from agents.preflight import preflight_agent, route_after_preflight
+from agents.executor import executor_agent, aexecutor_agent
+from agents.repair import repair_agent, arepair_agent, route_after_execute, route_after_repair
+from agents.digest import digest_agent
+from agents.summariser import summariser_agent, asummariser_agent
+from tools.tracing import traced_node
+from tools.run_catalog import RUNS_ROOT
+
+# Define the state for the graph
+class SimulationState(TypedDict, total=False):
+    user_input: str
+    # Names the run's checkpoints and first run directory (see run_config)
+    run_id: str
+    ack: str
+    forwarded: str
+    history: list
+    spec: dict
+    script: str
+    # Rewrites and warnings of the static script check (see agents.preflight)
+    preflight: list
+    preflight_error: str
+    # Patches applied to failing scripts (see agents.repair)
+    repair_attempts: int
+    repairs: list
+    repair_error: str
+    # The last patch, cached once the patched script runs cleanly
+    pending_repair: dict
+    run_dir: str
+    stdout: str
+    stderr: str
+    frames: list
+    gif: str
+    # GIF size, encode time and extra formats (see agents.executor)
+    animation: dict
+    # Per-combination results of a parameter sweep (see agents.executor)
+    sweep_results: list
+    # Bounded views of stdout/stderr for the summariser (see agents.digest)
+    stdout_digest: str
+    stderr_digest: str
+    response: str
+    exec_cache: bool
+    # Timing spans appended by every node (see tools.tracing)
+    trace: Annotated[list, operator.add]
+
+
+CHAT_MODES = ("parallel", "serial", "off")
+
+
+def chat_mode() -> str:
+    """
+    How the chat acknowledgement is scheduled (CHAT_MODE):
+      - 'parallel' (default): chat runs alongside interpret and ends on its own
+        branch, so its LLM round-trip is off the critical path.
+      - 'serial': chat runs before interpret, as in the original pipeline.
+      - 'off': no acknowledgement is generated.
+    """
+    mode = os.getenv("CHAT_MODE", "parallel")
+    if mode not in CHAT_MODES:
+        raise ValueError(f"CHAT_MODE must be one of {CHAT_MODES}, got {mode!r}")
+    return mode
+
+
+def build_graph(use_async: bool = False, execute=None, checkpointer=None):
+    """
+    Build and compile the LangGraph pipeline.
+
+    Args:
+        use_async: Register the async agent variants. The compiled graph must
+            then be driven with `astream`/`ainvoke`.
+        execute: Node function to use instead of the executor agent (e.g.
+            worker.queued_execute, which runs the stage on another worker).
+        checkpointer: Saves the state after every node (see run_checkpointer);
+            the graph must then be run with a run_config.
+
+    Every node is wrapped with tools.tracing.traced_node, so runs record
+    per-stage spans in the 'trace' key and in <run_dir>/trace.json.
+    """
+    mode = chat_mode()
+    graph = StateGraph(SimulationState)
+
+    def add_node(name, sync_fn, async_fn):
+        graph.add_node(name, traced_node(name, async_fn if use_async else sync_fn))
+
+    if mode != "off":
+        add_node("chat", chat_agent, achat_agent)
+    add_node("interpret", interpret_spec, ainterpret_spec)
+    add_node("codegen", codegen_agent, acodegen_agent)
+    # Pure CPU work on the script; LangGraph runs it in a thread when async
+    add_node("preflight", preflight_agent, preflight_agent)
+    add_node("execute", execute or executor_agent, execute or aexecutor_agent)
+    add_node("repair", repair_agent, arepair_agent)
+    add_node("digest", digest_agent, digest_agent)
+    add_node("summarise", summariser_agent, asummariser_agent)
+
+    if mode == "serial":
+        graph.add_edge(START, "chat")
+        graph.add_edge("chat", "interpret")
+    else:
+        # interpret only needs user_input, so it starts immediately. In
+        # parallel mode the two branches write disjoint keys (ack/forwarded/
+        # history vs spec), so their updates merge without conflicts.
+        graph.add_edge(START, "interpret")
+        if mode == "parallel":
+            graph.add_edge(START, "chat")
+            graph.add_edge("chat", END)
+    graph.add_edge("interpret", "codegen")
+    graph.add_edge("codegen", "preflight")
+    # A script rejected by the static check is not worth an Octave run
+    graph.add_conditional_edges("preflight", route_after_preflight, ["execute", "repair", "digest"])
+    # Failed runs are patched and re-run, up to REPAIR_MAX_ATTEMPTS times,
+    # instead of regenerating the script
+    graph.add_conditional_edges("execute", route_after_execute, ["repair", "digest"])
+    graph.add_conditional_edges("repair", route_after_repair, ["preflight", "digest"])
+    graph.add_edge("digest", "summarise")
+    graph.add_edge("summarise", END)
+
+    return graph.compile(checkpointer=checkpointer)
+
+
+def build_execute_graph():
+    """
+    The execute node alone, as an async graph: how job workers run the
+    execute stage of a pipeline that runs elsewhere (see worker.py). Frame
+    previews are streamed as in the full pipeline.
+    """
+    graph = StateGraph(SimulationState)
+    graph.add_node("execute", traced_node("execute", aexecutor_agent))
+    graph.add_edge(START, "execute")
+    graph.add_edge("execute", END)
+    return graph.compile()
+
+
+# --- Checkpoints ---
+
+CHECKPOINT_FILE = "checkpoints.sqlite3"
+
+
+def checkpoints_enabled() -> bool:
+    """Whether single runs save their state after every node (CHECKPOINTS)."""
+    return os.getenv("CHECKPOINTS", "1") == "1"
+
+
+def checkpoint_path(run_id: str) -> str:
+    """The run's checkpoint database, in its run directory."""
+    return os.path.join(RUNS_ROOT, run_id, CHECKPOINT_FILE)
+
+
+def run_config(run_id: str) -> dict:
+    """Config that runs (or inspects) a checkpointed graph as run `run_id`."""
+    return {"configurable": {"thread_id": run_id}}
+
+
+@contextmanager
+def run_checkpointer(run_id: str):
+    """SQLite checkpointer for a synchronous graph, stored with the run."""
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    os.makedirs(os.path.dirname(checkpoint_path(run_id)), exist_ok=True)
+    with SqliteSaver.from_conn_string(checkpoint_path(run_id)) as saver:
+        yield saver
+
+
+@asynccontextmanager
+async def arun_checkpointer(run_id: str):
+    """SQLite checkpointer for an async graph, stored with the run."""
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    os.makedirs(os.path.dirname(checkpoint_path(run_id)), exist_ok=True)
+    async with AsyncSqliteSaver.from_conn_string(checkpoint_path(run_id)) as saver:
+        yield saver
+
+
+def resume_config(graph, run_id: str, node: Optional[str] = None, edits: Optional[dict] = None) -> dict:
+    """
+    Config that resumes a checkpointed run when the graph is streamed with no
+    input (graph.stream(None, config)).
+
+    Args:
+        graph: The pipeline, compiled with the run's checkpointer.
+        run_id: The run to resume.
+        node: Re-enter where this node was last about to run, so only it and
+            the nodes downstream of it run again. By default the run
+            continues with the node that was next when it stopped (the one
+            that failed).
+        edits: State keys to overwrite first, e.g. {'script': fixed_script}.
+
+    Returns:
+        The config of the checkpoint to continue from.
+
+    Raises:
+        ValueError: If the run has no checkpoints, never reached `node`, or
+            has completed and no node is given; or if the edits cannot be
+            attributed to a node because the one resumed is reached only
+            through a conditional edge.
+    """
+    config = run_config(run_id)
+    snapshot = graph.get_state(config)
+    if not snapshot.values:
+        raise ValueError(f"No checkpoints found for run {run_id}")
+    if node is not None:
+        snapshot = next((s for s in graph.get_state_history(config) if node in s.next), None)
+        if snapshot is None:
+            raise ValueError(f"Run {run_id} never reached the '{node}' node")
+        # Fork the checkpoint: the copy leaves behind the saved outputs of
+        # the nodes that ran from it, so they run again
+        config = graph.update_state(snapshot.config, None, as_node="__copy__")
+    elif not snapshot.next:
+        raise ValueError(f"Run {run_id} has completed; name a node to re-run it from")
+    else:
+        config = snapshot.config
+    if not edits:
+        return config
+
+    try:
+        return graph.update_state(config, edits)
+    except InvalidUpdateError:
+        # Two nodes wrote last (chat and interpret in parallel); attribute
+        # the edits to the one leading into the node being resumed
+        target = node or snapshot.next[0]
+        source = next((src for src, dst in graph.builder.edges if dst == target), None)
+        if source is None:
+            raise ValueError(f"Cannot tell which node the edits to run {run_id} come from: '{target}' "
+                             f"has no direct predecessor; resume from a node that has one")
+        return graph.update_state(config, edits, as_node=source)
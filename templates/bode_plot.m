@@ -0,0 +1,51 @@
+% Script: bode_plot
+% Generated from the bode_plot template.
+
+% --- Parameters from Spec ---
+num = {{num}};      % Numerator coefficients of H(s), highest power first
+den = {{den}};      % Denominator coefficients of H(s), highest power first
+w_min = {{w_min}};  % Lowest frequency in rad/s
+w_max = {{w_max}};  % Highest frequency in rad/s
+points = {{points}};  % Frequencies evaluated
+want_gif = {{want_gif}};
+raw_frames = {{raw_frames}};
+
+% --- Frequency Response ---
+w = logspace(log10(w_min), log10(w_max), points);
+H = polyval(num, 1i*w) ./ polyval(den, 1i*w);
+mag_db = 20*log10(abs(H));
+phase_deg = unwrap(angle(H)) * 180/pi;
+[peak_db, peak] = max(mag_db);
+printf('Peak gain %.2f dB at %.4g rad/s; phase %.1f to %.1f deg\n', peak_db, w(peak), phase_deg(1), phase_deg(end));
+
+% --- Plotting ---
+mag_limits = [min(mag_db) max(mag_db)] + [-1 1] * max(1, 0.05*(max(mag_db) - min(mag_db)));
+phase_limits = [min(phase_deg) max(phase_deg)] + [-1 1] * max(5, 0.05*(max(phase_deg) - min(phase_deg)));
+figure;
+if want_gif
+  % About 40 frames, each extending the curves to higher frequencies
+  step = max(1, floor(points / 40));
+  stops = step:step:points;
+else
+  stops = points;
+end
+for frame_index = 1:numel(stops)
+  i = stops(frame_index);
+  subplot(2, 1, 1);
+  semilogx(w(1:i), mag_db(1:i));
+  axis([w_min w_max mag_limits]);
+  title('Bode Plot');
+  ylabel('Magnitude (dB)');
+  grid on;
+  subplot(2, 1, 2);
+  semilogx(w(1:i), phase_deg(1:i));
+  axis([w_min w_max phase_limits]);
+  xlabel('Frequency (rad/s)');
+  ylabel('Phase (deg)');
+  grid on;
+  if want_gif && raw_frames
+    octcoder_write_frame(gcf);
+  elseif want_gif
+    print(gcf, sprintf('frame_%03d.png', frame_index), '-dpng', '-r100');
+  end
+end
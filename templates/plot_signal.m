@@ -0,0 +1,63 @@
+% Script: plot_signal
+% Generated from the plot_signal template.
+
+% --- Parameters from Spec ---
+signal = {{signal}};  % Waveform: sine, cosine, square, sawtooth or triangle
+freq = {{freq}};      % Frequency in Hz
+dur = {{dur}};        % Duration in seconds
+fs = {{fs}};          % Sampling rate in Hz (0: chosen from the frequency)
+amp = {{amp}};        % Amplitude
+phase = {{phase}};    % Phase in radians
+want_gif = {{want_gif}};
+raw_frames = {{raw_frames}};
+
+% --- Signal Generation ---
+if fs == 0
+  fs = max(1000, 50*freq);
+end
+t = 0:1/fs:dur;  % Time vector
+cycle = mod(freq*t + phase/(2*pi), 1);  % Position within each period, 0..1
+switch signal
+  case 'sine'
+    x = amp*sin(2*pi*freq*t + phase);
+  case 'cosine'
+    x = amp*cos(2*pi*freq*t + phase);
+  case 'square'
+    x = amp*(2*(cycle < 0.5) - 1);
+  case 'sawtooth'
+    x = amp*(2*cycle - 1);
+  case 'triangle'
+    x = amp*(1 - 4*abs(cycle - 0.5));
+end
+printf('%s wave: %g Hz, %g s at %g Hz, %d samples\n', signal, freq, dur, fs, numel(t));
+
+% --- Plotting ---
+label = sprintf('%s wave: %g Hz', [upper(signal(1)) signal(2:end)], freq);
+limits = [0 max(dur, eps) -1.1*max(abs(amp), eps) 1.1*max(abs(amp), eps)];
+figure;
+if ~want_gif
+  plot(t, x);
+  axis(limits);
+  title(label);
+  xlabel('Time (s)');
+  ylabel('Amplitude');
+  grid on;
+else
+  % About 40 frames, each drawing the signal up to the next time step
+  step = max(1, floor(numel(t) / 40));
+  frame_index = 0;
+  for i = step:step:numel(t)
+    plot(t(1:i), x(1:i));
+    axis(limits);
+    title(label);
+    xlabel('Time (s)');
+    ylabel('Amplitude');
+    grid on;
+    frame_index = frame_index + 1;
+    if raw_frames
+      octcoder_write_frame(gcf);
+    else
+      print(gcf, sprintf('frame_%03d.png', frame_index), '-dpng', '-r100');
+    end
+  end
+end
@@ -0,0 +1,165 @@
+"""
+LLM gateway tests against the local stub Gemini server (benchmarks.stub_gemini),
+through the real Gemini client over REST. No network access or quota needed.
+
+    python -m pytest tests
+
+Run from the repository root.
+"""
+import time
+import asyncio
+import threading
+import pytest
+from typing_extensions import TypedDict
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.prompts import ChatPromptTemplate
+from langgraph.graph import StateGraph, START, END
+from benchmarks.stub_gemini import start_stub
+from tools.llm_gateway import get_gateway
+
+MODEL = "gemini-2.0-flash"
+REPLY = "stub reply"
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """Start a stub server and return a factory for (gateway, stub state)."""
+    servers = []
+
+    def make(latency=0.0, fail_every=0, **env):
+        server, state = start_stub(latency=latency, fail_every=fail_every, reply=REPLY)
+        servers.append(server)
+        monkeypatch.setenv("GOOGLE_API_KEY", "stub")
+        monkeypatch.setenv("GEMINI_API_ENDPOINT", f"http://127.0.0.1:{server.server_port}")
+        monkeypatch.setenv("LLM_BACKOFF_BASE", "0.01")
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        # Bypass the process-wide cache, so every test gets its own limits
+        return get_gateway.__wrapped__(MODEL), state
+
+    yield make
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+class Recorder(BaseCallbackHandler):
+    def __init__(self):
+        self.ends = 0
+
+    def on_llm_end(self, response, **kwargs):
+        self.ends += 1
+
+
+def test_retries_rate_limited_requests(stub):
+    gateway, state = stub(fail_every=2)
+    for i in range(3):
+        assert gateway.invoke(f"prompt {i}").content == REPLY
+    assert state.failures >= 1
+    assert state.requests == 3 + state.failures
+
+
+def test_gives_up_after_max_retries(stub):
+    gateway, state = stub(fail_every=1, LLM_MAX_RETRIES=2)
+    with pytest.raises(Exception):
+        gateway.invoke("prompt")
+    assert state.requests == 3
+
+
+def test_rate_limit_spaces_requests(stub):
+    # 120 requests per minute: a burst of 2, then one every half second
+    gateway, state = stub(LLM_REQUESTS_PER_MINUTE=120)
+    started = time.monotonic()
+    for i in range(5):
+        gateway.invoke(f"prompt {i}")
+    assert time.monotonic() - started >= 1.2
+    assert state.requests == 5
+
+
+def test_coalesces_identical_concurrent_calls(stub):
+    gateway, state = stub(latency=0.3)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(gateway.invoke("same prompt").content))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [REPLY] * 5
+    assert state.requests == 1
+
+
+def test_coalesces_identical_concurrent_async_calls(stub):
+    gateway, state = stub(latency=0.3)
+
+    async def main():
+        return await asyncio.gather(*(gateway.ainvoke("same prompt") for _ in range(5)))
+
+    assert [message.content for message in asyncio.run(main())] == [REPLY] * 5
+    assert state.requests == 1
+
+
+def test_does_not_coalesce_calls_with_callbacks(stub):
+    gateway, state = stub(latency=0.3)
+    recorders = [Recorder() for _ in range(3)]
+    threads = [threading.Thread(target=gateway.invoke, args=("same prompt", {"callbacks": [recorder]}))
+               for recorder in recorders]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [recorder.ends for recorder in recorders] == [1, 1, 1]
+    assert state.requests == 3
+
+
+def test_coalesces_calls_of_graphs_streaming_messages(stub):
+    # As the Gradio app and the job workers stream the pipeline: LangGraph
+    # adds its message handler to the callbacks of every LLM call
+    gateway, state = stub(latency=0.3)
+    chain = ChatPromptTemplate.from_template("Describe {topic}") | gateway
+
+    class State(TypedDict, total=False):
+        topic: str
+        answer: str
+
+    async def answer(state):
+        return {"answer": (await chain.ainvoke({"topic": state["topic"]})).content}
+
+    graph = StateGraph(State)
+    graph.add_node("answer", answer)
+    graph.add_edge(START, "answer")
+    graph.add_edge("answer", END)
+    graph = graph.compile()
+
+    async def stream():
+        # The caller making the request streams tokens; the others get the
+        # whole message at once
+        nodes, text = set(), ""
+        async for message, metadata in graph.astream({"topic": "waves"}, stream_mode="messages"):
+            nodes.add(metadata["langgraph_node"])
+            text += message.content
+        return nodes, text
+
+    async def main():
+        return await asyncio.gather(*(stream() for _ in range(4)))
+
+    assert asyncio.run(main()) == [({"answer"}, REPLY)] * 4
+    assert state.requests == 1
+
+
+def test_cancelled_leader_hands_request_to_followers(stub):
+    gateway, state = stub(latency=0.3)
+
+    async def main():
+        leader = asyncio.create_task(gateway.ainvoke("same prompt"))
+        await asyncio.sleep(0.05)
+        followers = [asyncio.create_task(gateway.ainvoke("same prompt")) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    assert [message.content for message in asyncio.run(main())] == [REPLY] * 3
+    # The cancelled request, then a single re-issued one for all followers
+    assert state.requests == 2
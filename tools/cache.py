@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(*parts: Any) -> str:
+    """
+    Build a stable content hash from JSON-serialisable parts.
+
+    Dicts are canonicalised (sorted keys, compact separators) so that two
+    logically equal specs always produce the same key.
+    """
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def file_hash(path: str) -> str:
+    """Return the sha256 hex digest of a file's contents."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class TieredCache:
+    """
+    A two-tier key/value cache for JSON-serialisable values.
+
+    The first tier is an in-memory LRU; the second is a directory of JSON
+    files that survives restarts. Entries older than `ttl` seconds are
+    treated as misses, and the disk tier is trimmed to `max_disk_entries`
+    by evicting the least recently used files.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 256, max_disk_entries: int = 5000, ttl: Optional[float] = None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_count = None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            record = None
+
+        with self._lock:
+            if record is None or self._expired(record["created"]):
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+            self._remember(key, record["created"], record["value"])
+
+        # Bump the mtime so disk eviction is least-recently-used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return record["value"]
+
+    def set(self, key: str, value: Any) -> None:
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, value)
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        existed = os.path.exists(path)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"created": created, "value": value}, f)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._disk_count is None:
+                self._disk_count = len(self._disk_entries())
+            elif not existed:
+                self._disk_count += 1
+            if self._disk_count > self.max_disk_entries:
+                self._evict_disk()
+
+    def delete(self, key: str) -> None:
+        """Drop an entry from both tiers, if present."""
+        with self._lock:
+            self._memory.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            return
+        with self._lock:
+            if self._disk_count is not None:
+                self._disk_count -= 1
+
+    def _remember(self, key: str, created: float, value: Any) -> None:
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    entries.append(entry)
+        return entries
+
+    def _evict_disk(self) -> None:
+        # Trim to 90% of the bound so eviction does not run on every insert
+        entries = sorted(self._disk_entries(), key=lambda e: e.stat().st_mtime)
+        target = int(self.max_disk_entries * 0.9)
+        excess = entries[:max(0, len(entries) - target)]
+        for entry in excess:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+        self.stats["evictions"] += len(excess)
+        self._disk_count = len(entries) - len(excess)
+        logger.info("Evicted %d entries from %s", len(excess), self.directory)
+
+    def snapshot(self) -> Dict[str, int]:
+        """Return a copy of the hit/miss counters."""
+        with self._lock:
+            return dict(self.stats)
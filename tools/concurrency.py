@@ -0,0 +1,45 @@
+import os
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+
+# One semaphore per event loop and kind; asyncio primitives are loop-bound.
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def llm_concurrency() -> int:
+    """Maximum concurrent LLM calls per process (LLM_CONCURRENCY, default 16)."""
+    return int(os.getenv("LLM_CONCURRENCY", "16"))
+
+
+def octave_concurrency() -> int:
+    """
+    Maximum concurrent Octave executions per process (OCTAVE_CONCURRENCY).
+
+    Defaults to the Octave pool size when pooling is enabled, otherwise to
+    the number of CPU cores.
+    """
+    default = int(os.getenv("OCTAVE_POOL_SIZE", "2")) or os.cpu_count() or 1
+    return int(os.getenv("OCTAVE_CONCURRENCY", str(default)))
+
+
+def _semaphore(kind: str, size: int) -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    per_loop = _semaphores.setdefault(loop, {})
+    if kind not in per_loop:
+        per_loop[kind] = asyncio.Semaphore(size)
+    return per_loop[kind]
+
+
+@asynccontextmanager
+async def llm_slot():
+    """Hold one of the LLM_CONCURRENCY slots for the duration of a call."""
+    async with _semaphore("llm", llm_concurrency()):
+        yield
+
+
+@asynccontextmanager
+async def octave_slot():
+    """Hold one of the OCTAVE_CONCURRENCY slots for the duration of a run."""
+    async with _semaphore("octave", octave_concurrency()):
+        yield
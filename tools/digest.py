@@ -0,0 +1,219 @@
+import os
+import re
+from collections import deque
+from typing import Iterable, Iterator, List, Optional, Tuple
+from tools.exec_limits import STDOUT_LOG, STDERR_LOG
+
+# Same rough estimate as the LLM gateway's token bucket
+CHARS_PER_TOKEN = 4
+
+HEAD_LINES = 20
+TAIL_LINES = 20
+MAX_ERRORS = 20
+MAX_LINE_CHARS = 200
+# Repeated-line groups remembered during a pass; the smallest are dropped
+MAX_GROUPS = 200
+
+_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|[-+]?\b(?:Inf|NaN)\b")
+_ERROR = re.compile(r"^\s*(?:error|warning|parse error)\b|LimitExceeded|TimeoutExpired|PreflightError", re.IGNORECASE)
+
+# Share of the budget per section, in order; unused space carries forward
+_SECTIONS = (("errors", 0.3), ("repeated", 0.3), ("head", 0.2), ("tail", 0.2))
+
+
+class _Group:
+    """A run of consecutive lines with the same shape (text with numbers masked)."""
+
+    def __init__(self, shape: str, first: int, line: str, numbers: List[float]):
+        self.shape = shape
+        self.first = first
+        self.example = line
+        self.count = 1
+        # Per numeric column: [min, max, sum, last]
+        self.columns = [[v, v, v, v] for v in numbers]
+
+    def add(self, numbers: List[float]) -> None:
+        self.count += 1
+        for column, v in zip(self.columns, numbers):
+            column[0] = min(column[0], v)
+            column[1] = max(column[1], v)
+            column[2] += v
+            column[3] = v
+
+    def render(self) -> str:
+        last = self.first + self.count - 1
+        text = f"lines {self.first}-{last} ({self.count}x): {_clip(self.example)}"
+        for i, (low, high, total, final) in enumerate(self.columns, 1):
+            if low == high:
+                continue
+            text += f"\n    col {i}: min={low:.6g} max={high:.6g} mean={total / self.count:.6g} last={final:.6g}"
+        return text
+
+
+def _clip(line: str) -> str:
+    line = line.rstrip()
+    return line if len(line) <= MAX_LINE_CHARS else line[:MAX_LINE_CHARS] + "..."
+
+
+def _numbers(line: str) -> Tuple[str, List[float]]:
+    values = []
+    for match in _NUMBER.finditer(line):
+        try:
+            values.append(float(match.group()))
+        except ValueError:
+            values.append(float("nan"))
+    return _NUMBER.sub("#", line.strip()), values
+
+
+def _collapse(lines: Iterable[Tuple[int, str]]) -> List[str]:
+    """Number lines, folding runs of identical lines into one with a count."""
+    out: List[str] = []
+    previous, repeats = None, 0
+    for number, line in lines:
+        if line == previous:
+            repeats += 1
+            continue
+        if repeats:
+            out[-1] += f"  [x{repeats + 1}]"
+        out.append(f"{number}: {_clip(line)}")
+        previous, repeats = line, 0
+    if repeats:
+        out[-1] += f"  [x{repeats + 1}]"
+    return out
+
+
+def digest(lines: Iterable[str], max_tokens: int, source: Optional[str] = None) -> str:
+    """
+    Condense program output into at most `max_tokens` (estimated) tokens.
+
+    Output that already fits is returned unchanged. Otherwise, in one pass
+    over the lines, the digest keeps: error and warning lines with their
+    line numbers; runs of lines that differ only in their numbers, collapsed
+    with a count and min/max/mean/last statistics per numeric column; and
+    the first and last lines, with identical consecutive lines folded.
+
+    Args:
+        lines: The output, line by line (e.g. an open log file).
+        max_tokens: Hard budget for the returned text.
+        source: Where the full output can be found, for the header.
+    """
+    budget = max_tokens * CHARS_PER_TOKEN
+    raw, raw_fits = [], True
+    total_lines = total_chars = 0
+    head: List[Tuple[int, str]] = []
+    tail = deque(maxlen=TAIL_LINES)
+    errors: List[Tuple[int, str]] = []
+    error_count = 0
+    groups: List[_Group] = []
+    current: Optional[_Group] = None
+
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip("\n")
+        total_lines = number
+        total_chars += len(line) + 1
+        if raw_fits:
+            raw.append(line)
+            raw_fits = total_chars <= budget
+        if number <= HEAD_LINES:
+            head.append((number, line))
+        tail.append((number, line))
+        if _ERROR.search(line):
+            error_count += 1
+            if len(errors) < MAX_ERRORS:
+                errors.append((number, line))
+
+        shape, values = _numbers(line)
+        if current is not None and shape == current.shape:
+            current.add(values)
+            continue
+        if current is not None and current.count > 1:
+            groups.append(current)
+            if len(groups) > 2 * MAX_GROUPS:
+                groups = sorted(groups, key=lambda g: g.count, reverse=True)[:MAX_GROUPS]
+        current = _Group(shape, number, line, values) if shape else None
+    if current is not None and current.count > 1:
+        groups.append(current)
+
+    if raw_fits:
+        return "\n".join(raw)
+
+    header = f"[digest of {total_lines} lines, {total_chars} chars"
+    header += f"; full output in {source}]" if source else "]"
+    sections = {
+        "errors": [f"{n}: {_clip(l)}" for n, l in errors]
+                  + ([f"... {error_count - len(errors)} more error/warning lines"] if error_count > len(errors) else []),
+        "repeated": [g.render() for g in sorted(groups, key=lambda g: g.count, reverse=True)],
+        "head": _collapse(head),
+        "tail": _collapse(t for t in tail if t[0] > HEAD_LINES),
+    }
+
+    out = [header]
+    spare = budget - len(header) - 1
+    available = 0
+    for name, share in _SECTIONS:
+        available += share * spare
+        if not sections[name]:
+            continue
+        title = f"{name}:"
+        if len(title) + 1 > available:
+            continue
+        available -= len(title) + 1
+        out.append(title)
+        for item in sections[name]:
+            item = "  " + item.replace("\n", "\n  ")
+            if len(item) + 1 > available:
+                break
+            out.append(item)
+            available -= len(item) + 1
+    return "\n".join(out)[:budget]
+
+
+def _spilled(text: str, log_path: Optional[str]) -> bool:
+    """Whether `text` was shortened during the run, its full stream spilled to `log_path`."""
+    return bool(log_path) and f"full output in {os.path.basename(log_path)}" in text and os.path.exists(log_path)
+
+
+def _read_lines(text: str, log_path: Optional[str]) -> Iterator[str]:
+    """The full stream: its log when the output was spilled, else the captured text."""
+    if _spilled(text, log_path):
+        with open(log_path, errors="replace") as f:
+            yield from f
+    else:
+        yield from text.split("\n")
+
+
+def _size(text: str, log_path: Optional[str]) -> int:
+    if _spilled(text, log_path):
+        return max(len(text), os.path.getsize(log_path))
+    return len(text)
+
+
+def digest_outputs(stdout: str, stderr: str, run_dir: Optional[str], max_tokens: int) -> Tuple[str, str]:
+    """
+    Digest a run's stdout and stderr within one token budget.
+
+    The full streams stay on disk: output long enough to be spilled during
+    the run is read back from stdout.log/stderr.log, and other output is
+    written there, so the run directory always holds the complete logs.
+    stderr gets what it needs up to half the budget, stdout the rest.
+
+    Returns:
+        (stdout_digest, stderr_digest)
+    """
+    paths = {STDOUT_LOG: None, STDERR_LOG: None}
+    if run_dir and os.path.isdir(run_dir):
+        for name, text in ((STDOUT_LOG, stdout), (STDERR_LOG, stderr)):
+            path = paths[name] = os.path.join(run_dir, name)
+            if text and not os.path.exists(path):
+                try:
+                    with open(path, "w") as f:
+                        f.write(text)
+                except OSError as e:
+                    print(f"Error writing {name}: {e}")
+
+    stderr_tokens = min(max_tokens // 2, _size(stderr, paths[STDERR_LOG]) // CHARS_PER_TOKEN + 1)
+    stdout_tokens = max_tokens - stderr_tokens
+    return (
+        digest(_read_lines(stdout, paths[STDOUT_LOG]), stdout_tokens, paths[STDOUT_LOG] and STDOUT_LOG),
+        digest(_read_lines(stderr, paths[STDERR_LOG]), stderr_tokens, paths[STDERR_LOG] and STDERR_LOG),
+    )
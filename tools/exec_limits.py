@@ -0,0 +1,556 @@
+import os
+import re
+import sys
+import time
+import signal
+import asyncio
+import subprocess
+import threading
+from collections import deque
+from typing import Optional, Tuple
+from tools.frame_channel import RAW_FRAMES_FILE, count_raw_frames
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# How often the watchdog looks at a running script
+POLL_INTERVAL = 0.25
+# Frames are counted less often; listing run_dir is not free
+FRAME_POLL_INTERVAL = 1.0
+# Window over which the output rate is measured
+RATE_WINDOW = 5.0
+
+STDOUT_LOG = "stdout.log"
+STDERR_LOG = "stderr.log"
+
+_FRAME_NAME = re.compile(r"frame_(\d+)\.png$")
+_MB = 1024 * 1024
+
+
+class ExecLimits:
+    """
+    Resource limits for one Octave run. A value of 0 disables that limit.
+
+    Args:
+        cpu_seconds: CPU time (RLIMIT_CPU for one-shot runs; measured by the
+            watchdog for pooled workers).
+        memory_bytes: Address space (RLIMIT_AS).
+        file_bytes: Largest file the script may write (RLIMIT_FSIZE); also
+            caps the spilled stdout/stderr logs.
+        max_frames: Frames a script may produce.
+        output_rate: Bytes per second of stdout+stderr, averaged over a few
+            seconds.
+        stall_seconds: Longest time without output or new frames. Off by
+            default: simulations may compute silently for a long time.
+        buffer_bytes: stdout/stderr kept in memory per stream; the rest is
+            only in the spilled log. Always bounded, so it must be positive.
+    """
+
+    def __init__(self, cpu_seconds: float = 300, memory_bytes: int = 4096 * _MB, file_bytes: int = 256 * _MB,
+                 max_frames: int = 1000, output_rate: float = _MB, stall_seconds: float = 0,
+                 buffer_bytes: int = 64 * 1024):
+        if buffer_bytes <= 0:
+            raise ValueError(f"The output buffer must be a positive number of bytes, got {buffer_bytes}")
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.file_bytes = file_bytes
+        self.max_frames = max_frames
+        self.output_rate = output_rate
+        self.stall_seconds = stall_seconds
+        self.buffer_bytes = buffer_bytes
+
+    def describe(self) -> str:
+        def fmt(value, unit):
+            return f"{value:.15g}{unit}" if value else "off"
+        return (f"cpu={fmt(self.cpu_seconds, 's')} memory={fmt(self.memory_bytes / _MB, 'MB')} "
+                f"file={fmt(self.file_bytes / _MB, 'MB')} frames={fmt(self.max_frames, '')} "
+                f"output={fmt(self.output_rate, 'B/s')} stall={fmt(self.stall_seconds, 's')}")
+
+    def apply(self, cpu: bool = True) -> None:
+        """
+        Set the rlimits on the current process. Used as `preexec_fn`, so it
+        runs in the forked child just before Octave starts.
+        """
+        if resource is None:
+            return
+        if cpu and self.cpu_seconds:
+            # The soft limit sends SIGXCPU; the hard limit a few seconds
+            # later is a SIGKILL in case the signal is handled
+            seconds = int(self.cpu_seconds)
+            resource.setrlimit(resource.RLIMIT_CPU, (seconds, seconds + 5))
+        if self.memory_bytes:
+            resource.setrlimit(resource.RLIMIT_AS, (self.memory_bytes, self.memory_bytes))
+        if self.file_bytes:
+            resource.setrlimit(resource.RLIMIT_FSIZE, (self.file_bytes, self.file_bytes))
+
+    def preexec(self, cpu: bool = True):
+        """A `preexec_fn` for subprocess, or None when rlimits are unsupported."""
+        if resource is None:
+            return None
+        return lambda: self.apply(cpu)
+
+
+def get_limits() -> ExecLimits:
+    """
+    Limits for Octave runs, from environment variables (0 disables a limit):
+      - OCTAVE_CPU_SECONDS: CPU time per run. Default 300.
+      - OCTAVE_MAX_MEMORY_MB: address space. Default 4096.
+      - OCTAVE_MAX_FILE_MB: largest file written, including logs. Default 256.
+      - OCTAVE_MAX_FRAMES: frames per run. Default 1000.
+      - OCTAVE_MAX_OUTPUT_RATE: stdout+stderr bytes per second. Default 1 MiB.
+      - OCTAVE_STALL_SECONDS: time without output or frames. Default 0
+        (off); set it to stop runs that hang silently before the timeout.
+      - OCTAVE_OUTPUT_BUFFER: bytes of each stream kept in memory. Default
+        65536; must be positive (it is not a limit and cannot be disabled).
+    """
+    return ExecLimits(
+        cpu_seconds=float(os.getenv("OCTAVE_CPU_SECONDS", "300")),
+        memory_bytes=int(float(os.getenv("OCTAVE_MAX_MEMORY_MB", "4096")) * _MB),
+        file_bytes=int(float(os.getenv("OCTAVE_MAX_FILE_MB", "256")) * _MB),
+        max_frames=int(os.getenv("OCTAVE_MAX_FRAMES", "1000")),
+        output_rate=float(os.getenv("OCTAVE_MAX_OUTPUT_RATE", str(_MB))),
+        stall_seconds=float(os.getenv("OCTAVE_STALL_SECONDS", "0")),
+        buffer_bytes=int(os.getenv("OCTAVE_OUTPUT_BUFFER", "65536")),
+    )
+
+
+class LimitExceeded(RuntimeError):
+    """A run was stopped for exceeding one of its limits."""
+
+    def __init__(self, limit: str, message: str):
+        super().__init__(message)
+        self.limit = limit
+
+
+class OutputBuffer:
+    """
+    Bounded capture of one output stream.
+
+    Output is kept in memory until it exceeds `capacity`; from then on only
+    the first and last `capacity / 2` bytes are kept, and the full stream is
+    written to `spill_path` (up to `spill_limit` bytes).
+    """
+
+    def __init__(self, capacity: int, spill_path: str, spill_limit: int = 0):
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.spill_limit = spill_limit
+        self.total = 0
+        self._data = bytearray()
+        self._head = None
+        self._tail = bytearray()
+        self._spill = None
+        self._spilled = 0
+
+    def feed(self, data: bytes) -> None:
+        self.total += len(data)
+        if self._head is None:
+            self._data += data
+            if len(self._data) > self.capacity:
+                self._start_spill()
+            return
+        self._write_spill(data)
+        self._tail += data
+        del self._tail[:-(self.capacity - len(self._head))]
+
+    def _start_spill(self) -> None:
+        data, self._data = bytes(self._data), bytearray()
+        try:
+            self._spill = open(self.spill_path, "wb")
+        except OSError:
+            self._spill = None
+        self._write_spill(data)
+        half = self.capacity // 2
+        self._head = data[:half]
+        self._tail = bytearray(data[-(self.capacity - half):])
+
+    def _write_spill(self, data: bytes) -> None:
+        if self._spill is None:
+            return
+        if self.spill_limit:
+            data = data[:max(0, self.spill_limit - self._spilled)]
+        if data:
+            self._spill.write(data)
+            self._spilled += len(data)
+
+    def close(self) -> None:
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    def text(self) -> str:
+        if self._head is None:
+            return self._data.decode(errors="replace")
+        omitted = self.total - len(self._head) - len(self._tail)
+        where = os.path.basename(self.spill_path)
+        if self.spill_limit and self.total > self.spill_limit:
+            where += f", first {self.spill_limit} bytes"
+        return (self._head.decode(errors="replace")
+                + f"\n[... {omitted} bytes omitted; full output in {where} ...]\n"
+                + self._tail.decode(errors="replace"))
+
+
+def _cpu_seconds(pid: int) -> Optional[float]:
+    """User+system CPU time of a live process, from /proc."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    # utime and stime are fields 14 and 15 of the full line
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _status_bytes(pid: int, field: str) -> Optional[int]:
+    """A memory field of a live process' /proc status (e.g. 'VmHWM'), in bytes."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _reset_peak_rss(pid: int) -> bool:
+    """Reset a live process' VmHWM to its current RSS; False where the kernel does not allow it."""
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _maxrss_bytes(usage) -> int:
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+
+class Supervisor:
+    """
+    Watches one Octave run: captures its output into bounded buffers and
+    decides when to stop it early.
+
+    Output is passed in with `feed` (from reader threads or tasks); `check`
+    is called periodically and returns a LimitExceeded once the run should
+    be killed. `result` renders the captured output, with the reason a run
+    was stopped appended to stderr.
+
+    Args:
+        run_dir: The run's directory (frames are counted, logs spilled here).
+        limits: The ExecLimits to enforce.
+        timeout: Wall-clock limit in seconds.
+        cpu_pid: When set, CPU time of this process is checked against
+            `limits.cpu_seconds` (for pooled workers, where RLIMIT_CPU would
+            count the worker's whole lifetime).
+
+    `peak_rss` holds the peak resident memory of the run, in bytes, once
+    known: exact for synchronous one-shot runs (from wait4) and for pooled
+    runs (the worker's high-water mark is reset before the job), otherwise
+    sampled whenever the run is checked.
+    """
+
+    def __init__(self, run_dir: str, limits: ExecLimits, timeout: float, cpu_pid: Optional[int] = None):
+        self.run_dir = run_dir
+        self.limits = limits
+        self.timeout = timeout
+        self.streams = {
+            "stdout": OutputBuffer(limits.buffer_bytes, os.path.join(run_dir, STDOUT_LOG), limits.file_bytes),
+            "stderr": OutputBuffer(limits.buffer_bytes, os.path.join(run_dir, STDERR_LOG), limits.file_bytes),
+        }
+        self.started = time.monotonic()
+        self.frames = 0
+        self._frame_names = set()
+        self._max_frame_index = 0
+        self._next_frame_poll = self.started
+        self._last_progress = self.started
+        self._window = deque()
+        self._window_bytes = 0
+        self.stopped = None
+        self._cpu_pid = None
+        self._cpu_start = None
+        self.peak_rss = None
+        self._memory_pid = None
+        self._memory_field = "VmHWM"
+        self._lock = threading.Lock()
+        if cpu_pid:
+            self.watch_cpu(cpu_pid)
+
+    def watch_cpu(self, pid: int) -> None:
+        """Enforce the CPU limit on `pid` from its current CPU time onwards."""
+        self._cpu_pid = pid
+        self._cpu_start = _cpu_seconds(pid)
+
+    def watch_memory(self, pid: int, reset: bool = False) -> None:
+        """
+        Track the peak resident memory of `pid` in `peak_rss`. With `reset`
+        (for pooled workers, whose high-water mark covers all their earlier
+        jobs) the mark is reset first; where that is not allowed, the
+        current RSS is sampled instead.
+        """
+        self._memory_pid = pid
+        self._memory_field = "VmHWM" if not reset or _reset_peak_rss(pid) else "VmRSS"
+        self.sample_memory()
+
+    def sample_memory(self) -> None:
+        """Fold the watched process' current memory reading into `peak_rss`."""
+        if self._memory_pid is None:
+            return
+        sample = _status_bytes(self._memory_pid, self._memory_field)
+        if sample is not None:
+            self.record_peak_rss(sample)
+
+    def record_peak_rss(self, peak: int) -> None:
+        self.peak_rss = peak if self.peak_rss is None else max(self.peak_rss, peak)
+
+    def feed(self, name: str, data: bytes) -> None:
+        if not data:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self.streams[name].feed(data)
+            self._last_progress = now
+            self._window.append((now, len(data)))
+            self._window_bytes += len(data)
+
+    def _count_frames(self) -> int:
+        # Frames may be deleted by the GIF encoder as soon as they are
+        # encoded, so remember every name seen and the highest index
+        try:
+            with os.scandir(self.run_dir) as entries:
+                for entry in entries:
+                    match = _FRAME_NAME.match(entry.name)
+                    if match and entry.name not in self._frame_names:
+                        self._frame_names.add(entry.name)
+                        self._max_frame_index = max(self._max_frame_index, int(match.group(1)))
+        except OSError:
+            pass
+        raw = count_raw_frames(os.path.join(self.run_dir, RAW_FRAMES_FILE))
+        return max(len(self._frame_names), self._max_frame_index) + raw
+
+    def check(self) -> Optional[LimitExceeded]:
+        """Return the limit the run has exceeded, if any."""
+        now = time.monotonic()
+        limits = self.limits
+
+        if now - self.started > self.timeout:
+            # Reported with the runner's usual timeout message
+            return LimitExceeded("timeout", "")
+        self.sample_memory()
+
+        if now >= self._next_frame_poll:
+            self._next_frame_poll = now + FRAME_POLL_INTERVAL
+            frames = self._count_frames()
+            if frames > self.frames:
+                self.frames = frames
+                self._last_progress = now
+            if limits.max_frames and self.frames > limits.max_frames:
+                return LimitExceeded("frames", f"the script produced more than {limits.max_frames} frames")
+
+        with self._lock:
+            while self._window and self._window[0][0] < now - RATE_WINDOW:
+                self._window_bytes -= self._window.popleft()[1]
+            window_bytes = self._window_bytes
+            last_progress = self._last_progress
+        # Averaged over at least a second, so a short burst is tolerated
+        window = min(RATE_WINDOW, max(1.0, now - self.started))
+        if limits.output_rate and window_bytes > limits.output_rate * window:
+            return LimitExceeded("output_rate", f"the script printed {window_bytes / window:.0f} bytes/s, "
+                                                f"more than the limit of {limits.output_rate:.0f}")
+
+        if limits.stall_seconds and now - last_progress > limits.stall_seconds:
+            return LimitExceeded("stall", f"the script produced no output or frames for {limits.stall_seconds:g} seconds")
+
+        if self._cpu_start is not None and limits.cpu_seconds:
+            used = _cpu_seconds(self._cpu_pid)
+            if used is not None and used - self._cpu_start > limits.cpu_seconds:
+                return LimitExceeded("cpu", f"the script used more than {limits.cpu_seconds:g} seconds of CPU time")
+        return None
+
+    def exit_reason(self, returncode: Optional[int]) -> Optional[LimitExceeded]:
+        """Map a death by an rlimit signal to the limit that caused it."""
+        if returncode == -signal.SIGXCPU:
+            return LimitExceeded("cpu", f"the script used more than {self.limits.cpu_seconds:g} seconds of CPU time")
+        if returncode == -signal.SIGXFSZ:
+            return LimitExceeded("file_size", f"the script wrote a file larger than {self.limits.file_bytes / _MB:g} MB")
+        if returncode == -signal.SIGKILL:
+            # The RLIMIT_CPU hard limit or the kernel's OOM killer
+            return LimitExceeded("killed", "the process was killed (SIGKILL), by the CPU hard limit or for lack of memory")
+        return None
+
+    @property
+    def output_bytes(self) -> Tuple[int, int]:
+        return self.streams["stdout"].total, self.streams["stderr"].total
+
+    def result(self, stopped: Optional[LimitExceeded] = None, timeout_message: str = "") -> Tuple[str, str]:
+        """
+        The captured (stdout, stderr), closing the spilled logs. When the run
+        was stopped, the reason and the active limits are appended to stderr.
+        """
+        self.stopped = stopped
+        with self._lock:
+            for stream in self.streams.values():
+                stream.close()
+            stdout = self.streams["stdout"].text()
+            stderr = self.streams["stderr"].text()
+
+        notes = []
+        if stopped is not None:
+            if stopped.limit == "timeout":
+                notes.append(timeout_message)
+            else:
+                notes.append(f"LimitExceeded ({stopped.limit}): {stopped} and was terminated.")
+        elif self.limits.memory_bytes and "out of memory" in stderr:
+            notes.append(f"MemoryLimit: the script is limited to {self.limits.memory_bytes / _MB:g} MB of address space.")
+        if notes:
+            notes.append(f"Limits: {self.limits.describe()}")
+            stderr = (stderr.rstrip("\n") + "\n" if stderr else "") + "\n".join(notes)
+        return stdout, stderr
+
+
+# --- Running under supervision ---
+
+def kill_group(pid: int) -> None:
+    """SIGKILL a process started with start_new_session, and its children."""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _pump(stream, name: str, supervisor: Supervisor) -> None:
+    for chunk in iter(lambda: stream.read1(65536), b""):
+        supervisor.feed(name, chunk)
+
+
+def _feed_stdin(stream, data: bytes) -> None:
+    try:
+        stream.write(data)
+        stream.close()
+    except (BrokenPipeError, OSError):
+        pass
+
+
+def run_supervised(cmd, input_data: bytes, cwd: str, supervisor: Supervisor) -> Tuple[Optional[LimitExceeded], int]:
+    """
+    Run `cmd` in its own process group under `supervisor`, with the rlimits
+    applied and `input_data` on stdin.
+
+    Returns:
+        (stopped, returncode): the limit the run was stopped for (or that
+        killed it), if any, and the process' exit code.
+
+    Raises:
+        FileNotFoundError: if the command is not installed.
+    """
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        start_new_session=True,
+        preexec_fn=supervisor.limits.preexec(),
+    )
+    threads = [threading.Thread(target=_feed_stdin, args=(proc.stdin, input_data), daemon=True)]
+    threads += [threading.Thread(target=_pump, args=(stream, name, supervisor), daemon=True)
+                for name, stream in (("stdout", proc.stdout), ("stderr", proc.stderr))]
+    for thread in threads:
+        thread.start()
+
+    stopped = None
+    try:
+        while stopped is None and not _wait4(proc, supervisor, POLL_INTERVAL):
+            stopped = supervisor.check()
+    finally:
+        if proc.returncode is None:
+            kill_group(proc.pid)
+            _wait4(proc, supervisor, None)
+        for thread in threads:
+            thread.join(timeout=5)
+    return stopped or supervisor.exit_reason(proc.returncode), proc.returncode
+
+
+def _wait4(proc: subprocess.Popen, supervisor: Supervisor, timeout: Optional[float]) -> bool:
+    """
+    Wait up to `timeout` seconds (None: until it exits) for `proc` to exit,
+    reaping it with wait4 so that the run's own peak memory is known.
+
+    Returns:
+        Whether the process has exited; its returncode is then set.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    delay = 0.0005
+    while True:
+        try:
+            pid, status, usage = os.wait4(proc.pid, 0 if deadline is None else os.WNOHANG)
+        except ChildProcessError:
+            # Reaped elsewhere; Popen reports the exit code
+            return proc.poll() is not None
+        if pid:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            supervisor.record_peak_rss(_maxrss_bytes(usage))
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        # Back off as Popen.wait does
+        delay = min(delay * 2, remaining, 0.05)
+        time.sleep(delay)
+
+
+async def _apump(stream, name: str, supervisor: Supervisor) -> None:
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            return
+        supervisor.feed(name, chunk)
+
+
+async def _afeed_stdin(stream, data: bytes) -> None:
+    try:
+        stream.write(data)
+        await stream.drain()
+        stream.close()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+
+
+async def arun_supervised(cmd, input_data: bytes, cwd: str, supervisor: Supervisor) -> Tuple[Optional[LimitExceeded], int]:
+    """
+    Async variant of run_supervised. The process group is killed if the
+    awaiting task is cancelled.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        start_new_session=True,
+        preexec_fn=supervisor.limits.preexec(),
+    )
+    # asyncio reaps the process itself, so its memory is sampled while it runs
+    supervisor.watch_memory(proc.pid)
+    tasks = [asyncio.ensure_future(_afeed_stdin(proc.stdin, input_data)),
+             asyncio.ensure_future(_apump(proc.stdout, "stdout", supervisor)),
+             asyncio.ensure_future(_apump(proc.stderr, "stderr", supervisor))]
+
+    stopped = None
+    try:
+        while stopped is None:
+            try:
+                await asyncio.wait_for(asyncio.shield(proc.wait()), POLL_INTERVAL)
+                break
+            except asyncio.TimeoutError:
+                stopped = supervisor.check()
+    finally:
+        if proc.returncode is None:
+            kill_group(proc.pid)
+            await proc.wait()
+        await asyncio.wait(tasks, timeout=5)
+    return stopped or supervisor.exit_reason(proc.returncode), proc.returncode
@@ -0,0 +1,60 @@
+import os
+import time
+import struct
+from typing import Callable, Iterator, Optional
+import numpy as np
+
+# Written by tools/octave/octcoder_write_frame.m in the run directory
+RAW_FRAMES_FILE = "frames.rgb"
+
+_HEADER = struct.Struct("<3I")
+
+
+def _read_header(path: str, offset: int, size: int) -> Optional[tuple]:
+    """Return (height, width, channels) of the record at `offset`, if complete."""
+    if size - offset < _HEADER.size:
+        return None
+    with open(path, "rb") as f:
+        f.seek(offset)
+        shape = _HEADER.unpack(f.read(_HEADER.size))
+    if size - offset - _HEADER.size < shape[0] * shape[1] * shape[2]:
+        return None
+    return shape
+
+
+def iter_raw_frames(path: str, is_done: Callable[[], bool] = lambda: True,
+                    poll_interval: float = 0.05) -> Iterator[np.ndarray]:
+    """
+    Yield frames from a raw frame file as HxWxC uint8 arrays.
+
+    Each array is a read-only memory-mapped view of the file, so no pixel
+    data is copied or decoded. While `is_done()` is False the file is
+    tailed and frames are yielded as soon as their record is complete.
+    """
+    offset = 0
+    while True:
+        done = is_done()
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        while True:
+            shape = _read_header(path, offset, size)
+            if shape is None:
+                break
+            yield np.memmap(path, dtype=np.uint8, mode="r", offset=offset + _HEADER.size, shape=shape)
+            offset += _HEADER.size + shape[0] * shape[1] * shape[2]
+        if done:
+            return
+        time.sleep(poll_interval)
+
+
+def count_raw_frames(path: str) -> int:
+    """Count the complete frame records in a raw frame file."""
+    if not os.path.exists(path):
+        return 0
+    size = os.path.getsize(path)
+    offset = count = 0
+    while True:
+        shape = _read_header(path, offset, size)
+        if shape is None:
+            return count
+        offset += _HEADER.size + shape[0] * shape[1] * shape[2]
+        count += 1
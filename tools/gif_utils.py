@@ -1,62 +1,506 @@
 import os
-import imageio
-from typing import List
-from PIL import Image
+import glob
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from PIL import Image, ImageChops, GifImagePlugin
 import numpy as np
 
+Frame = Union[str, np.ndarray, Image.Image]
+
+# Index reserved in the global palette for pixels unchanged since the previous frame
+TRANSPARENT = 255
+# A global-palette pixel is "off" when a channel is further than this from
+# the original; frames with too many such pixels get a local palette instead
+PALETTE_TOLERANCE = 48
+PALETTE_MISS_FRACTION = 0.002
+
+# Formats that can be written alongside the GIF (through imageio)
+EXTRA_FORMATS = ("webp", "mp4")
+
+
+def animation_options() -> Dict[str, Any]:
+    """
+    Encoding options for the executor's animations, from the environment.
+
+    GIF_FRAME_DURATION (0.1 s), GIF_FRAME_STEP (1: keep every frame),
+    GIF_MAX_WIDTH (0: no downscaling), GIF_PALETTE ('global' or 'local'),
+    GIF_OPTIMIZE (1: delta frames with transparency), GIF_DECODE_THREADS
+    (up to 4) and ANIMATION_FORMATS (extra formats, e.g. 'webp,mp4').
+    """
+    formats = [f.strip() for f in os.getenv("ANIMATION_FORMATS", "").split(",") if f.strip() and f.strip() != "gif"]
+    unknown = set(formats) - set(EXTRA_FORMATS)
+    if unknown:
+        raise ValueError(f"ANIMATION_FORMATS may only list {EXTRA_FORMATS}, got {sorted(unknown)}")
+    palette = os.getenv("GIF_PALETTE", "global")
+    if palette not in ("global", "local"):
+        raise ValueError(f"GIF_PALETTE must be 'global' or 'local', got {palette!r}")
+    return {
+        "duration": float(os.getenv("GIF_FRAME_DURATION", "0.1")),
+        "frame_step": max(1, int(os.getenv("GIF_FRAME_STEP", "1"))),
+        "max_width": int(os.getenv("GIF_MAX_WIDTH", "0")),
+        "palette": palette,
+        "optimize": os.getenv("GIF_OPTIMIZE", "1") != "0",
+        "decode_threads": int(os.getenv("GIF_DECODE_THREADS", str(min(4, os.cpu_count() or 1)))),
+        "formats": formats,
+    }
+
+
+# --- Decoding ---
+
+def decode_frame(frame: Frame) -> np.ndarray:
+    """An HxWx3 uint8 array for a frame path, array or PIL image."""
+    if isinstance(frame, str):
+        with Image.open(frame) as img:
+            return np.asarray(img.convert("RGB"))
+    if isinstance(frame, np.ndarray):
+        if frame.ndim == 2:
+            return np.repeat(frame[..., None], 3, axis=2).astype(np.uint8, copy=False)
+        return np.asarray(frame[..., :3], dtype=np.uint8)
+    return np.asarray(frame.convert("RGB"))
+
+
+def _try_decode(frame: Frame) -> Optional[np.ndarray]:
+    try:
+        return decode_frame(frame)
+    except (OSError, ValueError):
+        # Skip frames that can't be read or are invalid
+        return None
+
+
+def decode_ahead(frames: Iterable[Frame], threads: int) -> Iterator[List[Tuple[Frame, Optional[np.ndarray]]]]:
+    """
+    Decode frames in a thread pool, a few frames ahead of the consumer.
+
+    Yields runs of consecutive frames, in order, as soon as they are decoded,
+    as (frame, array) pairs; the array is None for unreadable frames. At most
+    2 * `threads` frames are in flight, so memory use stays bounded.
+    """
+    if threads <= 1:
+        for frame in frames:
+            yield [(frame, _try_decode(frame))]
+        return
+
+    pending = deque()
+
+    def ready():
+        run = []
+        while pending and pending[0][1].done():
+            frame, future = pending.popleft()
+            run.append((frame, future.result()))
+        return run
+
+    with ThreadPoolExecutor(threads, thread_name_prefix="frame-decode") as pool:
+        for frame in frames:
+            pending.append((frame, pool.submit(_try_decode, frame)))
+            if len(pending) >= 2 * threads:
+                pending[0][1].result()
+            run = ready()
+            if run:
+                yield run
+        while pending:
+            pending[0][1].result()
+            yield ready()
+
+
+# --- Encoding ---
+
+class _ImageioWriter:
+    """
+    Animated WebP or MP4 output through imageio (an optional dependency;
+    MP4 also needs its ffmpeg backend). WebP frames are collected and written
+    on close; MP4 frames are streamed to the encoder.
+    """
+
+    def __init__(self, output_path: str, fmt: str, duration: float, loop: int):
+        import imageio.v2 as imageio
+        self.output_path = output_path
+        self.fmt = fmt
+        self.duration_ms = duration * 1000
+        self.loop = loop
+        self._frames = []
+        self._writer = None
+        if fmt == "mp4":
+            # macro_block_size=2: pad to even sizes instead of multiples of 16
+            self._writer = imageio.get_writer(output_path, fps=1 / duration, codec="libx264",
+                                              macro_block_size=2)
+
+    def append(self, rgb: np.ndarray) -> None:
+        if self._writer is not None:
+            self._writer.append_data(rgb)
+        else:
+            self._frames.append(rgb.copy())
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        elif self._frames:
+            import imageio.v3 as iio
+            iio.imwrite(self.output_path, self._frames, duration=self.duration_ms, loop=self.loop)
+            self._frames = []
+
+
+class GifStreamWriter:
+    """
+    Incremental animated-GIF encoder with bounded memory use.
+
+    Frames are padded (or resized) into a preallocated canvas buffer,
+    optionally downscaled as a batch, quantized and written to disk as they
+    arrive. By default every frame shares one global palette, built from the
+    first frame with one index reserved for transparency; a frame whose
+    colours it cannot represent gets its own local palette instead. With
+    `optimize`, only the bounding box of pixels that changed since the
+    previous frame is written, with unchanged pixels transparent, and
+    identical frames extend the previous frame's duration.
+
+    Args:
+        output_path: Path where the output GIF should be saved.
+        duration: Time in seconds between frames in the GIF.
+        canvas_size: (width, height) of the animation, or None to use the
+            size of the first frame.
+        fit: How frames that do not match the canvas are handled. 'pad'
+            places the frame in the top-left corner of a black canvas
+            (cropping any overflow); 'resize' scales it to the canvas.
+        loop: Number of animation loops, 0 meaning forever.
+        palette: 'global' (shared palette) or 'local' (one per frame).
+        optimize: Write inter-frame deltas with transparency.
+        max_width: Downscale by an integer factor (box filter) until the
+            width is at most this; 0 keeps the frame size.
+        formats: Extra formats ('webp', 'mp4') written next to the GIF with
+            the same frames, e.g. output.webp for output.gif.
+    """
+
+    def __init__(self, output_path: str, duration: float = 0.1, canvas_size: Optional[Tuple[int, int]] = None,
+                 fit: str = "pad", loop: int = 0, palette: str = "global", optimize: bool = True,
+                 max_width: int = 0, formats: Sequence[str] = ()):
+        if fit not in ("pad", "resize"):
+            raise ValueError(f"Unknown fit mode: {fit!r}")
+        if palette not in ("global", "local"):
+            raise ValueError(f"Unknown palette mode: {palette!r}")
+        self.output_path = output_path
+        self.duration = duration
+        self.duration_ms = int(round(duration * 1000))
+        self.canvas_size = canvas_size
+        self.fit = fit
+        self.loop = loop
+        self.palette = palette
+        self.optimize = optimize
+        self.max_width = max_width
+        self.formats = list(formats)
+        self.frame_count = 0
+        # Frames actually written (identical frames are merged)
+        self.written_count = 0
+        # Extra outputs that were written, by format
+        self.outputs: Dict[str, str] = {}
+        self._fp = None
+        self._scale = 1
+        self._buffer = None
+        self._global = None
+        self._global_image = None
+        self._previous = None
+        self._pending = None
+        self._extra: Dict[str, _ImageioWriter] = {}
+
+    def _open(self, first: np.ndarray) -> None:
+        width, height = self.canvas_size
+        if self.max_width and width > self.max_width:
+            self._scale = math.ceil(width / self.max_width)
+        out_w, out_h = width // self._scale, height // self._scale
+
+        self._fp = open(self.output_path, "wb")
+        flags = 0
+        if self.palette == "global":
+            self._global = _build_palette(self._downscale(self._fit_batch([first]))[0])
+            self._global_image = Image.new("P", (1, 1))
+            self._global_image.putpalette(self._global.tobytes())
+            # Global colour table of 256 entries
+            flags = 0xF7
+        # Header and logical screen descriptor
+        self._fp.write(b"GIF89a" + _o16(out_w) + _o16(out_h) + bytes([flags, 0, 0]))
+        if self._global is not None:
+            self._fp.write(self._global.tobytes())
+        # NETSCAPE2.0 application extension for looping
+        self._fp.write(b"!\xff\x0bNETSCAPE2.0\x03\x01" + _o16(self.loop) + b"\x00")
+
+        base, _ = os.path.splitext(self.output_path)
+        for fmt in self.formats:
+            try:
+                self._extra[fmt] = _ImageioWriter(f"{base}.{fmt}", fmt, self.duration, self.loop)
+            except (ImportError, ValueError, RuntimeError, OSError) as e:
+                print(f"Error creating {fmt} output: {e}")
+
+    def _fit_batch(self, arrays: List[np.ndarray]) -> np.ndarray:
+        """Copy frames into the preallocated canvas buffer, padding or resizing them."""
+        width, height = self.canvas_size
+        if self._buffer is None or len(self._buffer) < len(arrays):
+            self._buffer = np.zeros((len(arrays), height, width, 3), np.uint8)
+        batch = self._buffer[:len(arrays)]
+        for slot, array in zip(batch, arrays):
+            h, w = array.shape[:2]
+            if (w, h) == (width, height):
+                slot[...] = array
+            elif self.fit == "resize":
+                slot[...] = np.asarray(Image.fromarray(array).resize((width, height)))
+            else:
+                slot[...] = 0
+                slot[:min(h, height), :min(w, width)] = array[:height, :width]
+        return batch
+
+    def _downscale(self, batch: np.ndarray) -> np.ndarray:
+        """Box-filter a batch of frames by the integer scale factor, in one operation."""
+        if self._scale == 1:
+            return batch
+        f = self._scale
+        _, height, width, _ = batch.shape
+        batch = batch[:, :height // f * f, :width // f * f].astype(np.uint16)
+        # Strided sums are much faster than a mean over reshaped block axes
+        rows = sum(batch[:, i::f] for i in range(f))
+        total = sum(rows[:, :, i::f] for i in range(f))
+        return ((total + f * f // 2) // (f * f)).astype(np.uint8)
+
+    def append(self, frame: Frame) -> None:
+        """Encode one frame (a file path, HxWxC uint8 array or PIL image)."""
+        self.append_batch([decode_frame(frame)])
+
+    def append_batch(self, arrays: List[np.ndarray]) -> None:
+        """Encode decoded HxWx3 frames, in order."""
+        if not arrays:
+            return
+        if self._fp is None:
+            if self.canvas_size is None:
+                self.canvas_size = (arrays[0].shape[1], arrays[0].shape[0])
+            self._open(arrays[0])
+        for rgb in self._downscale(self._fit_batch(arrays)):
+            self._encode(rgb)
+            self.frame_count += 1
+
+    def _encode(self, rgb: np.ndarray) -> None:
+        for fmt, writer in list(self._extra.items()):
+            try:
+                writer.append(rgb)
+            except (ValueError, RuntimeError, OSError) as e:
+                print(f"Error writing {fmt} output: {e}")
+                del self._extra[fmt]
+
+        indices, local = self._quantize(rgb)
+        # Within the global palette, equal indices are equal colours
+        if self.optimize and self._previous is not None and local is None:
+            changed = indices != self._previous
+            if not changed.any():
+                # Identical to what is on screen: show the previous frame longer
+                self._pending[1]["duration"] += self.duration_ms
+                return
+            rows, cols = np.flatnonzero(changed.any(axis=1)), np.flatnonzero(changed.any(axis=0))
+            y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+            region = indices[y0:y1, x0:x1].copy()
+            region[~changed[y0:y1, x0:x1]] = TRANSPARENT
+            self._emit(Image.fromarray(region, "P"), (int(x0), int(y0)), transparency=TRANSPARENT)
+        elif local is None:
+            self._emit(Image.fromarray(indices, "P"), (0, 0))
+        else:
+            self._emit(local, (0, 0), include_color_table=True)
+        # A local-palette frame is written whole, and so is the frame after it
+        self._previous = indices if local is None else None
+
+    def _quantize(self, rgb: np.ndarray):
+        """
+        Returns (indices, local): global palette indices, or None and the
+        frame quantized with its own palette when the global palette cannot
+        represent it.
+        """
+        img = Image.fromarray(rgb)
+        if self._global is not None:
+            quantized = img.quantize(palette=self._global_image, dither=Image.Dither.NONE)
+            indices = np.array(quantized)
+            # Entry 255 duplicates entry 0, so it is never needed for colour
+            indices[indices == TRANSPARENT] = 0
+            error = np.asarray(ImageChops.difference(quantized.convert("RGB"), img))
+            # Channels off by more than the tolerance (an upper bound on pixels)
+            if np.count_nonzero(error > PALETTE_TOLERANCE) <= PALETTE_MISS_FRACTION * indices.size:
+                return indices, None
+        return None, img.quantize(256)
+
+    def _emit(self, img: Image.Image, offset: Tuple[int, int], **params) -> None:
+        """Queue a frame; the previous one is written once its duration is final."""
+        self._flush()
+        params = {"duration": self.duration_ms, **params}
+        if self.optimize:
+            params["disposal"] = 1  # keep it on screen for the next delta
+        self._pending = (img, params, offset)
+
+    def _flush(self) -> None:
+        if self._pending is None:
+            return
+        img, params, offset = self._pending
+        for chunk in GifImagePlugin.getdata(img, offset=offset, **params):
+            self._fp.write(chunk)
+        self.written_count += 1
+        self._pending = None
+
+    def close(self) -> None:
+        if self._fp is not None:
+            self._flush()
+            self._fp.write(b";")
+            self._fp.close()
+            self._fp = None
+        for fmt, writer in self._extra.items():
+            try:
+                writer.close()
+                self.outputs[fmt] = writer.output_path
+            except (ValueError, RuntimeError, OSError) as e:
+                print(f"Error writing {fmt} output: {e}")
+        self._extra = {}
+
+    def __enter__(self) -> "GifStreamWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _build_palette(rgb: np.ndarray) -> np.ndarray:
+    """
+    A 256x3 global palette for frames like `rgb`: 255 adaptive colours, and
+    entry 255 (the transparent index) duplicating entry 0.
+    """
+    quantized = Image.fromarray(rgb).quantize(TRANSPARENT, method=Image.Quantize.MEDIANCUT)
+    colours = bytes(quantized.getpalette()[:3 * TRANSPARENT]).ljust(3 * TRANSPARENT, b"\0")
+    palette = np.frombuffer(colours, np.uint8).reshape(TRANSPARENT, 3)
+    return np.vstack([palette, palette[:1]])
+
+
+def _o16(value: int) -> bytes:
+    return int(value).to_bytes(2, "little")
+
+
+def iter_new_frames(run_dir: str, is_done: Callable[[], bool], poll_interval: float = 0.1,
+                    pattern: str = "frame_*.png") -> Iterator[str]:
+    """
+    Yield frame files from `run_dir` as Octave writes them.
+
+    A frame is considered complete once a later frame exists or `is_done()`
+    returns True, so partially written files are never yielded. Frames are
+    yielded in filename order.
+    """
+    seen = set()
+    while True:
+        done = is_done()
+        pending = [p for p in sorted(glob.glob(os.path.join(run_dir, pattern))) if p not in seen]
+        ready = pending if done else pending[:-1]
+        for path in ready:
+            seen.add(path)
+            yield path
+        if done:
+            return
+        time.sleep(poll_interval)
+
+
+def stream_gif(frames: Iterable[Frame], output_path: str, duration: float = 0.1,
+               canvas_size: Optional[Tuple[int, int]] = None, fit: str = "pad",
+               delete_frames: bool = False, frame_step: int = 1, decode_threads: int = 1,
+               **writer_options) -> Dict[str, Any]:
+    """
+    Encode frames into a GIF as they arrive from an iterator.
+
+    Frames are decoded `decode_threads` at a time (see decode_ahead).
+    Unreadable frames are skipped. If no frame could be encoded, no file is
+    left at `output_path`.
+
+    Args:
+        frames: Iterable of frame paths, arrays or PIL images, in order.
+        output_path: Path where the output GIF should be saved.
+        duration: Time in seconds between source frames.
+        canvas_size: Fixed (width, height), or None to use the first frame's.
+        fit: 'pad' (the historical behaviour) or 'resize'.
+        delete_frames: Remove frame files once the GIF has been written.
+        frame_step: Keep every n-th frame; the GIF keeps its playback speed.
+        decode_threads: Threads decoding frames ahead of the encoder.
+        **writer_options: palette, optimize, max_width and formats, as for
+            GifStreamWriter.
+
+    Returns:
+        A dict with 'frames' (frames encoded), 'written' (GIF frames after
+        merging identical ones), 'bytes' (GIF size), 'seconds' (encode
+        time) and 'outputs' (paths of extra formats, by format).
+    """
+    started = time.perf_counter()
+    consumed = []
+
+    def kept(source):
+        for i, frame in enumerate(source):
+            if isinstance(frame, str):
+                consumed.append(frame)
+            if i % frame_step == 0:
+                yield frame
+
+    writer = GifStreamWriter(output_path, duration=duration * frame_step, canvas_size=canvas_size, fit=fit,
+                             **writer_options)
+    try:
+        for run in decode_ahead(kept(frames), decode_threads):
+            writer.append_batch([array for _, array in run if array is not None])
+    finally:
+        writer.close()
+
+    if writer.frame_count == 0 and os.path.exists(output_path):
+        os.remove(output_path)
+
+    if delete_frames:
+        for fp in consumed:
+            try:
+                os.remove(fp)
+            except OSError:
+                pass
+    return {
+        "frames": writer.frame_count,
+        "written": writer.written_count,
+        "bytes": os.path.getsize(output_path) if writer.frame_count else 0,
+        "seconds": time.perf_counter() - started,
+        "outputs": {fmt: {"path": path, "bytes": os.path.getsize(path)}
+                    for fmt, path in writer.outputs.items() if os.path.exists(path)},
+    }
+
+
 def make_gif(frame_paths: List[str], output_path: str, duration: float = 0.1) -> None:
     """
     Create an animated GIF from a list of image file paths, then delete the frames.
 
+    Frames are padded to the largest frame size. Only image headers are read
+    to find that size; frames are then decoded and encoded a few at a time.
+
     Args:
         frame_paths: List of file paths to the PNG frames, in order.
         output_path: Path where the output GIF should be saved.
         duration: Time in seconds between frames in the GIF.
     """
-    frames = []
     max_width = 0
     max_height = 0
-    
-    # Read all frames and find max dimensions
+    valid = []
+
+    # Read frame headers and find max dimensions
     for fp in frame_paths:
         try:
-            img = imageio.imread(fp)
-            frames.append(img)
-            h, w = img.shape[0], img.shape[1]
-            max_height = max(max_height, h)
-            max_width = max(max_width, w)
+            with Image.open(fp) as img:
+                w, h = img.size
         except Exception as e:
             # Skip frames that can't be read or are invalid
             continue
+        valid.append(fp)
+        max_width = max(max_width, w)
+        max_height = max(max_height, h)
 
-    if not frames:
+    if not valid:
         raise ValueError("No valid frames to compile into GIF.")
 
-    # Pad frames to a consistent size
-    padded_frames = []
-    for img_np in frames:
-        # Convert numpy array to PIL Image
-        if img_np.shape[2] == 4: # Check for RGBA
-            img_pil = Image.fromarray(img_np, 'RGBA')
-        else: # Assume RGB
-            img_pil = Image.fromarray(img_np, 'RGB')
-            
-        # Create a new blank image with max dimensions (black background)
-        # Use RGBA if any frame is RGBA, otherwise RGB
-        new_img_pil = Image.new(img_pil.mode, (max_width, max_height), (0, 0, 0, 0) if img_pil.mode == 'RGBA' else (0, 0, 0))
-        
-        # Paste the original image onto the new blank image
-        new_img_pil.paste(img_pil, (0, 0))
-        
-        # Convert back to numpy array
-        padded_frames.append(np.array(new_img_pil))
-
-    # Write out the GIF
-    imageio.mimsave(output_path, padded_frames, format='GIF', duration=duration)
+    threads = min(4, os.cpu_count() or 1)
+    if not stream_gif(valid, output_path, duration=duration, canvas_size=(max_width, max_height), fit="pad",
+                      decode_threads=threads)["frames"]:
+        raise ValueError("No valid frames to compile into GIF.")
 
     # Cleanup PNG frames
     for fp in frame_paths:
         try:
             os.remove(fp)
         except OSError:
-            pass
\ No newline at end of file
+            pass
@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id      TEXT PRIMARY KEY,
+    lane        TEXT NOT NULL,
+    parent_id   TEXT,
+    status      TEXT NOT NULL,
+    payload     TEXT NOT NULL,
+    progress    TEXT NOT NULL DEFAULT '{}',
+    result      TEXT,
+    error       TEXT,
+    cancel      INTEGER NOT NULL DEFAULT 0,
+    worker      TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    created     REAL NOT NULL,
+    started     REAL,
+    finished    REAL,
+    updated     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_lane_status ON jobs (lane, status, created);
+CREATE INDEX IF NOT EXISTS jobs_parent ON jobs (parent_id);
+CREATE INDEX IF NOT EXISTS jobs_worker ON jobs (worker, status);
+"""
+
+# Lanes: whole pipeline runs (LLM-bound, many at once per worker) and their
+# execute stages (CPU-bound, one per worker process)
+LLM_LANE = "llm"
+EXECUTE_LANE = "execute"
+LANES = (LLM_LANE, EXECUTE_LANE)
+
+FINAL_STATUSES = ("done", "failed", "cancelled")
+
+
+class QueueFull(RuntimeError):
+    """Raised by JobQueue.submit when too many jobs are already waiting."""
+
+
+def max_queued() -> int:
+    """Waiting pipeline jobs before new submissions are rejected (JOB_QUEUE_MAX, default 100; 0 disables)."""
+    return int(os.getenv("JOB_QUEUE_MAX", "100"))
+
+
+def lease_seconds() -> float:
+    """How long a job stays claimed without a heartbeat from its worker (JOB_LEASE_SECONDS, default 30)."""
+    return float(os.getenv("JOB_LEASE_SECONDS", "30"))
+
+
+def max_attempts() -> int:
+    """Times a job is claimed before a crashing job is failed (JOB_MAX_ATTEMPTS, default 3)."""
+    return int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+
+def poll_interval() -> float:
+    """Seconds between polls of the queue by workers and the UI (JOB_POLL_INTERVAL, default 0.5)."""
+    return float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+
+
+class JobQueue:
+    """
+    Persistent SQLite job queue shared by the UI and the worker processes.
+
+    A job moves from 'queued' to 'running' when a worker claims it, then to
+    'done', 'failed' or 'cancelled'. A claim is a lease that the worker
+    renews with `heartbeat`; when a worker dies, its jobs are put back in
+    the queue (`recover`, `release`) until they have been tried
+    `max_attempts` times. Progress is a JSON object that workers merge
+    updates into and clients poll with `get`.
+
+    Args:
+        db_path: SQLite database file.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._initialised = False
+        self._init_lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        with self._init_lock:
+            if not self._initialised:
+                os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+                with sqlite3.connect(self.db_path, timeout=30) as conn:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(SCHEMA)
+                self._initialised = True
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- Submitting ---
+
+    def submit(self, lane: str, payload: Dict[str, Any], parent_id: Optional[str] = None, limit: int = 0) -> str:
+        """
+        Queue a job and return its id.
+
+        Raises:
+            QueueFull: if `limit` jobs (0 means no limit) are already waiting
+                in the lane.
+        """
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane: {lane!r}")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            # Count and insert under one write lock, so the limit holds
+            # across concurrent submitters
+            conn.execute("BEGIN IMMEDIATE")
+            if limit:
+                waiting = conn.execute("SELECT COUNT(*) FROM jobs WHERE lane = ? AND status = 'queued'",
+                                       (lane,)).fetchone()[0]
+                if waiting >= limit:
+                    raise QueueFull(f"{waiting} jobs are already waiting (limit {limit}); please try again later")
+            conn.execute(
+                "INSERT INTO jobs (job_id, lane, parent_id, status, payload, created, updated)"
+                " VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, lane, parent_id, json.dumps(payload), now, now),
+            )
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a job and its sub-jobs. Waiting jobs are cancelled at once;
+        running ones are flagged and stopped by their worker. Returns False
+        if the job had already finished.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            ids = [job_id] + [row[0] for row in conn.execute(
+                "SELECT job_id FROM jobs WHERE parent_id = ? AND status IN ('queued', 'running')", (job_id,))]
+            marks = ",".join("?" * len(ids))
+            conn.execute(f"UPDATE jobs SET status = 'cancelled', finished = ?, updated = ?"
+                         f" WHERE job_id IN ({marks}) AND status = 'queued'", (now, now, *ids))
+            flagged = conn.execute(f"UPDATE jobs SET cancel = 1, updated = ?"
+                                   f" WHERE job_id IN ({marks}) AND status = 'running'", (now, *ids)).rowcount
+            status = conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(flagged) or (status is not None and status[0] == "cancelled")
+
+    # --- Working ---
+
+    def claim(self, lane: str, worker: str, lease: float) -> Optional[Dict[str, Any]]:
+        """Take the oldest waiting job of `lane` for `worker`, or None if there is none."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, lease_until = ?,"
+                " started = COALESCE(started, ?), updated = ?"
+                " WHERE job_id = (SELECT job_id FROM jobs WHERE lane = ? AND status = 'queued'"
+                "                 ORDER BY created LIMIT 1)"
+                " RETURNING *",
+                (worker, now + lease, now, now, lane),
+            ).fetchone()
+        return _decode(row) if row else None
+
+    def heartbeat(self, worker: str, lease: float) -> List[str]:
+        """
+        Renew the leases of a worker's running jobs.
+
+        Returns:
+            The ids of those jobs that were asked to cancel.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET lease_until = ? WHERE worker = ? AND status = 'running'",
+                         (now + lease, worker))
+            rows = conn.execute("SELECT job_id FROM jobs WHERE worker = ? AND status = 'running' AND cancel = 1",
+                                (worker,)).fetchall()
+        return [row[0] for row in rows]
+
+    def update_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        """Merge `progress` into the job's progress object (a None value removes the key)."""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET progress = json_patch(progress, ?), updated = ? WHERE job_id = ?",
+                         (json.dumps(progress, default=str), time.time(), job_id))
+
+    def finish(self, job_id: str, worker: str, status: str, result: Optional[Dict[str, Any]] = None,
+               error: Optional[str] = None) -> bool:
+        """
+        Record the outcome of a job held by `worker` ('done', 'failed' or
+        'cancelled'). Returns False if the job was taken from the worker
+        in the meantime (e.g. it was recovered after a missed heartbeat).
+        """
+        if status not in FINAL_STATUSES:
+            raise ValueError(f"Unknown final status: {status!r}")
+        now = time.time()
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, updated = ?, lease_until = NULL"
+                " WHERE job_id = ? AND worker = ? AND status = 'running'",
+                (status, json.dumps(result, default=str) if result is not None else None, error, now, now,
+                 job_id, worker),
+            ).rowcount
+        return bool(updated)
+
+    # --- Recovery ---
+
+    def recover(self) -> Tuple[int, int]:
+        """
+        Put back running jobs whose lease has expired (their worker crashed
+        or hung). Returns (requeued, failed).
+        """
+        return self._requeue("lease_until < ?", (time.time(),))
+
+    def release(self, worker: str) -> Tuple[int, int]:
+        """Put back the running jobs of a worker known to be gone. Returns (requeued, failed)."""
+        return self._requeue("worker = ?", (worker,))
+
+    def _requeue(self, where: str, params: tuple) -> Tuple[int, int]:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(f"SELECT job_id, attempts, cancel FROM jobs WHERE status = 'running' AND {where}",
+                                params).fetchall()
+            requeued = failed = 0
+            for row in rows:
+                if row["cancel"]:
+                    conn.execute("UPDATE jobs SET status = 'cancelled', finished = ?, updated = ? WHERE job_id = ?",
+                                 (now, now, row["job_id"]))
+                    continue
+                if row["attempts"] >= max_attempts():
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished = ?, updated = ? WHERE job_id = ?",
+                        (f"the worker stopped responding ({row['attempts']} attempts)", now, now, row["job_id"]))
+                    failed += 1
+                else:
+                    conn.execute("UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL,"
+                                 " updated = ? WHERE job_id = ?", (now, row["job_id"]))
+                    requeued += 1
+                # A restarted job starts its sub-jobs afresh
+                conn.execute("UPDATE jobs SET status = 'cancelled', finished = ?, updated = ?"
+                             " WHERE parent_id = ? AND status = 'queued'", (now, now, row["job_id"]))
+                conn.execute("UPDATE jobs SET cancel = 1, updated = ? WHERE parent_id = ? AND status = 'running'",
+                             (now, row["job_id"]))
+        return requeued, failed
+
+    def workers(self) -> List[str]:
+        """Workers currently holding running jobs."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT DISTINCT worker FROM jobs WHERE status = 'running'").fetchall()
+        return [row[0] for row in rows]
+
+    def purge(self, max_age: float) -> int:
+        """Delete finished jobs older than `max_age` seconds. Returns the number deleted."""
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished < ?",
+                                (time.time() - max_age,)).rowcount
+
+    # --- Lookup ---
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        A job with its payload, progress and result decoded; waiting jobs
+        also have their 'position' in the queue (1 is next).
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = _decode(row)
+            if job["status"] == "queued":
+                job["position"] = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE lane = ? AND status = 'queued' AND created <= ?",
+                    (job["lane"], job["created"])).fetchone()[0]
+        return job
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Job counts by lane and status."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT lane, status, COUNT(*) FROM jobs GROUP BY lane, status").fetchall()
+        counts = {lane: {} for lane in LANES}
+        for lane, status, count in rows:
+            counts.setdefault(lane, {})[status] = count
+        return counts
+
+
+def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    for key in ("payload", "progress", "result"):
+        if job.get(key) is not None:
+            job[key] = json.loads(job[key])
+    return job
+
+
+_queue: Optional[JobQueue] = None
+_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Return the process-wide job queue (JOB_QUEUE_PATH, default .cache/jobs.sqlite3)."""
+    global _queue
+    with _lock:
+        if _queue is None:
+            _queue = JobQueue(os.getenv("JOB_QUEUE_PATH", os.path.join(".cache", "jobs.sqlite3")))
+        return _queue
@@ -0,0 +1,33 @@
+from pathlib import Path
+
+# Prompt templates ship with the package, so they are found regardless of
+# the working directory the apps are started from.
+PROMPTS_DIR = Path(__file__).resolve().parent.parent / "prompts"
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+
+def prompt_path(name: str) -> Path:
+    """Absolute path of a file in the prompts/ directory."""
+    return PROMPTS_DIR / name
+
+
+def load_prompt(name: str):
+    """Load a prompt template from the prompts/ directory."""
+    # Deferred: importing LangChain costs a noticeable part of start-up
+    from langchain.prompts import PromptTemplate
+    return PromptTemplate.from_file(prompt_path(name))
+
+
+def build_chain(prompt_name: str, model: str = DEFAULT_MODEL):
+    """
+    Compose a prompt template with the shared gateway for a Gemini model.
+
+    Agents call this lazily (on their first request) instead of at import
+    time, so commands that never reach an LLM, such as `--help` or a fully
+    cached run, do not pay for the client libraries or their setup. All
+    chains using the same model share one client, rate limiter and retry
+    policy (see tools.llm_gateway).
+    """
+    from tools.llm_gateway import get_gateway
+    return load_prompt(prompt_name) | get_gateway(model)
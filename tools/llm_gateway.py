@@ -0,0 +1,446 @@
+import os
+import sys
+import time
+import queue
+import random
+import asyncio
+import threading
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterator
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langchain_core.runnables import Runnable, ensure_config
+from langchain_core.runnables.config import get_async_callback_manager_for_config, get_callback_manager_for_config
+from tools.cache import make_key
+from tools.metrics import registry
+
+# HTTP statuses worth retrying: rate limits, overload and transient failures
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Rough characters-per-token ratio used to pre-charge the token bucket
+CHARS_PER_TOKEN = 4
+
+# Result handed to coalesced callers when the call they wait on was
+# cancelled; they re-issue the request instead
+_ABANDONED = object()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by sync and async callers.
+
+    `reserve` takes tokens immediately, letting the balance go negative, and
+    returns how long the caller must wait for its reservation to be covered,
+    so concurrent callers queue up in arrival order.
+
+    Args:
+        rate: Tokens added per second. 0 disables limiting.
+        capacity: Maximum balance (burst size).
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+    def adjust(self, amount: float) -> None:
+        """Return (positive) or charge (negative) tokens after the fact."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def acquire(self, amount: float = 1) -> float:
+        wait = self.reserve(amount)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, amount: float = 1) -> float:
+        wait = self.reserve(amount)
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether an LLM call failure is transient (rate limit, overload, network)."""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int) and code in RETRYABLE_STATUS:
+        return True
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    try:
+        import requests
+        return isinstance(error, (requests.ConnectionError, requests.Timeout))
+    except ImportError:
+        return False
+
+
+def _handlers(config) -> list:
+    callbacks = (config or {}).get("callbacks")
+    if callbacks is None:
+        return []
+    # A list of handlers, or a callback manager passed down by a chain
+    return list(getattr(callbacks, "handlers", callbacks))
+
+
+def _streams_messages(handler) -> bool:
+    # LangGraph attaches this handler to every LLM call of a graph streamed
+    # with stream_mode="messages"; it can only be one once LangGraph is loaded
+    module = sys.modules.get("langgraph.pregel._messages") or sys.modules.get("langgraph.pregel.messages")
+    return module is not None and isinstance(handler, module.StreamMessagesHandler)
+
+
+def has_callbacks(config) -> bool:
+    """
+    Whether a runnable config carries callback handlers (tracers, token
+    counters) other than LangGraph's message streaming, which is fed the
+    shared result of a coalesced call like any other.
+    """
+    return any(not _streams_messages(handler) for handler in _handlers(config))
+
+
+class LLMGateway(Runnable):
+    """
+    A shared front door to one chat model for all agents.
+
+    Every call passes through request and token buckets, is retried with
+    jittered exponential backoff on transient errors, and identical
+    concurrent `invoke`/`ainvoke` calls are coalesced into one request whose
+    result all callers share; each caller's callbacks (e.g. LangGraph's
+    message streaming) see the call as if it had made it. Calls with other
+    callback handlers, such as tracers, are never coalesced. If the caller
+    making the request is cancelled, the ones waiting on it re-issue it.
+    Streaming calls are rate limited and retried until their first chunk
+    arrives.
+
+    Args:
+        model: The chat model (a single instance, so its HTTP/gRPC
+            connections are reused across agents).
+        requests_per_minute / tokens_per_minute: Rate limits, 0 to disable.
+        max_retries: Retries after the first attempt.
+        backoff_base / backoff_max: Backoff bounds in seconds; attempt n
+            sleeps a random time in [0, min(backoff_max, backoff_base * 2**n)].
+        coalesce: Share results of identical in-flight prompts.
+        threaded_async: Serve async calls by running the sync client in
+            worker threads (needed for the REST transport, which the async
+            Gemini client does not support).
+    """
+
+    def __init__(self, model, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 max_retries: int = 5, backoff_base: float = 1.0, backoff_max: float = 30.0,
+                 coalesce: bool = True, threaded_async: bool = False):
+        self.model = model
+        self.requests = TokenBucket(requests_per_minute / 60, max(1.0, requests_per_minute / 60))
+        # A minute's worth of tokens may be spent in one burst
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.coalesce = coalesce
+        self.threaded_async = threaded_async
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._ainflight: Dict[str, asyncio.Future] = {}
+
+    # --- Helpers ---
+
+    def _key(self, input: Any, kwargs: dict) -> str:
+        text = input.to_string() if hasattr(input, "to_string") else str(input)
+        return make_key(getattr(self.model, "model", ""), text, sorted(kwargs.items()))
+
+    def _estimate(self, input: Any) -> int:
+        text = input.to_string() if hasattr(input, "to_string") else str(input)
+        return max(1, len(text) // CHARS_PER_TOKEN)
+
+    def _settle(self, estimate: int, message) -> None:
+        # Replace the pre-charged estimate with the tokens actually used
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            self.tokens.adjust(estimate - usage.get("total_tokens", estimate))
+
+    def _delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _should_retry(self, error: BaseException, attempt: int) -> bool:
+        if attempt >= self.max_retries or not is_retryable(error):
+            registry.inc("octcoder_llm_requests_total", 1, "LLM requests by outcome.", outcome="error")
+            return False
+        registry.inc("octcoder_llm_retries_total", 1, "LLM requests retried after a transient error.")
+        return True
+
+    def _throttled(self, seconds: float) -> None:
+        if seconds:
+            registry.inc("octcoder_llm_throttle_seconds_total", seconds,
+                         "Seconds LLM calls waited on the rate limiter.")
+
+    def _succeeded(self) -> None:
+        registry.inc("octcoder_llm_requests_total", 1, "LLM requests by outcome.", outcome="ok")
+
+    def _coalesced(self) -> None:
+        registry.inc("octcoder_llm_coalesced_total", 1, "LLM calls served by an identical in-flight request.")
+
+    def _start_args(self, input: Any, config) -> tuple:
+        # What the chat model reports when a call starts
+        return ((getattr(self.model, "_serialized", {}), [self.model._convert_input(input).to_messages()]),
+                {"name": config.get("run_name"), "run_id": config.pop("run_id", None), "batch_size": 1})
+
+    def _replay(self, input: Any, config, message) -> None:
+        """Report a shared result to a coalesced caller's own callbacks."""
+        if not _handlers(config):
+            return
+        config = ensure_config(config)
+        args, kwargs = self._start_args(input, config)
+        (run,) = get_callback_manager_for_config(config).on_chat_model_start(*args, **kwargs)
+        run.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]))
+
+    async def _areplay(self, input: Any, config, message) -> None:
+        if not _handlers(config):
+            return
+        config = ensure_config(config)
+        args, kwargs = self._start_args(input, config)
+        (run,) = await get_async_callback_manager_for_config(config).on_chat_model_start(*args, **kwargs)
+        await run.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]))
+
+    # --- Sync ---
+
+    def _call(self, input: Any, config, **kwargs):
+        estimate = self._estimate(input)
+        attempt = 0
+        while True:
+            self._throttled(self.requests.acquire(1) + self.tokens.acquire(estimate))
+            try:
+                message = self.model.invoke(input, config, **kwargs)
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                time.sleep(self._delay(attempt))
+                attempt += 1
+                continue
+            self._succeeded()
+            self._settle(estimate, message)
+            return message
+
+    def invoke(self, input: Any, config=None, **kwargs):
+        if not self.coalesce or has_callbacks(config):
+            return self._call(input, config, **kwargs)
+
+        key = self._key(input, kwargs)
+        while True:
+            with self._lock:
+                pending = self._inflight.get(key)
+                leader = pending is None
+                if leader:
+                    pending = self._inflight[key] = Future()
+            if leader:
+                break
+            result = pending.result()
+            if result is not _ABANDONED:
+                self._coalesced()
+                self._replay(input, config, result)
+                return result
+
+        outcome = _ABANDONED
+        try:
+            outcome = self._call(input, config, **kwargs)
+            return outcome
+        except Exception as e:
+            outcome = e
+            raise
+        finally:
+            # Unregister first, so callers told to re-issue do not find this call again
+            with self._lock:
+                del self._inflight[key]
+            if isinstance(outcome, Exception):
+                pending.set_exception(outcome)
+            else:
+                pending.set_result(outcome)
+
+    def stream(self, input: Any, config=None, **kwargs) -> Iterator:
+        estimate = self._estimate(input)
+        attempt = 0
+        while True:
+            self._throttled(self.requests.acquire(1) + self.tokens.acquire(estimate))
+            started = False
+            message = None
+            try:
+                for chunk in self.model.stream(input, config, **kwargs):
+                    started = True
+                    message = chunk if message is None else message + chunk
+                    yield chunk
+            except Exception as e:
+                # Once chunks have reached the caller the call cannot be replayed
+                if started or not self._should_retry(e, attempt):
+                    raise
+                time.sleep(self._delay(attempt))
+                attempt += 1
+                continue
+            self._succeeded()
+            self._settle(estimate, message)
+            return
+
+    # --- Async ---
+
+    async def _acall(self, input: Any, config, **kwargs):
+        if self.threaded_async:
+            return await asyncio.to_thread(self._call, input, config, **kwargs)
+
+        estimate = self._estimate(input)
+        attempt = 0
+        while True:
+            self._throttled(await self.requests.aacquire(1) + await self.tokens.aacquire(estimate))
+            try:
+                message = await self.model.ainvoke(input, config, **kwargs)
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                await asyncio.sleep(self._delay(attempt))
+                attempt += 1
+                continue
+            self._succeeded()
+            self._settle(estimate, message)
+            return message
+
+    async def ainvoke(self, input: Any, config=None, **kwargs):
+        if not self.coalesce or has_callbacks(config):
+            return await self._acall(input, config, **kwargs)
+
+        key = self._key(input, kwargs)
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = self._ainflight.get(key)
+            # asyncio futures belong to one event loop; only share within it
+            if pending is None or pending.get_loop() is not loop:
+                break
+            result = await asyncio.shield(pending)
+            if result is not _ABANDONED:
+                self._coalesced()
+                await self._areplay(input, config, result)
+                return result
+            # The leader was cancelled: the first caller back takes over the
+            # request and the others wait on it
+
+        pending = self._ainflight[key] = loop.create_future()
+        try:
+            result = await self._acall(input, config, **kwargs)
+            pending.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            pending.set_result(_ABANDONED)
+            raise
+        except BaseException as e:
+            pending.set_exception(e)
+            # Nobody may be waiting; avoid "exception was never retrieved"
+            pending.exception()
+            raise
+        finally:
+            if self._ainflight.get(key) is pending:
+                del self._ainflight[key]
+
+    async def astream(self, input: Any, config=None, **kwargs) -> AsyncIterator:
+        if self.threaded_async:
+            async for chunk in self._astream_threaded(input, config, **kwargs):
+                yield chunk
+            return
+
+        estimate = self._estimate(input)
+        attempt = 0
+        while True:
+            self._throttled(await self.requests.aacquire(1) + await self.tokens.aacquire(estimate))
+            started = False
+            message = None
+            try:
+                async for chunk in self.model.astream(input, config, **kwargs):
+                    started = True
+                    message = chunk if message is None else message + chunk
+                    yield chunk
+            except Exception as e:
+                if started or not self._should_retry(e, attempt):
+                    raise
+                await asyncio.sleep(self._delay(attempt))
+                attempt += 1
+                continue
+            self._succeeded()
+            self._settle(estimate, message)
+            return
+
+    async def _astream_threaded(self, input: Any, config, **kwargs) -> AsyncIterator:
+        # Drive the sync stream from a worker thread, handing chunks over
+        # through a queue
+        chunks = queue.Queue()
+        done = object()
+
+        def pump():
+            try:
+                for chunk in self.stream(input, config, **kwargs):
+                    chunks.put(chunk)
+                chunks.put(done)
+            except BaseException as e:
+                chunks.put(e)
+
+        worker = asyncio.ensure_future(asyncio.to_thread(pump))
+        try:
+            while True:
+                item = await asyncio.to_thread(chunks.get)
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            await worker
+
+
+@lru_cache(maxsize=None)
+def get_gateway(model_name: str) -> LLMGateway:
+    """
+    Return the process-wide gateway for a Gemini model, creating it on first use.
+
+    Configured via environment variables:
+      - LLM_REQUESTS_PER_MINUTE / LLM_TOKENS_PER_MINUTE: rate limits (0 disables).
+        Default 1000 and 1000000.
+      - LLM_MAX_RETRIES: retries on transient errors. Default 5.
+      - LLM_BACKOFF_BASE / LLM_BACKOFF_MAX: backoff bounds in seconds. Default 1 and 30.
+      - LLM_COALESCE: set to 0 to disable sharing identical in-flight calls.
+      - GEMINI_API_ENDPOINT: alternative API endpoint, e.g. a local stub server.
+      - GEMINI_TRANSPORT: 'rest' or 'grpc'. Defaults to 'rest' when an
+        endpoint is set, otherwise to the client library's default.
+    """
+    from langchain_google_genai.chat_models import ChatGoogleGenerativeAI
+
+    endpoint = os.getenv("GEMINI_API_ENDPOINT")
+    transport = os.getenv("GEMINI_TRANSPORT") or ("rest" if endpoint else None)
+    model = ChatGoogleGenerativeAI(
+        model=model_name,
+        transport=transport,
+        client_options={"api_endpoint": endpoint} if endpoint else None,
+        # Retries are the gateway's job
+        max_retries=1,
+    )
+    return LLMGateway(
+        model,
+        requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "1000")),
+        tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "5")),
+        backoff_base=float(os.getenv("LLM_BACKOFF_BASE", "1")),
+        backoff_max=float(os.getenv("LLM_BACKOFF_MAX", "30")),
+        coalesce=os.getenv("LLM_COALESCE", "1") != "0",
+        threaded_async=transport == "rest",
+    )
@@ -0,0 +1,140 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Histogram buckets (seconds) for pipeline stage latencies
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    escaped = (f'{k}="{v}"'.replace("\n", "\\n") for k, v in items)
+    return "{" + ",".join(escaped) + "}"
+
+
+class MetricsRegistry:
+    """
+    A minimal in-process metrics registry rendered in the Prometheus text
+    exposition format. Supports counters, gauges, histograms and collector
+    callbacks that report externally kept values (e.g. cache counters).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._values: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, List[float]]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+
+    def _declare(self, name: str, kind: str, help_text: str) -> None:
+        self._meta.setdefault(name, (kind, help_text))
+
+    def inc(self, name: str, value: float = 1, help_text: str = "", **labels) -> None:
+        with self._lock:
+            self._declare(name, "counter", help_text)
+            series = self._values.setdefault(name, {})
+            key = _labels(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, help_text: str = "", **labels) -> None:
+        with self._lock:
+            self._declare(name, "gauge", help_text)
+            self._values.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(self, name: str, value: float, help_text: str = "", buckets=DEFAULT_BUCKETS, **labels) -> None:
+        with self._lock:
+            self._declare(name, "histogram", help_text)
+            self._buckets.setdefault(name, tuple(buckets))
+            # Per series: one count per bucket, then +Inf count and sum
+            state = self._histograms.setdefault(name, {}).setdefault(
+                _labels(labels), [0.0] * (len(self._buckets[name]) + 2))
+            for i, bound in enumerate(self._buckets[name]):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    def register_collector(self, collector: Callable) -> None:
+        """
+        Register a callable returning (name, kind, help, labels, value)
+        samples, evaluated at render time.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in sorted(self._meta.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "histogram":
+                    for labels, state in sorted(self._histograms.get(name, {}).items()):
+                        for bound, count in zip(self._buckets[name], state):
+                            lines.append(f"{name}_bucket{_format_labels(labels, (('le', str(bound)),))} {count:g}")
+                        lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {state[-2]:g}")
+                        lines.append(f"{name}_sum{_format_labels(labels)} {state[-1]:g}")
+                        lines.append(f"{name}_count{_format_labels(labels)} {state[-2]:g}")
+                else:
+                    for labels, value in sorted(self._values.get(name, {}).items()):
+                        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+            collectors = list(self._collectors)
+
+        declared = set()
+        for collector in collectors:
+            for name, kind, help_text, labels, value in collector():
+                if name not in declared:
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    declared.add(name)
+                lines.append(f"{name}{_format_labels(_labels(labels))} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Dump the current metrics as a Prometheus text file."""
+        with open(path, "w") as f:
+            f.write(self.render())
+
+
+# Process-wide registry shared by all agents and tools
+registry = MetricsRegistry()
+
+
+def cache_samples(cache_name: str, stats: Dict[str, int]):
+    """Turn a cache's hit/miss counters into collector samples."""
+    return [
+        ("octcoder_cache_events_total", "counter", "Cache lookups and evictions by cache and outcome.",
+         {"cache": cache_name, "event": event}, count)
+        for event, count in stats.items()
+    ]
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve `GET /metrics` from a background thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
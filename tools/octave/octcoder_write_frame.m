@@ -0,0 +1,28 @@
+function octcoder_write_frame (h)
+  % Append the pixels of figure H (default: current figure) to frames.rgb
+  % in the working directory, skipping the PNG encode/decode round-trip.
+  %
+  % Each record is a little-endian uint32 [height width channels] header
+  % followed by the pixels in row-major height x width x channel order.
+  if (nargin < 1)
+    h = gcf ();
+  end
+  try
+    rgb = getframe (h).cdata;
+  catch
+    % Some toolkits cannot capture invisible figures; render via print
+    tmp = [tempname() ".png"];
+    print (h, tmp, "-dpng");
+    rgb = imread (tmp);
+    unlink (tmp);
+  end_try_catch
+  if (size (rgb, 3) == 1)
+    rgb = repmat (rgb, [1 1 3]);
+  end
+  rgb = uint8 (rgb);
+
+  fid = fopen ("frames.rgb", "a");
+  fwrite (fid, [size(rgb, 1), size(rgb, 2), size(rgb, 3)], "uint32", 0, "ieee-le");
+  fwrite (fid, permute (rgb, [3 2 1]), "uint8");
+  fclose (fid);
+end
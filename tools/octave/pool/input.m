@@ -0,0 +1,4 @@
+function varargout = input (varargin)
+  % Headless replacement for input used by pooled Octave workers.
+  error ("input: interactive input is not available in headless runs");
+end
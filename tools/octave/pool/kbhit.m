@@ -0,0 +1,5 @@
+function key = kbhit (varargin)
+  % Headless replacement for kbhit used by pooled Octave workers.
+  % Reading a key would consume the worker's command channel.
+  key = "";
+end
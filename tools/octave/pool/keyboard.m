@@ -0,0 +1,4 @@
+function keyboard (varargin)
+  % Headless replacement for keyboard used by pooled Octave workers.
+  error ("keyboard: interactive debugging is not available in headless runs");
+end
@@ -0,0 +1,25 @@
+function octcoder_run_job (run_dir, script_path)
+  % Run one user script inside a pooled worker with a clean workspace.
+  % The script is sourced in the base workspace, which is cleared before
+  % every job, so it cannot see or clear this function's variables (e.g.
+  % with a 'clear all' preamble). The directory to return to is kept in
+  % appdata, and the cleanup runs however the script ends.
+  evalin ("base", "clear -variables");
+  clear -global;
+  close ("all", "hidden");
+  graphics_toolkit (getappdata (0, "octcoder_toolkit"));
+  set (0, "DefaultFigureVisible", "off");
+
+  setappdata (0, "octcoder_home_dir", pwd ());
+  unwind_protect
+    cd (run_dir);
+    try
+      evalin ("base", sprintf ("source ('%s');", strrep (script_path, "'", "''")));
+    catch err
+      fprintf (stderr, "error: %s\n", err.message);
+    end_try_catch
+  unwind_protect_cleanup
+    close ("all", "hidden");
+    cd (getappdata (0, "octcoder_home_dir"));
+  end_unwind_protect
+end
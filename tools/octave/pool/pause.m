@@ -0,0 +1,8 @@
+function pause (varargin)
+  % Headless replacement for pause used by pooled Octave workers.
+  % The worker's stdin is the command channel, so waiting for a keypress
+  % would block until the run times out. Timed pauses are still honoured.
+  if (nargin > 0 && isnumeric (varargin{1}) && isfinite (varargin{1}))
+    builtin ("pause", varargin{1});
+  end
+end
@@ -0,0 +1,464 @@
+import os
+import time
+import uuid
+import queue
+import asyncio
+import logging
+import threading
+import subprocess
+from typing import Optional, Tuple
+
+from tools.octave_runner import BOOTSTRAP_SCRIPT, OCTAVE_CMD
+from tools.tracing import annotate
+from tools.exec_limits import POLL_INTERVAL, LimitExceeded, get_limits, kill_group
+
+logger = logging.getLogger(__name__)
+
+# Octave helpers (headless pause/input shims and the per-job entry point)
+SHIM_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "octave", "pool")
+
+# Interactive mode keeps the interpreter alive after a top-level error and
+# lets it execute commands as they arrive on stdin.
+WORKER_CMD = OCTAVE_CMD + ["--interactive", "--no-line-editing", "--no-history"]
+
+WORKER_SETUP = f"""
+PS1(''); PS2('');
+more off;
+warning('off', 'Octave:shadowed-function');
+addpath('{SHIM_DIR.replace("'", "''")}');
+{BOOTSTRAP_SCRIPT}
+setappdata(0, 'octcoder_toolkit', graphics_toolkit());
+"""
+
+
+def _octave_str(value: str) -> str:
+    """Quote a Python string as a single-quoted Octave string literal."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+class OctaveWorker:
+    """
+    A long-lived, already bootstrapped octave-cli process.
+
+    Commands are written to the interpreter's stdin; the end of each command
+    is detected by a unique sentinel line echoed on both stdout and stderr.
+
+    The memory and file size rlimits apply to the worker for its lifetime;
+    CPU time is limited per job by the job's Supervisor instead, since
+    RLIMIT_CPU would count every job the worker has run.
+    """
+
+    def __init__(self, spawn_timeout: float = 60):
+        self.runs = 0
+        self.last_used = time.monotonic()
+        self._lines = queue.Queue()
+        # Wakes an async command (see _acommand) when output arrives
+        self._notify = None
+        self.proc = subprocess.Popen(
+            WORKER_CMD,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+            preexec_fn=get_limits().preexec(cpu=False),
+        )
+        for name, stream in (("stdout", self.proc.stdout), ("stderr", self.proc.stderr)):
+            threading.Thread(target=self._pump, args=(name, stream), daemon=True).start()
+
+        try:
+            self._command(WORKER_SETUP, spawn_timeout)
+        except Exception:
+            self.kill()
+            raise
+
+    def _pump(self, name: str, stream) -> None:
+        for raw in iter(stream.readline, b""):
+            self._put(name, raw.decode(errors="replace"))
+        self._put(name, None)
+
+    def _put(self, name: str, line: Optional[str]) -> None:
+        self._lines.put((name, line))
+        notify = self._notify
+        if notify is not None:
+            try:
+                notify()
+            except RuntimeError:
+                # The awaiting event loop has closed
+                pass
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def _command(self, code: str, timeout: float, supervisor=None) -> Tuple[str, str]:
+        """
+        Send `code` to the interpreter and collect its output.
+
+        When a Supervisor (see tools.exec_limits) is given, the output is
+        fed to it instead of being returned, and its limits are checked
+        while the command runs.
+
+        Raises:
+            subprocess.TimeoutExpired: if the sentinel does not arrive in time.
+            LimitExceeded: if the supervisor stopped the command, or the
+                interpreter is killed by an rlimit.
+            RuntimeError: if the interpreter exits while running the command.
+        """
+        command = _Command(self, code, supervisor)
+        deadline = time.monotonic() + timeout
+        while command.pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(WORKER_CMD, timeout)
+            try:
+                item = self._lines.get(timeout=min(remaining, POLL_INTERVAL) if supervisor else remaining)
+            except queue.Empty:
+                item = None
+            command.take(item)
+        return command.output()
+
+    async def _acommand(self, code: str, timeout: float, supervisor=None) -> Tuple[str, str]:
+        """
+        Async variant of _command: waits for output on the event loop, so
+        no thread is held while the interpreter works and the awaiting task
+        can be cancelled at any point.
+        """
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        self._notify = lambda: loop.call_soon_threadsafe(ready.set)
+        try:
+            command = _Command(self, code, supervisor)
+            deadline = loop.time() + timeout
+            while command.pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(WORKER_CMD, timeout)
+                try:
+                    item = self._lines.get_nowait()
+                except queue.Empty:
+                    item = None
+                    ready.clear()
+                    # Output queued before the clear() would not wake us
+                    if self._lines.empty():
+                        try:
+                            await asyncio.wait_for(ready.wait(), min(remaining, POLL_INTERVAL) if supervisor else remaining)
+                        except asyncio.TimeoutError:
+                            pass
+                command.take(item)
+            return command.output()
+        finally:
+            self._notify = None
+
+    def run(self, script_path: str, run_dir: str, timeout: float, supervisor=None) -> Tuple[str, str]:
+        """Run a script with `run_dir` as the working directory."""
+        try:
+            return self._command(self._job(script_path, run_dir, supervisor), timeout, supervisor)
+        finally:
+            self._done(supervisor)
+
+    async def arun(self, script_path: str, run_dir: str, timeout: float, supervisor=None) -> Tuple[str, str]:
+        """Async variant of run."""
+        try:
+            return await self._acommand(self._job(script_path, run_dir, supervisor), timeout, supervisor)
+        finally:
+            self._done(supervisor)
+
+    def _job(self, script_path: str, run_dir: str, supervisor) -> str:
+        self.runs += 1
+        if supervisor is not None:
+            supervisor.watch_cpu(self.proc.pid)
+            # The worker's high-water mark would otherwise cover its earlier jobs
+            supervisor.watch_memory(self.proc.pid, reset=True)
+        return f"octcoder_run_job({_octave_str(os.path.abspath(run_dir))}, {_octave_str(os.path.abspath(script_path))});"
+
+    def _done(self, supervisor) -> None:
+        # The worker is still alive, so the job's peak can be read exactly
+        if supervisor is not None:
+            supervisor.sample_memory()
+        self.last_used = time.monotonic()
+
+    def ping(self, timeout: float = 5) -> bool:
+        try:
+            self._command("1;", timeout)
+            return True
+        except Exception:
+            return False
+
+    def kill(self) -> None:
+        kill_group(self.proc.pid)
+        self.proc.wait()
+
+
+class _Command:
+    """
+    One command sent to a worker, and the output collected for it: the
+    sentinel handling shared by OctaveWorker._command and _acommand.
+    """
+
+    def __init__(self, worker: OctaveWorker, code: str, supervisor=None):
+        self.worker = worker
+        self.supervisor = supervisor
+        self.token = f"__octcoder_done_{uuid.uuid4().hex}__"
+        self.pending = {"stdout", "stderr"}
+        self.out, self.err = [], []
+        payload = (
+            f"{code}\n"
+            f"disp('{self.token}'); fflush(stdout);\n"
+            f"fputs(stderr, \"{self.token}\\n\"); fflush(stderr);\n"
+        )
+        worker.proc.stdin.write(payload.encode())
+        worker.proc.stdin.flush()
+
+    def take(self, item: Optional[Tuple[str, Optional[str]]]) -> None:
+        """Handle one (stream, line) item, or None when none arrived in time."""
+        if self.supervisor is not None:
+            stopped = self.supervisor.check()
+            if stopped is not None:
+                raise stopped
+        if item is None:
+            return
+        name, line = item
+        if line is None:
+            returncode = self.worker.proc.wait()
+            stopped = self.supervisor.exit_reason(returncode) if self.supervisor is not None else None
+            if stopped is not None:
+                raise stopped
+            raise RuntimeError(f"Octave worker exited with code {returncode}: {''.join(self.err)}")
+        if line == "":
+            return
+        if line.rstrip().endswith(self.token):
+            # Output without a trailing newline shares the sentinel's line
+            line = line.rstrip()[:-len(self.token)]
+            self.pending.discard(name)
+        if self.supervisor is not None:
+            self.supervisor.feed(name, line.encode())
+        else:
+            (self.out if name == "stdout" else self.err).append(line)
+
+    def output(self) -> Tuple[str, str]:
+        return "".join(self.out), "".join(self.err)
+
+
+class OctavePool:
+    """
+    A fixed-size pool of warm Octave workers.
+
+    Workers are spawned lazily (or up front via `warm`), health-checked when
+    they have been idle for a while, and recycled after `max_runs` jobs or
+    whenever a job crashes the interpreter or exceeds its timeout.
+    """
+
+    def __init__(self, size: int = 2, max_runs: int = 50, idle_check: float = 30, spawn_timeout: float = 60):
+        self.size = size
+        self.max_runs = max_runs
+        self.idle_check = idle_check
+        self.spawn_timeout = spawn_timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._workers = set()
+
+    def _spawn(self) -> OctaveWorker:
+        worker = OctaveWorker(self.spawn_timeout)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _retire(self, worker: OctaveWorker) -> None:
+        with self._lock:
+            self._workers.discard(worker)
+        worker.kill()
+
+    def _checkout(self) -> OctaveWorker:
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return self._spawn()
+            stale = time.monotonic() - worker.last_used > self.idle_check
+            if worker.alive and (not stale or worker.ping()):
+                return worker
+            logger.info("Replacing unhealthy Octave worker (pid %s)", worker.proc.pid)
+            self._retire(worker)
+
+    def execute(self, script_path: str, run_dir: str, timeout: float = 300, supervisor=None) -> Tuple[str, str]:
+        """
+        Run a script on a pooled worker, blocking while all workers are busy.
+
+        Args:
+            supervisor: Optional tools.exec_limits.Supervisor; when given, it
+                receives the output and enforces the run's limits.
+
+        Returns:
+            A (stdout, stderr) tuple (empty when a supervisor is given).
+
+        Raises:
+            subprocess.TimeoutExpired: if the script exceeds `timeout`.
+            LimitExceeded: if the supervisor stopped the script.
+            FileNotFoundError: if octave-cli is not installed.
+            RuntimeError: if the interpreter exits during the run.
+        """
+        with self._slots:
+            worker = self._checkout()
+            try:
+                output = worker.run(script_path, run_dir, timeout, supervisor)
+            except Exception as e:
+                raise self._failed(worker, e)
+            self._checkin(worker)
+            return output
+
+    async def aexecute(self, script_path: str, run_dir: str, timeout: float = 300, supervisor=None) -> Tuple[str, str]:
+        """
+        Async variant of execute, with the same arguments, result and
+        errors. Waiting for the script does not hold a thread, and when the
+        awaiting task is cancelled the worker is killed along with the
+        script it is running.
+        """
+        # The slots are shared with threads, so wait for one by polling
+        # rather than blocking the event loop (or an uncancellable thread)
+        while not self._slots.acquire(blocking=False):
+            await asyncio.sleep(POLL_INTERVAL)
+        # Spawning or pinging a worker blocks, so checkout runs in a thread;
+        # if the task is cancelled meanwhile, the worker is parked when ready
+        checkout = asyncio.ensure_future(asyncio.to_thread(self._checkout))
+        try:
+            worker = await asyncio.shield(checkout)
+        except asyncio.CancelledError:
+            checkout.add_done_callback(self._park)
+            raise
+        except BaseException:
+            self._slots.release()
+            raise
+
+        try:
+            output = await worker.arun(script_path, run_dir, timeout, supervisor)
+        except asyncio.CancelledError:
+            logger.info("Stopping cancelled job on Octave worker (pid %s)", worker.proc.pid)
+            self._retire(worker)
+            raise
+        except Exception as e:
+            raise self._failed(worker, e)
+        else:
+            self._checkin(worker)
+            return output
+        finally:
+            self._slots.release()
+
+    def _park(self, checkout: asyncio.Future) -> None:
+        """Return the worker of a checkout abandoned by a cancelled task."""
+        if not checkout.cancelled() and checkout.exception() is None:
+            self._idle.put(checkout.result())
+        self._slots.release()
+
+    def _failed(self, worker: OctaveWorker, error: Exception) -> Exception:
+        """Retire a worker whose job failed; returns the error to raise."""
+        if isinstance(error, (subprocess.TimeoutExpired, LimitExceeded)):
+            # The worker may still be running the script; replace it
+            self._retire(worker)
+            return error
+        if isinstance(error, (RuntimeError, OSError)):
+            # The script crashed or quit the interpreter; the next job
+            # gets a fresh worker.
+            self._retire(worker)
+            wrapped = RuntimeError(str(error))
+            wrapped.__cause__ = error
+            return wrapped
+        self._retire(worker)
+        return error
+
+    def _checkin(self, worker: OctaveWorker) -> None:
+        """Return a worker after a successful job, or recycle it."""
+        annotate(worker_pid=worker.proc.pid, worker_runs=worker.runs)
+        if worker.runs >= self.max_runs or not worker.alive:
+            self._retire(worker)
+        else:
+            self._idle.put(worker)
+
+    def warm(self) -> None:
+        """Spawn any missing workers in the background."""
+        def spawn():
+            with self._slots:
+                try:
+                    self._idle.put(self._spawn())
+                except Exception as e:
+                    logger.warning("Could not start Octave worker: %s", e)
+
+        with self._lock:
+            missing = self.size - len(self._workers)
+        for _ in range(max(0, missing)):
+            threading.Thread(target=spawn, daemon=True).start()
+
+    def health_check(self) -> int:
+        """Ping every idle worker, replacing dead ones. Returns the healthy count."""
+        healthy = []
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if worker.alive and worker.ping():
+                healthy.append(worker)
+            else:
+                self._retire(worker)
+        for worker in healthy:
+            self._idle.put(worker)
+        return len(healthy)
+
+    def close(self) -> None:
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            self._retire(worker)
+
+
+_pool: Optional[OctavePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> Optional[OctavePool]:
+    """
+    Return the process-wide Octave pool, creating it on first use.
+
+    Configured via environment variables:
+      - OCTAVE_POOL_SIZE: number of workers (0 disables pooling). Default 2.
+      - OCTAVE_POOL_MAX_RUNS: jobs per worker before it is recycled. Default 50.
+    """
+    global _pool
+    size = int(os.getenv("OCTAVE_POOL_SIZE", "2"))
+    if size <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = OctavePool(size=size, max_runs=int(os.getenv("OCTAVE_POOL_MAX_RUNS", "50")))
+        return _pool
+
+
+if __name__ == "__main__":
+    # Latency comparison on a trivial script: one-shot octave-cli vs pool.
+    import sys
+    import tempfile
+    import statistics
+    from tools.octave_runner import run_octave
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    def percentiles(samples):
+        ordered = sorted(samples)
+        return ordered[len(ordered) // 2], ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        script_path = os.path.join(tmp, "script.m")
+        with open(script_path, "w") as f:
+            f.write("x = 1 + 1;\nplot(1:3);\ndisp(x);\n")
+
+        pool = OctavePool(size=1, max_runs=runs + 1)
+        run_octave(script_path, tmp, pool=pool)  # warm-up / spawn
+        for label, kwargs in (("cold", {}), ("pool", {"pool": pool})):
+            samples = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                run_octave(script_path, tmp, **kwargs)
+                samples.append(time.perf_counter() - start)
+            p50, p95 = percentiles(samples)
+            print(f"{label}: p50={p50 * 1000:.1f} ms  p95={p95 * 1000:.1f} ms  mean={statistics.mean(samples) * 1000:.1f} ms")
+        pool.close()
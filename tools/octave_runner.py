@@ -1,75 +1,184 @@
 import os
 import glob
+import hashlib
 import subprocess
-from typing import Dict, Any
+from typing import Dict, Any, List
+from tools.frame_channel import RAW_FRAMES_FILE, count_raw_frames
+from tools.tracing import span
+from tools.exec_limits import Supervisor, LimitExceeded, get_limits, run_supervised, arun_supervised
 
-def run_octave(script_path: str, run_dir: str, timeout: int = 300) -> Dict[str, Any]:
+OCTAVE_CMD = ["octave-cli", "--quiet"]
+
+# Octave helper functions available to every script (e.g. octcoder_write_frame)
+OCTAVE_HELPERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "octave")
+
+# --- NEW ROBUST TOOLKIT SELECTION SCRIPT ---
+# This Octave code checks for available toolkits and picks the best one.
+# This prevents the "qt toolkit is not available" error.
+BOOTSTRAP_SCRIPT = """
+% --- Smart Graphics Toolkit Selection ---
+available_toolkits = available_graphics_toolkits();
+if (ismember("qt", available_toolkits))
+  graphics_toolkit("qt");
+elseif (ismember("fltk", available_toolkits))
+  graphics_toolkit("fltk");
+else
+  % Fallback to gnuplot if others are not available
+  graphics_toolkit("gnuplot");
+end
+% Make it headless regardless of the toolkit
+set(0, 'DefaultFigureVisible', 'off');
+% --- End Smart Selection ---
+addpath('""" + OCTAVE_HELPERS_DIR.replace("'", "''") + """');
+"""
+
+# Identifies the execution environment for result caching
+BOOTSTRAP_VERSION = hashlib.sha256(BOOTSTRAP_SCRIPT.encode()).hexdigest()[:12]
+
+TIMEOUT_MESSAGE = "TimeoutExpired: The Octave script ran for more than {timeout} seconds and was terminated."
+NOT_FOUND_MESSAGE = "Error: 'octave-cli' command not found. Please ensure GNU Octave is installed and in your system's PATH."
+
+
+def run_octave(script_path: str, run_dir: str, timeout: int = 300, pool=None) -> Dict[str, Any]:
     """
     Execute a GNU Octave script by piping it to the CLI. This version
     intelligently selects the best available graphics toolkit to ensure
     stability and prevent crashes.
 
+    The run is bounded by the limits from tools.exec_limits (CPU time,
+    memory, file size, frame count, output rate, stalls): output is captured
+    into bounded buffers, spilling to stdout.log/stderr.log in run_dir when
+    large, and a run that exceeds a limit is killed early, with the reason
+    and the active limits appended to stderr.
+
     Args:
         script_path: Path to the .m script to run.
         run_dir: Directory where frame_*.png files will be saved.
         timeout: Maximum seconds to wait for Octave to complete.
+        pool: Optional OctavePool (see tools.octave_pool). When given, the
+            script runs in an already bootstrapped worker instead of a
+            freshly spawned octave-cli process.
 
     Returns:
         A dict containing:
           - 'stdout': decoded standard output text.
           - 'stderr': decoded error output text.
-          - 'frames': list of paths to frame PNG files, sorted by name.
+          - 'frames': list of paths to frame PNG files, sorted by name,
+            followed by '<run_dir>/frames.rgb#<index>' references for frames
+            sent through the raw frame channel.
+          - 'completed': False if Octave timed out, crashed, exceeded a
+            limit or is missing.
     """
     os.makedirs(run_dir, exist_ok=True)
 
+    with span("octave", pooled=pool is not None) as s:
+        supervisor = Supervisor(run_dir, get_limits(), timeout)
+        stdout, stderr, completed = _run(script_path, run_dir, timeout, pool, supervisor)
+        _annotate_output(s, supervisor)
+
+    frames = discover_frames(run_dir)
+
+    return {"stdout": stdout, "stderr": stderr, "frames": frames, "completed": completed}
+
+
+def _run(script_path: str, run_dir: str, timeout: int, pool, supervisor: Supervisor):
+    stopped = None
     try:
-        with open(script_path, 'r') as f:
-            user_script = f.read()
-
-        # --- NEW ROBUST TOOLKIT SELECTION SCRIPT ---
-        # This Octave code checks for available toolkits and picks the best one.
-        # This prevents the "qt toolkit is not available" error.
-        bootstrap_script = """
-        % --- Smart Graphics Toolkit Selection ---
-        available_toolkits = available_graphics_toolkits();
-        if (ismember("qt", available_toolkits))
-          graphics_toolkit("qt");
-        elseif (ismember("fltk", available_toolkits))
-          graphics_toolkit("fltk");
-        else
-          % Fallback to gnuplot if others are not available
-          graphics_toolkit("gnuplot");
-        end
-        % Make it headless regardless of the toolkit
-        set(0, 'DefaultFigureVisible', 'off');
-        % --- End Smart Selection ---
-        """
-        
-        full_script = bootstrap_script + user_script
-
-        cmd = ["octave-cli", "--quiet"]
-
-        proc = subprocess.run(
-            cmd,
-            input=full_script.encode(),
-            cwd=run_dir,
-            capture_output=True,
-            timeout=timeout,
-            check=False
-        )
-        
-        stdout = proc.stdout.decode()
-        stderr = proc.stderr.decode()
-
-    except subprocess.TimeoutExpired:
-        stdout = ""
-        stderr = f"TimeoutExpired: The Octave script ran for more than {timeout} seconds and was terminated."
+        if pool is not None:
+            pool.execute(script_path, run_dir, timeout=timeout, supervisor=supervisor)
+        else:
+            with open(script_path, 'r') as f:
+                user_script = f.read()
+
+            full_script = BOOTSTRAP_SCRIPT + user_script
+
+            stopped, _ = run_supervised(OCTAVE_CMD, full_script.encode(), run_dir, supervisor)
+
+    except (subprocess.TimeoutExpired, FileNotFoundError, RuntimeError) as e:
+        return _failure(e, timeout, supervisor)
+
+    stdout, stderr = supervisor.result(stopped, TIMEOUT_MESSAGE.format(timeout=timeout))
+    return stdout, stderr, stopped is None
+
+
+def _failure(error: Exception, timeout: int, supervisor: Supervisor):
+    """The (stdout, stderr, completed) result of a run that raised `error`."""
+    if isinstance(error, subprocess.TimeoutExpired):
+        error = LimitExceeded("timeout", "")
+    if isinstance(error, LimitExceeded):
+        stdout, stderr = supervisor.result(error, TIMEOUT_MESSAGE.format(timeout=timeout))
+        return stdout, stderr, False
+    if isinstance(error, FileNotFoundError):
+        return "", NOT_FOUND_MESSAGE, False
+    # A pooled interpreter died while running the script
+    stdout, stderr = supervisor.result()
+    return stdout, (stderr + "\n" if stderr else "") + str(error), False
+
+
+def _annotate_output(record: dict, supervisor: Supervisor) -> None:
+    record["stdout_bytes"], record["stderr_bytes"] = supervisor.output_bytes
+    if supervisor.stopped is not None:
+        record["limit"] = supervisor.stopped.limit
+    if supervisor.peak_rss is not None:
+        record["peak_rss_bytes"] = supervisor.peak_rss
+
+
+async def arun_octave(script_path: str, run_dir: str, timeout: int = 300, pool=None) -> Dict[str, Any]:
+    """
+    Async variant of run_octave with the same arguments and result.
+
+    One-shot runs use an asyncio subprocess and pooled runs wait for their
+    worker on the event loop (OctavePool.aexecute), so no thread is blocked
+    while Octave works. If the awaiting task is cancelled, the process, or
+    the pooled worker running the script, is killed.
+    """
+    os.makedirs(run_dir, exist_ok=True)
+
+    with span("octave", pooled=pool is not None) as s:
+        supervisor = Supervisor(run_dir, get_limits(), timeout)
+        if pool is not None:
+            stdout, stderr, completed = await _arun_pooled(script_path, run_dir, timeout, pool, supervisor)
+        else:
+            with open(script_path, 'r') as f:
+                full_script = BOOTSTRAP_SCRIPT + f.read()
+            stdout, stderr, completed = await _arun(full_script, run_dir, timeout, supervisor)
+        _annotate_output(s, supervisor)
+
+    frames = discover_frames(run_dir)
+
+    return {"stdout": stdout, "stderr": stderr, "frames": frames, "completed": completed}
+
+
+async def _arun_pooled(script_path: str, run_dir: str, timeout: int, pool, supervisor: Supervisor):
+    try:
+        await pool.aexecute(script_path, run_dir, timeout=timeout, supervisor=supervisor)
+    except (subprocess.TimeoutExpired, FileNotFoundError, RuntimeError) as e:
+        return _failure(e, timeout, supervisor)
+
+    stdout, stderr = supervisor.result(None, TIMEOUT_MESSAGE.format(timeout=timeout))
+    return stdout, stderr, True
+
+
+async def _arun(full_script: str, run_dir: str, timeout: int, supervisor: Supervisor):
+    try:
+        stopped, _ = await arun_supervised(OCTAVE_CMD, full_script.encode(), run_dir, supervisor)
     except FileNotFoundError:
-        stdout = ""
-        stderr = "Error: 'octave-cli' command not found. Please ensure GNU Octave is installed and in your system's PATH."
+        return "", NOT_FOUND_MESSAGE, False
 
-    # Discover generated frame PNGs
-    pattern = os.path.join(run_dir, "frame_*.png")
-    frames = sorted(glob.glob(pattern))
+    stdout, stderr = supervisor.result(stopped, TIMEOUT_MESSAGE.format(timeout=timeout))
+    return stdout, stderr, stopped is None
+
+
+def discover_frames(run_dir: str) -> List[str]:
+    """
+    List the frames a run produced: PNG files first, then raw-channel frames.
+    """
+    with span("frame_discovery") as s:
+        # Discover generated frame PNGs
+        pattern = os.path.join(run_dir, "frame_*.png")
+        frames = sorted(glob.glob(pattern))
 
-    return {"stdout": stdout, "stderr": stderr, "frames": frames}
\ No newline at end of file
+        raw_path = os.path.join(run_dir, RAW_FRAMES_FILE)
+        frames += [f"{raw_path}#{i}" for i in range(count_raw_frames(raw_path))]
+        s["frame_count"] = len(frames)
+    return frames
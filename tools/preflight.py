@@ -0,0 +1,354 @@
+import re
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PreflightError(ValueError):
+    """A script is too broken to be worth an Octave run."""
+
+
+# Calls that wait for a user, or only matter with a visible window. Each maps
+# to the value substituted where the call's result is used, and the reason.
+_BLOCKING_CALLS = {
+    "pause": ("[]", "waits for a keypress (or just sleeps) in a headless run"),
+    "input": ("[]", "waits for keyboard input that never arrives"),
+    "keyboard": ("[]", "starts an interactive debugger"),
+    "waitforbuttonpress": ("0", "waits for a mouse click or keypress"),
+    "ginput": ("[]", "waits for mouse clicks"),
+    "kbhit": ("''", "reads a keypress from stdin"),
+    "uiwait": ("[]", "waits for a window to be closed"),
+    "waitfor": ("[]", "waits for a window to be closed"),
+    "drawnow": ("[]", "repaints windows, which headless runs do not have"),
+}
+
+# The runner selects the toolkit (see tools.octave_runner.BOOTSTRAP_SCRIPT)
+_TOOLKIT_CALL = "graphics_toolkit"
+
+_BLOCK_OPENERS = {"if", "for", "parfor", "while", "switch", "function", "do", "try", "unwind_protect"}
+# Specific terminators and the blocks they may close; 'end' closes any block
+_BLOCK_CLOSERS = {
+    "end": None,
+    "endif": {"if"},
+    "endfor": {"for"},
+    "endparfor": {"parfor"},
+    "endwhile": {"while"},
+    "endswitch": {"switch"},
+    "endfunction": {"function"},
+    "until": {"do"},
+    "end_try_catch": {"try"},
+    "end_unwind_protect": {"unwind_protect"},
+}
+_BRACKETS = {"(": ")", "[": "]", "{": "}"}
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_VISIBLE_ON = re.compile(r"""(['"])((?:defaultfigure)?visible)\1(\s*,\s*)(['"])on\4""", re.IGNORECASE)
+_FRAME_FORMAT = re.compile(r"""(['"])([^'"]*?)%(\d*)d\.png\1""")
+
+
+# --- Lexing ---
+
+def _is_transpose(line: str, i: int) -> bool:
+    """Whether the quote at `line[i]` is a transpose operator rather than a string."""
+    return i > 0 and (line[i - 1].isalnum() or line[i - 1] in "_)]}.'")
+
+
+def _string_end(line: str, i: int) -> Optional[int]:
+    """Index of the quote closing the string that starts at `line[i]`."""
+    quote = line[i]
+    j = i + 1
+    while j < len(line):
+        if quote == '"' and line[j] == "\\":
+            j += 2
+            continue
+        if line[j] == quote:
+            if line[j + 1:j + 2] == quote:  # doubled quote inside the string
+                j += 2
+                continue
+            return j
+        j += 1
+    return None
+
+
+def mask_line(line: str) -> Tuple[str, bool]:
+    """
+    Mask one line of Octave code for matching.
+
+    Returns the line, same length, with comments blanked and string contents
+    replaced by '_' (the quotes are kept), and whether a string was left
+    unterminated.
+    """
+    out = []
+    i = 0
+    while i < len(line):
+        ch = line[i]
+        if ch in "%#" or line.startswith("...", i):
+            out.append(" " * (len(line) - i))
+            break
+        if ch == '"' or (ch == "'" and not _is_transpose(line, i)):
+            end = _string_end(line, i)
+            if end is None:
+                out.append(ch + "_" * (len(line) - i - 1))
+                return "".join(out), True
+            out.append(ch + "_" * (end - i - 1) + ch)
+            i = end + 1
+            continue
+        out.append(ch)
+        i += 1
+    return "".join(out), False
+
+
+def mask_script(script: str) -> Tuple[List[str], List[str]]:
+    """Masked lines of a script (see mask_line) and any lexical problems found."""
+    masked, problems = [], []
+    in_block_comment = 0
+    for number, line in enumerate(script.split("\n"), 1):
+        stripped = line.strip()
+        if stripped in ("%{", "#{"):
+            in_block_comment += 1
+        if in_block_comment:
+            if stripped in ("%}", "#}"):
+                in_block_comment -= 1
+            masked.append(" " * len(line))
+            continue
+        text, unterminated = mask_line(line)
+        if unterminated:
+            problems.append(f"line {number}: unterminated string")
+        masked.append(text)
+    return masked, problems
+
+
+# --- Structure ---
+
+def check_structure(masked: List[str]) -> List[str]:
+    """
+    Check that blocks and brackets are balanced.
+
+    Returns a list of problems; empty when the script is well formed. A
+    `function` left open at the end of the script is accepted, since Octave
+    tolerates it.
+    """
+    problems = []
+    blocks: List[Tuple[str, int]] = []
+    brackets: List[Tuple[str, int]] = []
+    for number, line in enumerate(masked, 1):
+        i = 0
+        while i < len(line):
+            ch = line[i]
+            if ch in _BRACKETS:
+                brackets.append((ch, number))
+            elif ch in ")]}":
+                if not brackets or _BRACKETS[brackets[-1][0]] != ch:
+                    problems.append(f"line {number}: unmatched '{ch}'")
+                    return problems
+                brackets.pop()
+            elif ch.isalpha() or ch == "_":
+                word = _WORD.match(line, i).group()
+                # Keywords only count outside brackets, where 'end' is an index
+                if not brackets and (i == 0 or line[i - 1] != "."):
+                    if word in _BLOCK_OPENERS:
+                        blocks.append((word, number))
+                    elif word in _BLOCK_CLOSERS:
+                        if not blocks:
+                            problems.append(f"line {number}: '{word}' without an open block")
+                            return problems
+                        opener, opened = blocks.pop()
+                        allowed = _BLOCK_CLOSERS[word]
+                        if allowed is not None and opener not in allowed:
+                            problems.append(f"line {number}: '{word}' closes the '{opener}' block opened on line {opened}")
+                            return problems
+                i += len(word)
+                continue
+            i += 1
+
+    for ch, number in brackets:
+        problems.append(f"line {number}: '{ch}' is never closed")
+    for opener, number in blocks:
+        if opener != "function":
+            problems.append(f"line {number}: '{opener}' block is never closed")
+    return problems
+
+
+# --- Rewrites ---
+
+def _call_span(masked: str, start: int, name: str) -> Optional[int]:
+    """End of the call to `name` at `start`, including its argument list."""
+    end = start + len(name)
+    rest = masked[end:]
+    stripped = rest.lstrip(" ")
+    if stripped[:1].isalpha() and stripped != rest:
+        # Command syntax, e.g. `pause on` or `drawnow limitrate`
+        statement = re.match(r"[^;,]*", rest).group()
+        return end + len(statement.rstrip())
+    if not stripped.startswith("("):
+        return end
+    depth = 0
+    for j in range(end + len(rest) - len(stripped), len(masked)):
+        if masked[j] == "(":
+            depth += 1
+        elif masked[j] == ")":
+            depth -= 1
+            if depth == 0:
+                return j + 1
+    return None  # the argument list continues on the next line
+
+
+def _find_call(masked: str, names) -> Optional[Tuple[str, int]]:
+    for m in _WORD.finditer(masked):
+        if m.group() in names and (m.start() == 0 or masked[m.start() - 1] not in ".@"):
+            return m.group(), m.start()
+    return None
+
+
+def _neutralize(line: str, masked: str, name: str, start: int, end: int, value: str) -> str:
+    """
+    Comment out a call that is the whole line, drop it when it is one of
+    several statements on the line, or else replace it by `value`.
+    """
+    before, after = masked[:start].rstrip(), masked[end:].lstrip(" ")
+    if not before and after.strip() in ("", ";", ","):
+        indent = line[:len(line) - len(line.lstrip())]
+        return f"{indent}% [preflight] {line.strip()}"
+    if (not before or before[-1] in ";,") and after[:1] in (";", ","):
+        rest = line[len(masked) - len(after) + 1:].lstrip(" ")
+        return (line[:start] + rest).rstrip() if rest else line[:start].rstrip()
+    if before and before[-1] in ";," and not after.strip():
+        return line[:len(before)] + line[end:]
+    return line[:start] + value + line[end:]
+
+
+def _rewrite_calls(lines: List[str], code_lines: List[int], findings: List[Dict[str, Any]]) -> None:
+    for index in code_lines:
+        line = lines[index]
+        skip = set()
+        while True:
+            masked, _ = mask_line(line)
+            names = {n for n in _BLOCKING_CALLS if n not in skip} | ({_TOOLKIT_CALL} - skip)
+            found = _find_call(masked, names)
+            if found is None:
+                break
+            name, start = found
+            end = _call_span(masked, start, name)
+            if name == _TOOLKIT_CALL:
+                # Querying the toolkit is harmless; only selecting one is not
+                if end is None or masked[start + len(name):end].strip() in ("", "()"):
+                    skip.add(name)
+                    continue
+                value, reason = "[]", "selects a toolkit; the runner picks a headless one"
+            else:
+                if end is None:
+                    skip.add(name)
+                    _record(findings, "warning", "blocking_call", index, line,
+                            detail=f"'{name}' {_BLOCKING_CALLS[name][1]}; its arguments span several lines, so it was left as is")
+                    continue
+                value, reason = _BLOCKING_CALLS[name]
+            rewritten = _neutralize(line, masked, name, start, end, value)
+            _record(findings, "rewrite", "headless_figures" if name == _TOOLKIT_CALL else "blocking_call",
+                    index, line, after=rewritten, detail=f"'{name}' {reason}")
+            line = lines[index] = rewritten
+
+
+def _rewrite_visibility(lines: List[str], code_lines: List[int], findings: List[Dict[str, Any]]) -> None:
+    for index in code_lines:
+        line = lines[index]
+        masked, _ = mask_line(line)
+        rewritten = _VISIBLE_ON.sub(
+            lambda m: (m.group(0) if masked[m.start()] not in "'\"" else
+                       f"{m.group(1)}{m.group(2)}{m.group(1)}{m.group(3)}{m.group(4)}off{m.group(4)}"),
+            line)
+        if rewritten != line:
+            _record(findings, "rewrite", "headless_figures", index, line, after=rewritten,
+                    detail="figures stay invisible in headless runs")
+            lines[index] = rewritten
+
+
+def _check_frames(lines: List[str], code_lines: List[int], spec: dict, findings: List[Dict[str, Any]]) -> None:
+    """Make frame files match the frame_NNN.png names the executor collects, in order."""
+    if not spec.get("want_gif"):
+        return
+    code = "\n".join(mask_line(lines[index])[0] for index in code_lines)
+    if spec.get("frame_transport", "png") == "raw":
+        if "octcoder_write_frame" not in code:
+            _record(findings, "warning", "frame_names", None, None,
+                    detail="raw frame transport requested, but the script never calls octcoder_write_frame")
+        return
+
+    writes_frames = False
+    for index in code_lines:
+        line = lines[index]
+        masked, _ = mask_line(line)
+
+        def fix(m):
+            # Leave comments alone, and formats with other conversions
+            # (e.g. '%s/img_%d.png'), which take extra arguments
+            if masked[m.start()] not in "'\"" or "%" in m.group(2):
+                return m.group(0)
+            width = m.group(3) if m.group(3).startswith("0") else "04"
+            return f"{m.group(1)}frame_%{width}d.png{m.group(1)}"
+
+        rewritten = _FRAME_FORMAT.sub(fix, line)
+        if rewritten != line:
+            _record(findings, "rewrite", "frame_names", index, line, after=rewritten,
+                    detail="frames must be zero-padded frame_NNN.png files in the run directory to be collected in order")
+            lines[index] = line = rewritten
+        if "frame_" in line:
+            writes_frames = True
+
+    if not writes_frames:
+        _record(findings, "warning", "frame_names", None, None,
+                detail="a GIF was requested, but the script writes no frame_NNN.png files")
+
+
+def _record(findings: List[Dict[str, Any]], action: str, rule: str, index: Optional[int],
+            before: Optional[str], after: Optional[str] = None, detail: str = "") -> None:
+    finding = {"action": action, "rule": rule, "line": None if index is None else index + 1, "detail": detail}
+    if before is not None:
+        finding["before"] = before.strip()
+    if after is not None:
+        finding["after"] = after.strip()
+    findings.append(finding)
+    where = f"line {finding['line']}: " if finding["line"] else ""
+    if after is not None:
+        logger.info("preflight %s: %s%r -> %r (%s)", rule, where, finding["before"], finding["after"], detail)
+    else:
+        logger.warning("preflight %s: %s%s", rule, where, detail)
+
+
+def preflight(script: str, spec: Optional[dict] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Statically check a generated script and rewrite it for headless runs.
+
+    Blocking or interactive calls (pause, input, waitforbuttonpress, drawnow,
+    ...) are commented out, or replaced by an empty value where their result
+    is used; explicit toolkit selection and visible figures are removed; frame
+    file names are normalised to zero-padded frame_NNN.png.
+
+    Args:
+        script: The Octave script.
+        spec: The simulation spec ('want_gif', 'frame_transport').
+
+    Returns:
+        The rewritten script and a list of findings, each a dict with
+        'action' ('rewrite' or 'warning'), 'rule', 'line', 'detail' and, for
+        rewrites, the 'before' and 'after' text of the line.
+
+    Raises:
+        PreflightError: if the script is empty, has an unterminated string,
+            or has unbalanced blocks or brackets.
+    """
+    if not script.strip():
+        raise PreflightError("the script is empty")
+    masked, problems = mask_script(script)
+    problems += check_structure(masked)
+    if problems:
+        raise PreflightError("; ".join(problems))
+
+    lines = script.split("\n")
+    # Lines with code on them (not blank, comments or block comments)
+    code_lines = [index for index, text in enumerate(masked) if text.strip()]
+    findings: List[Dict[str, Any]] = []
+    _rewrite_calls(lines, code_lines, findings)
+    _rewrite_visibility(lines, code_lines, findings)
+    _check_frames(lines, code_lines, spec or {}, findings)
+    return "\n".join(lines), findings
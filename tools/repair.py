@@ -0,0 +1,138 @@
+import re
+import hashlib
+from typing import List, Optional, Tuple
+
+# Lines of stderr that mean the script failed, as opposed to warnings
+_ERROR_LINE = re.compile(r"^\s*(?:error:|parse error|PreflightError:|LimitExceeded \(|TimeoutExpired:)", re.MULTILINE)
+# Failures a script change cannot fix
+_ENVIRONMENT_ERRORS = ("command not found",)
+
+_QUOTED_NAME = re.compile(r"'([A-Za-z_][A-Za-z0-9_]*)'")
+_LINE_NUMBER = re.compile(r"\bline (\d+)\b")
+_SOURCE_ECHO = re.compile(r"^>>> ?(.*)$", re.MULTILINE)
+
+# Search/replace blocks returned by the repair prompt
+_PATCH_BLOCK = re.compile(r"<<<<<<< SEARCH\n(.*?)\n?=======\n(.*?)\n?>>>>>>> REPLACE", re.DOTALL)
+
+
+class PatchError(ValueError):
+    """A repair patch is malformed or does not match the script."""
+
+
+def find_error(stderr: str) -> Optional[str]:
+    """
+    The failure reported in a run's stderr, or None if the run succeeded.
+
+    Octave errors, preflight rejections and resource-limit kills count as
+    failures; warnings do not, and neither do environment problems such as
+    a missing octave-cli that no script change can fix.
+
+    Returns:
+        stderr from the first error line onwards.
+    """
+    if not stderr or any(e in stderr for e in _ENVIRONMENT_ERRORS):
+        return None
+    match = _ERROR_LINE.search(stderr)
+    return stderr[match.start():].strip() if match else None
+
+
+def error_signature(error: str) -> str:
+    """
+    A short hash identifying a kind of failure.
+
+    Numbers, paths and run directories are dropped, so the same mistake has
+    the same signature in every run.
+    """
+    lines = [l for l in error.splitlines() if _ERROR_LINE.match(l)][:3] or error.splitlines()[:1]
+    text = "\n".join(lines)
+    text = re.sub(r"(?:/[^\s'\"]+)+", "<path>", text)
+    text = re.sub(r"\d+(?:\.\d+)?", "<n>", text)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def trim_error(error: str, max_chars: int) -> str:
+    """Keep the start of an error (message and call stack) within `max_chars`."""
+    return error if len(error) <= max_chars else error[:max_chars] + "\n..."
+
+
+def error_location(error: str, script: str, context: int = 2) -> str:
+    """
+    The script lines an error most likely points at, numbered, with
+    `context` lines around each.
+
+    Uses, in order: source text Octave echoes after '>>>' for parse errors,
+    explicit 'line N' references, and quoted names such as 'x' undefined.
+    Returns an empty string when nothing in the script can be matched.
+    """
+    lines = script.split("\n")
+    hits: List[int] = []
+
+    for echoed in _SOURCE_ECHO.findall(error):
+        echoed = echoed.strip()
+        hits += [i for i, l in enumerate(lines) if echoed and echoed in l][:1]
+    for number in _LINE_NUMBER.findall(error):
+        if 1 <= int(number) <= len(lines):
+            hits.append(int(number) - 1)
+    if not hits:
+        for name in _QUOTED_NAME.findall(error):
+            word = re.compile(rf"\b{re.escape(name)}\b")
+            hits += [i for i, l in enumerate(lines) if word.search(l)][:1]
+
+    shown = sorted({j for i in hits[:3] for j in range(max(0, i - context), min(len(lines), i + context + 1))})
+    out, previous = [], None
+    for j in shown:
+        if previous is not None and j != previous + 1:
+            out.append("...")
+        marker = ">" if j in hits else " "
+        out.append(f"{marker}{j + 1:4d} | {lines[j]}")
+        previous = j
+    return "\n".join(out)
+
+
+def parse_patch(text: str) -> List[Tuple[str, str]]:
+    """
+    Parse the search/replace blocks of a repair patch.
+
+    Raises:
+        PatchError: if the text holds no block.
+    """
+    text = text.replace("\r\n", "\n")
+    blocks = _PATCH_BLOCK.findall(text)
+    if not blocks:
+        raise PatchError("the repair contains no SEARCH/REPLACE block")
+    return blocks
+
+
+def _find_loose(script: str, search: str) -> Optional[Tuple[int, int]]:
+    """Locate `search` in `script` ignoring indentation and trailing spaces."""
+    wanted = [l.strip() for l in search.split("\n")]
+    lines = script.split("\n")
+    for i in range(len(lines) - len(wanted) + 1):
+        if [l.strip() for l in lines[i:i + len(wanted)]] == wanted:
+            start = sum(len(l) + 1 for l in lines[:i])
+            end = start + sum(len(l) + 1 for l in lines[i:i + len(wanted)]) - 1
+            return start, end
+    return None
+
+
+def apply_patch(script: str, patch: str) -> str:
+    """
+    Apply search/replace blocks to a script, in order.
+
+    Each SEARCH text must occur in the script, exactly or up to indentation;
+    the first occurrence is replaced.
+
+    Raises:
+        PatchError: if a block does not match the script.
+    """
+    for search, replace in parse_patch(patch):
+        if not search.strip():
+            raise PatchError("a SEARCH block is empty")
+        if search in script:
+            script = script.replace(search, replace, 1)
+            continue
+        span = _find_loose(script, search)
+        if span is None:
+            raise PatchError(f"SEARCH text not found in the script: {search.strip().splitlines()[0]!r}")
+        script = script[:span[0]] + replace + script[span[1]:]
+    return script
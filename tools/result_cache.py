@@ -0,0 +1,146 @@
+import os
+import re
+import json
+import shutil
+import logging
+import threading
+import uuid
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Random number generators whose output differs between runs unless seeded
+_RANDOM_CALL = re.compile(r"\b(rand|randn|randi|randperm|rande|randg|randp)\b")
+_SEEDED = re.compile(r"\b(rand|randn|randi|rande|randg|randp)\s*\(\s*['\"](seed|state|twister)['\"]|\brng\s*\(")
+
+
+def is_deterministic(script: str) -> bool:
+    """
+    Heuristically decide whether a script produces the same output every run.
+
+    Scripts that call a random number generator without seeding it are
+    treated as nondeterministic and bypass the result cache. Comments are
+    not stripped, so the check errs on the side of running Octave again.
+    """
+    return not _RANDOM_CALL.search(script) or bool(_SEEDED.search(script))
+
+
+class ResultCache:
+    """
+    Disk cache of executor results keyed by script content hash.
+
+    Each entry is a directory holding `result.json` (stdout, stderr and the
+    artifact names) plus copies of the GIF and any remaining frame files.
+    The total size is bounded by `max_bytes`; the least recently used
+    entries (by `result.json` mtime) are evicted first.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str, run_dir: str) -> Optional[Dict[str, Any]]:
+        """
+        Copy a cached result's artifacts into `run_dir`.
+
+        Returns:
+            The executor fields ('stdout', 'stderr', 'frames', 'gif') with
+            paths rewritten into `run_dir`, or None on a miss.
+        """
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, "result.json")
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            for name in meta["artifacts"]:
+                shutil.copy2(os.path.join(entry_dir, name), os.path.join(run_dir, name))
+            os.utime(meta_path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        with self._lock:
+            self.stats["hits"] += 1
+        return {
+            "stdout": meta["stdout"],
+            "stderr": meta["stderr"],
+            "frames": [os.path.join(run_dir, name) for name in meta["frames"]],
+            "gif": os.path.join(run_dir, meta["gif"]) if meta["gif"] else None,
+        }
+
+    def put(self, key: str, stdout: str, stderr: str, frames: List[str], gif_path: Optional[str]) -> None:
+        """Store a finished run. Artifacts are copied, so the run dir may be deleted later."""
+        entry_dir = self._entry_dir(key)
+        if os.path.exists(entry_dir):
+            return
+
+        tmp_dir = f"{entry_dir}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(tmp_dir)
+        artifacts = []
+        for path in frames + ([gif_path] if gif_path else []):
+            if os.path.exists(path):
+                shutil.copy2(path, os.path.join(tmp_dir, os.path.basename(path)))
+                artifacts.append(os.path.basename(path))
+        meta = {
+            "stdout": stdout,
+            "stderr": stderr,
+            "frames": [os.path.basename(p) for p in frames],
+            "gif": os.path.basename(gif_path) if gif_path else None,
+            "artifacts": artifacts,
+        }
+        with open(os.path.join(tmp_dir, "result.json"), "w") as f:
+            json.dump(meta, f)
+
+        size = _dir_size(tmp_dir)
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another worker stored the same result first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._entries())
+            else:
+                self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir() or entry.name.endswith(".tmp"):
+                continue
+            try:
+                last_used = os.path.getmtime(os.path.join(entry.path, "result.json"))
+            except OSError:
+                continue
+            entries.append((last_used, _dir_size(entry.path), entry.path))
+        return entries
+
+    def _evict(self) -> None:
+        # Trim to 90% of the budget so eviction does not run on every insert
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes * 0.9:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            evicted += 1
+        self._total_bytes = total
+        self.stats["evictions"] += evicted
+        logger.info("Evicted %d cached results from %s", evicted, self.directory)
+
+
+def _dir_size(path: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
@@ -0,0 +1,323 @@
+import os
+import time
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      TEXT PRIMARY KEY,
+    run_dir     TEXT NOT NULL,
+    spec_hash   TEXT,
+    script_hash TEXT,
+    status      TEXT NOT NULL,
+    bytes       INTEGER NOT NULL DEFAULT 0,
+    created     REAL NOT NULL,
+    finished    REAL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_spec_hash ON runs (spec_hash);
+CREATE INDEX IF NOT EXISTS runs_script_hash ON runs (script_hash);
+CREATE INDEX IF NOT EXISTS runs_last_access ON runs (last_access);
+CREATE TABLE IF NOT EXISTS pins (
+    run_id  TEXT NOT NULL,
+    session TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (run_id, session)
+);
+CREATE INDEX IF NOT EXISTS pins_session ON pins (session);
+"""
+
+
+def dir_size(path: str) -> int:
+    """Total size in bytes of the files below `path`."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class RunCatalog:
+    """
+    SQLite index of run directories.
+
+    Each run is recorded with its spec and script hashes, status, size and
+    timestamps, so runs can be looked up by hash and evicted without listing
+    the runs directory. Runs can be pinned by UI sessions; pins expire after
+    a lease so abandoned sessions do not keep runs forever.
+
+    Args:
+        db_path: SQLite database file.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._initialised = False
+        self._init_lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        with self._init_lock:
+            if not self._initialised:
+                os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+                with sqlite3.connect(self.db_path, timeout=30) as conn:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(SCHEMA)
+                self._initialised = True
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- Recording ---
+
+    def record_start(self, run_id: str, run_dir: str, spec_hash: str, script_hash: str) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO runs (run_id, run_dir, spec_hash, script_hash, status, created, last_access)"
+                " VALUES (?, ?, ?, ?, 'running', ?, ?)",
+                (run_id, run_dir, spec_hash, script_hash, now, now),
+            )
+
+    def record_finish(self, run_id: str, status: str, size: Optional[int] = None) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE runs SET status = ?, bytes = COALESCE(?, bytes), finished = ?, last_access = ? WHERE run_id = ?",
+                (status, size, now, now, run_id),
+            )
+
+    def touch(self, run_id: str) -> None:
+        """Mark a run as recently used (it is evicted last)."""
+        with self._connect() as conn:
+            conn.execute("UPDATE runs SET last_access = ? WHERE run_id = ?", (time.time(), run_id))
+
+    # --- Lookup ---
+
+    def get(self, run_id: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find(self, spec_hash: str = None, script_hash: str = None, status: str = None, limit: int = 20) -> List[Dict]:
+        """Most recent runs matching the given hashes (served from the indexes)."""
+        clauses, params = [], []
+        for column, value in (("spec_hash", spec_hash), ("script_hash", script_hash), ("status", status)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT * FROM runs {where} ORDER BY created DESC LIMIT ?", (*params, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM runs").fetchone()
+            pinned = conn.execute("SELECT COUNT(DISTINCT run_id) FROM pins WHERE expires > ?", (time.time(),)).fetchone()[0]
+        return {"runs": count, "bytes": size, "pinned": pinned}
+
+    # --- Pins ---
+
+    def pin(self, run_id: str, session: str, ttl: float) -> None:
+        """
+        Protect a run from eviction while `session` shows it, for at most
+        `ttl` seconds. A session's previous pins are released.
+        """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM pins WHERE session = ?", (session,))
+            conn.execute("INSERT OR REPLACE INTO pins (run_id, session, expires) VALUES (?, ?, ?)",
+                         (run_id, session, time.time() + ttl))
+            conn.execute("UPDATE runs SET last_access = ? WHERE run_id = ?", (time.time(), run_id))
+
+    def release(self, session: str) -> None:
+        """Release every pin held by a session (e.g. when its browser tab closes)."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM pins WHERE session = ?", (session,))
+
+    # --- Eviction ---
+
+    def adopt(self, runs_root: str) -> int:
+        """
+        Register run directories that predate the catalog. This is the only
+        operation that lists `runs_root`; returns the number adopted.
+        """
+        if not os.path.isdir(runs_root):
+            return 0
+        with self._connect() as conn:
+            known = {row[0] for row in conn.execute("SELECT run_id FROM runs")}
+        adopted = 0
+        for entry in os.scandir(runs_root):
+            if entry.is_dir() and entry.name not in known:
+                mtime = entry.stat().st_mtime
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO runs (run_id, run_dir, status, bytes, created, finished, last_access)"
+                        " VALUES (?, ?, 'unknown', ?, ?, ?, ?)",
+                        (entry.name, entry.path, dir_size(entry.path), mtime, mtime, mtime),
+                    )
+                adopted += 1
+        return adopted
+
+    def evict(self, max_bytes: int = 0, max_age: float = 0, grace: float = 3600) -> List[str]:
+        """
+        Delete runs, least recently used first, until the total size is
+        within `max_bytes` (0 means no quota); also delete runs idle for more
+        than `max_age` seconds (0 means no limit).
+
+        Runs with a live pin, and runs still marked 'running' that started
+        less than `grace` seconds ago, are never deleted.
+
+        Returns:
+            The ids of the evicted runs.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM pins WHERE expires <= ?", (now,))
+            total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM runs").fetchone()[0]
+            candidates = conn.execute(
+                "SELECT run_id, run_dir, bytes, last_access FROM runs"
+                " WHERE run_id NOT IN (SELECT run_id FROM pins)"
+                " AND NOT (status = 'running' AND created > ?)"
+                " ORDER BY last_access",
+                (now - grace,),
+            ).fetchall()
+
+        evicted = []
+        for row in candidates:
+            expired = max_age and now - row["last_access"] > max_age
+            over_quota = max_bytes and total > max_bytes
+            if not (expired or over_quota):
+                # Ordered by last access, so later rows are newer still;
+                # stop once neither limit applies
+                break
+            shutil.rmtree(row["run_dir"], ignore_errors=True)
+            total -= row["bytes"]
+            evicted.append(row["run_id"])
+
+        if evicted:
+            with self._connect() as conn:
+                conn.executemany("DELETE FROM runs WHERE run_id = ?", [(run_id,) for run_id in evicted])
+        return evicted
+
+
+class Janitor:
+    """
+    Background thread enforcing the runs disk quota and age limit.
+
+    Args:
+        catalog: The run catalog.
+        runs_root: Directory holding the run directories (adopted once at start).
+        max_bytes / max_age: Limits passed to RunCatalog.evict.
+        interval: Seconds between sweeps.
+    """
+
+    def __init__(self, catalog: RunCatalog, runs_root: str, max_bytes: int, max_age: float, interval: float = 300):
+        self.catalog = catalog
+        self.runs_root = runs_root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self.evicted = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sweep(self) -> List[str]:
+        try:
+            evicted = self.catalog.evict(self.max_bytes, self.max_age)
+        except sqlite3.Error as e:
+            print(f"Error sweeping runs: {e}")
+            return []
+        self.evicted += len(evicted)
+        return evicted
+
+    def _loop(self) -> None:
+        try:
+            self.catalog.adopt(self.runs_root)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error adopting existing runs: {e}")
+        while not self._stop.is_set():
+            self.sweep()
+            self._stop.wait(self.interval)
+
+    def start(self) -> "Janitor":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="run-janitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+RUNS_ROOT = "test_runs"
+
+_catalog: Optional[RunCatalog] = None
+_janitor: Optional[Janitor] = None
+_lock = threading.Lock()
+
+
+def get_catalog() -> RunCatalog:
+    """
+    Return the process-wide run catalog (RUN_CATALOG_PATH, default
+    .cache/runs.sqlite3).
+    """
+    global _catalog
+    with _lock:
+        if _catalog is None:
+            _catalog = RunCatalog(os.getenv("RUN_CATALOG_PATH", os.path.join(".cache", "runs.sqlite3")))
+        return _catalog
+
+
+def get_janitor() -> Janitor:
+    """
+    Return the process-wide janitor (not started).
+
+    Configured via environment variables:
+      - RUNS_MAX_BYTES: disk quota for test_runs/ (0 disables). Default 5 GiB.
+      - RUNS_MAX_AGE: seconds since last use before a run is deleted
+        (0 disables). Default 7 days.
+      - RUNS_JANITOR_INTERVAL: seconds between sweeps. Default 300.
+    """
+    global _janitor
+    catalog = get_catalog()
+    with _lock:
+        if _janitor is None:
+            _janitor = Janitor(
+                catalog,
+                RUNS_ROOT,
+                max_bytes=int(os.getenv("RUNS_MAX_BYTES", str(5 * 1024 ** 3))),
+                max_age=float(os.getenv("RUNS_MAX_AGE", str(7 * 24 * 3600))),
+                interval=float(os.getenv("RUNS_JANITOR_INTERVAL", "300")),
+            )
+        return _janitor
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+
+    # python -m tools.run_catalog [stats | sweep | adopt | find <hash>]
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "stats":
+        print(json.dumps(get_catalog().stats()))
+    elif command == "adopt":
+        print(f"Adopted {get_catalog().adopt(RUNS_ROOT)} run(s)")
+    elif command == "sweep":
+        print(f"Evicted {len(get_janitor().sweep())} run(s)")
+    elif command == "find" and len(sys.argv) > 2:
+        rows = get_catalog().find(script_hash=sys.argv[2]) or get_catalog().find(spec_hash=sys.argv[2])
+        for row in rows:
+            print(json.dumps(row))
+    else:
+        sys.exit(f"Unknown command: {' '.join(sys.argv[1:])}")
@@ -0,0 +1,258 @@
+import os
+import re
+import json
+import time
+import zlib
+import sqlite3
+import threading
+import unicodedata
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from tools.cache import make_key
+
+# --- Normalization ---
+
+# Units are canonicalised to a base unit and scale, so "1 kHz" == "1000 hz"
+UNITS = {
+    "hz": ("hz", 1), "hertz": ("hz", 1), "khz": ("hz", 1e3), "kilohertz": ("hz", 1e3),
+    "mhz": ("hz", 1e6), "megahertz": ("hz", 1e6), "ghz": ("hz", 1e9),
+    "s": ("s", 1), "sec": ("s", 1), "secs": ("s", 1), "second": ("s", 1), "seconds": ("s", 1),
+    "ms": ("s", 1e-3), "msec": ("s", 1e-3), "millisecond": ("s", 1e-3), "milliseconds": ("s", 1e-3),
+    "us": ("s", 1e-6), "microsecond": ("s", 1e-6), "microseconds": ("s", 1e-6),
+    "min": ("s", 60), "mins": ("s", 60), "minute": ("s", 60), "minutes": ("s", 60),
+    "h": ("s", 3600), "hr": ("s", 3600), "hrs": ("s", 3600), "hour": ("s", 3600), "hours": ("s", 3600),
+    "m": ("m", 1), "meter": ("m", 1), "meters": ("m", 1), "metre": ("m", 1), "metres": ("m", 1),
+    "cm": ("m", 1e-2), "mm": ("m", 1e-3), "km": ("m", 1e3),
+    "kg": ("kg", 1), "g": ("kg", 1e-3), "gram": ("kg", 1e-3), "grams": ("kg", 1e-3),
+    "deg": ("deg", 1), "degree": ("deg", 1), "degrees": ("deg", 1), "°": ("deg", 1),
+    "rad": ("rad", 1), "radian": ("rad", 1), "radians": ("rad", 1),
+    "v": ("v", 1), "volt": ("v", 1), "volts": ("v", 1), "mv": ("v", 1e-3), "kv": ("v", 1e3),
+    "ohm": ("ohm", 1), "ohms": ("ohm", 1), "kohm": ("ohm", 1e3), "kohms": ("ohm", 1e3),
+    "db": ("db", 1), "%": ("%", 1), "percent": ("%", 1),
+    "fps": ("fps", 1), "frame": ("frame", 1), "frames": ("frame", 1),
+    "sample": ("sample", 1), "samples": ("sample", 1), "point": ("sample", 1), "points": ("sample", 1),
+    "x": ("x", 1),
+}
+
+NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "twenty": 20, "hundred": 100,
+}
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "for", "to", "in", "on", "at", "by", "with", "from", "as",
+    "is", "are", "be", "it", "its", "this", "that", "me", "my", "i", "you", "please", "can", "could",
+    "would", "make", "create", "show", "give", "generate", "produce", "using", "use", "some", "then",
+    "also", "just", "over", "into", "let", "lets", "let's",
+}
+
+_UNIT_PATTERN = "|".join(re.escape(u) for u in sorted(UNITS, key=len, reverse=True))
+_QUANTITY = re.compile(
+    r"(?<![\w.])(-?\d+(?:\.\d+)?(?:e[+-]?\d+)?|(?:" + "|".join(NUMBER_WORDS) + r")(?![a-z]))"
+    r"(?:\s*(" + _UNIT_PATTERN + r")(?![a-z]))?"
+)
+_WORD = re.compile(r"[a-z][a-z0-9_']*")
+_SUFFIXES = ("ing", "ions", "ion", "ed", "es", "s", "e")
+
+
+def _stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def normalize(text: str) -> Tuple[List[str], List[str]]:
+    """
+    Split a request into normalised words and canonical quantities.
+
+    Returns:
+        (words, quantities): stemmed non-stopword tokens in order, and the
+        sorted quantities as '<value><unit>' strings in base units (so
+        '2hz', '2 Hz' and '0.002 kHz' all become '2hz').
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    quantities = []
+
+    def replace(match):
+        number, unit = match.group(1), match.group(2)
+        value = float(NUMBER_WORDS.get(number, number))
+        base, scale = UNITS[unit] if unit else ("", 1)
+        quantities.append(f"{round(value * scale, 9):g}{base}")
+        return " "
+
+    text = _QUANTITY.sub(replace, text)
+    words = [_stem(w) for w in _WORD.findall(text) if w not in STOPWORDS]
+    return words, sorted(quantities)
+
+
+def shingles(words: List[str], quantities: List[str]) -> List[str]:
+    """Unigrams and bigrams of the words, plus the quantities."""
+    grams = set(words)
+    grams.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    grams.update(f"#{q}" for q in quantities)
+    return sorted(grams)
+
+
+def jaccard(a, b) -> float:
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+# --- MinHash / LSH ---
+
+_PRIME = (1 << 61) - 1
+
+
+class MinHasher:
+    """MinHash signatures from stable (process-independent) shingle hashes."""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, grams: List[str]) -> List[int]:
+        if not grams:
+            return [0] * self.num_perm
+        hashes = np.array([zlib.crc32(g.encode()) for g in grams], dtype=np.uint64)
+        # (a*x + b) mod p on 32-bit inputs; wrap-around in uint64 keeps the
+        # permutation deterministic, which is all that is needed here
+        permuted = (np.outer(hashes, self._a) + self._b) % np.uint64(_PRIME)
+        return permuted.min(axis=0).tolist()
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key        TEXT PRIMARY KEY,
+    text       TEXT NOT NULL,
+    shingles   TEXT NOT NULL,
+    quantities TEXT NOT NULL,
+    spec       TEXT NOT NULL,
+    created    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_created ON entries (created);
+CREATE INDEX IF NOT EXISTS entries_quantities ON entries (quantities);
+CREATE TABLE IF NOT EXISTS buckets (
+    band   INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    key    TEXT NOT NULL,
+    PRIMARY KEY (band, bucket, key)
+);
+CREATE INDEX IF NOT EXISTS buckets_key ON buckets (key);
+"""
+
+
+class SpecIndex:
+    """
+    A persistent near-duplicate index from request text to a validated spec.
+
+    Candidates are found with MinHash LSH and then scored by exact Jaccard
+    similarity of word/bigram shingles. A match also requires exactly the
+    same set of quantities, so "2 Hz for 3 s" never matches "3 Hz for 3 s".
+
+    Entries and their LSH buckets are stored in SQLite, so every process
+    (CLI, Gradio app, job workers) sees the others' entries, and adding one
+    is a single transaction rather than a rewrite of the index.
+
+    Args:
+        path: SQLite database the index is stored in (created on first use).
+        threshold: Minimum similarity (0-1) for a match.
+        num_perm / bands: MinHash size and LSH band count (num_perm must be
+            a multiple of bands).
+        max_entries: Oldest entries beyond this are dropped.
+    """
+
+    def __init__(self, path: str, threshold: float = 0.8, num_perm: int = 64, bands: int = 16,
+                 max_entries: int = 5000):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.path = path
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_entries = max_entries
+        self.hasher = MinHasher(num_perm)
+        self.stats = {"hits": 0, "misses": 0}
+        self._initialised = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        with self._lock:
+            if not self._initialised:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with sqlite3.connect(self.path, timeout=30) as conn:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(SCHEMA)
+                self._initialised = True
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _band_keys(self, signature: List[int]) -> List[int]:
+        # Stored, so the key must not depend on the process (unlike hash())
+        return [zlib.crc32(np.array(signature[i * self.rows:(i + 1) * self.rows], dtype=np.uint64).tobytes())
+                for i in range(self.bands)]
+
+    def _count(self, outcome: str) -> None:
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def lookup(self, text: str) -> Optional[Tuple[dict, float]]:
+        """Return (spec, similarity) of the best match above the threshold, or None."""
+        words, quantities = normalize(text)
+        grams = shingles(words, quantities)
+        bands = list(enumerate(self._band_keys(self.hasher.signature(grams))))
+        # Only candidates with exactly the same quantities can match
+        query = ("SELECT DISTINCT e.shingles, e.spec FROM buckets b JOIN entries e ON e.key = b.key"
+                 f" WHERE e.quantities = ? AND ({' OR '.join(['(b.band = ? AND b.bucket = ?)'] * len(bands))})")
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(query, (json.dumps(quantities), *[v for pair in bands for v in pair])).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error reading spec index: {e}")
+            rows = []
+
+        best, best_score = None, 0.0
+        for entry_shingles, spec in rows:
+            score = jaccard(grams, json.loads(entry_shingles))
+            if score > best_score:
+                best, best_score = spec, score
+
+        if best is None or best_score < self.threshold:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return json.loads(best), best_score
+
+    def add(self, text: str, spec: dict) -> None:
+        """Record a validated spec for a request, dropping the oldest entries beyond max_entries."""
+        words, quantities = normalize(text)
+        grams = shingles(words, quantities)
+        if not grams:
+            return
+        # One entry per normalised request; a newer spec replaces it
+        key = make_key(grams, quantities)
+        buckets = [(band, bucket, key) for band, bucket in enumerate(self._band_keys(self.hasher.signature(grams)))]
+        try:
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO entries (key, text, shingles, quantities, spec, created)"
+                             " VALUES (?, ?, ?, ?, ?, ?)",
+                             (key, text, json.dumps(grams), json.dumps(quantities), json.dumps(spec), time.time()))
+                conn.executemany("INSERT OR IGNORE INTO buckets (band, bucket, key) VALUES (?, ?, ?)", buckets)
+                stale = [(row[0],) for row in conn.execute(
+                    "SELECT key FROM entries ORDER BY created DESC LIMIT -1 OFFSET ?", (self.max_entries,))]
+                conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+                conn.executemany("DELETE FROM buckets WHERE key = ?", stale)
+        except sqlite3.Error as e:
+            print(f"Error saving spec index: {e}")
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,133 @@
+import os
+import re
+import math
+import itertools
+from typing import Any, Dict, List
+
+_NAME = re.compile(r"^[A-Za-z][A-Za-z0-9_]*$")
+
+
+def max_combinations() -> int:
+    """Largest number of parameter combinations a sweep may expand to (SWEEP_MAX_COMBINATIONS, default 64)."""
+    return int(os.getenv("SWEEP_MAX_COMBINATIONS", "64"))
+
+
+def expand_values(name: str, value: Any) -> List[Any]:
+    """
+    Expand one swept parameter into its values.
+
+    Args:
+        name: Parameter name (for error messages).
+        value: A list of values, or a range as {"start", "stop", "step"} or
+            {"start", "stop", "num"} (inclusive of `stop`).
+
+    Raises:
+        ValueError: if the value is not a non-empty list or a valid range.
+    """
+    if isinstance(value, list):
+        if not value:
+            raise ValueError(f"sweep parameter '{name}' has no values")
+        return value
+    if not isinstance(value, dict) or not {"start", "stop"} <= value.keys():
+        raise ValueError(f"sweep parameter '{name}' must be a list or a {{start, stop, step|num}} range")
+
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool)
+               for k, v in value.items() if k in ("start", "stop", "step", "num")):
+        raise ValueError(f"sweep parameter '{name}' range bounds must be numbers")
+    start, stop = value["start"], value["stop"]
+    if "num" in value:
+        # Checked before the values are built, as for 'step'
+        if value["num"] > max_combinations():
+            raise ValueError(f"sweep parameter '{name}' expands to {value['num']} values")
+        num = int(value["num"])
+        if num < 1:
+            raise ValueError(f"sweep parameter '{name}' needs num >= 1")
+        if num == 1:
+            values = [start]
+        else:
+            values = [start + (stop - start) * i / (num - 1) for i in range(num)]
+    elif "step" in value:
+        step = value["step"]
+        if not step or (stop - start) / step < 0:
+            raise ValueError(f"sweep parameter '{name}' has a step that never reaches stop")
+        count = math.floor((stop - start) / step + 1e-9) + 1
+        if count > max_combinations():
+            raise ValueError(f"sweep parameter '{name}' expands to {count} values")
+        values = [start + step * i for i in range(count)]
+    else:
+        raise ValueError(f"sweep parameter '{name}' range needs 'step' or 'num'")
+
+    # Keep integers integral and hide float noise such as 0.30000000000000004
+    if all(isinstance(v, int) or float(v).is_integer() for v in values) and \
+            all(isinstance(value.get(k), int) for k in ("start", "stop", "step") if k in value):
+        return [int(v) for v in values]
+    return [float(f"{v:.12g}") for v in values]
+
+
+def combinations(sweep: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    All parameter combinations of a sweep, in the order the parameters are
+    listed (the last parameter varies fastest).
+
+    Raises:
+        ValueError: for invalid names or values, or more than
+            SWEEP_MAX_COMBINATIONS combinations.
+    """
+    if not sweep:
+        return []
+    names = list(sweep)
+    for name in names:
+        if not _NAME.match(name):
+            raise ValueError(f"sweep parameter '{name}' is not a valid Octave variable name")
+    values = [expand_values(name, sweep[name]) for name in names]
+    total = math.prod(len(v) for v in values)
+    if total > max_combinations():
+        raise ValueError(f"sweep expands to {total} combinations, more than the limit of {max_combinations()}")
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+
+def octave_literal(value: Any) -> str:
+    """Render a JSON value as an Octave literal."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value) if math.isfinite(value) else ("NaN" if math.isnan(value) else ("Inf" if value > 0 else "-Inf"))
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    if isinstance(value, list) and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+        return "[" + " ".join(octave_literal(v) for v in value) + "]"
+    raise ValueError(f"cannot pass {value!r} to Octave as a sweep value")
+
+
+def assignment_code(combo: Dict[str, Any]) -> str:
+    """Octave code setting one combination's parameters, prepended to the script."""
+    lines = ["% --- Sweep parameters (injected) ---"]
+    lines += [f"{name} = {octave_literal(value)};" for name, value in combo.items()]
+    return "\n".join(lines) + "\n\n"
+
+
+def guard_assignments(script: str, names: List[str]) -> str:
+    """
+    Make the script's first plain assignment to each swept parameter a
+    default that yields to an injected value:
+
+        freq = 2;   ->   if ~exist('freq', 'var'), freq = 2; end
+
+    Parameters the script already checks with exist() are left alone.
+    """
+    for name in names:
+        if re.search(r"exist\s*\(\s*['\"]" + re.escape(name) + r"['\"]", script):
+            continue
+        pattern = re.compile(r"^([ \t]*)" + re.escape(name) + r"[ \t]*=(?!=)([^;\n]*;)([ \t]*%.*)?$", re.MULTILINE)
+        script = pattern.sub(
+            lambda m: f"{m.group(1)}if ~exist('{name}', 'var'), {name} ={m.group(2)} end{m.group(3) or ''}",
+            script, count=1,
+        )
+    return script
+
+
+def label(combo: Dict[str, Any]) -> str:
+    """A short description of a combination, e.g. 'freq=2, damping=0.1'."""
+    return ", ".join(f"{name}={value}" for name, value in combo.items())
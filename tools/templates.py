@@ -0,0 +1,311 @@
+import os
+import re
+import json
+import math
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from tools.metrics import registry
+from tools.preflight import preflight, PreflightError
+from tools.sweep import combinations, guard_assignments, octave_literal
+
+# Vetted scripts for common tasks: <name>.m with {{param}} placeholders and
+# <name>.json holding the tasks it serves and the schema of its params
+TEMPLATES_DIR = os.getenv("TEMPLATES_DIR", "templates")
+
+# Placeholders filled from the spec itself rather than from its params
+BUILTINS = ("want_gif", "raw_frames")
+PARAM_TYPES = ("number", "integer", "string", "boolean", "vector")
+
+# Lookup outcomes, as counted per task
+HIT = "hit"
+UNKNOWN_TASK = "unknown_task"
+SCHEMA_MISMATCH = "schema_mismatch"
+
+_PLACEHOLDER = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class TemplateError(ValueError):
+    """A template is invalid, or a spec does not fit its param schema."""
+
+
+def templates_enabled() -> bool:
+    return os.getenv("TEMPLATES", "1") != "0"
+
+
+def task_key(task: Any) -> str:
+    """Normalise a spec's task for lookup, e.g. 'Plot Signal' -> 'plot_signal'."""
+    return re.sub(r"[\s\-]+", "_", str(task or "").strip().lower())
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def check_value(name: str, schema: Dict[str, Any], value: Any) -> Any:
+    """
+    Check a param value against its schema.
+
+    Returns:
+        The value as the template gets it (integers as int, strings in
+        lower case when the schema lists choices).
+
+    Raises:
+        TemplateError: if the value has the wrong type, is not one of the
+            choices or is out of the min/max bounds.
+    """
+    kind = schema["type"]
+    if kind == "number":
+        valid = _is_number(value)
+    elif kind == "integer":
+        valid = _is_number(value) and float(value).is_integer()
+        value = int(value) if valid else value
+    elif kind == "string":
+        valid = isinstance(value, str)
+        if valid and "choices" in schema:
+            value = value.strip().lower()
+    elif kind == "boolean":
+        valid = isinstance(value, bool)
+    else:
+        valid = isinstance(value, list) and bool(value) and all(_is_number(v) for v in value)
+    if not valid:
+        raise TemplateError(f"'{name}' must be a {kind}, got {value!r}")
+
+    if "choices" in schema and value not in schema["choices"]:
+        raise TemplateError(f"'{name}' must be one of {schema['choices']}, got {value!r}")
+    numbers = value if kind == "vector" else [value] if kind in ("number", "integer") else []
+    if "min" in schema and any(v < schema["min"] for v in numbers):
+        raise TemplateError(f"'{name}' must be at least {schema['min']}, got {value!r}")
+    if "max" in schema and any(v > schema["max"] for v in numbers):
+        raise TemplateError(f"'{name}' must be at most {schema['max']}, got {value!r}")
+    return value
+
+
+class Template:
+    """
+    A vetted, parameterized script for one or more tasks.
+
+    The source is split into text and placeholders once, when the template
+    is loaded, so rendering a spec is a join of literals. Every param is
+    assigned on a line of its own (`freq = {{freq}};`), which sweeps turn
+    into overridable defaults as they do for generated scripts.
+    """
+
+    def __init__(self, name: str, source: str, schema: Dict[str, Any]):
+        self.name = name
+        self.tasks = [task_key(task) for task in schema.get("tasks") or []]
+        self.params: Dict[str, Dict[str, Any]] = schema.get("params") or {}
+        self._parts = _PLACEHOLDER.split(source)
+        self._aliases: Dict[str, str] = {}
+        self._validate(source)
+
+    def _validate(self, source: str) -> None:
+        """Check the schema, the placeholders and the rendered script; raises TemplateError."""
+        if not self.tasks or not all(self.tasks):
+            raise TemplateError("'tasks' must list at least one task")
+        for name, schema in self.params.items():
+            if not _NAME.match(name) or name in BUILTINS:
+                raise TemplateError(f"invalid param name '{name}'")
+            if schema.get("type") not in PARAM_TYPES:
+                raise TemplateError(f"param '{name}' needs a type out of {PARAM_TYPES}")
+            if "choices" in schema and schema["type"] != "string":
+                raise TemplateError(f"param '{name}': only strings can have choices")
+            if "default" not in schema and "example" not in schema:
+                raise TemplateError(f"param '{name}' needs a default or an example to be checked with")
+            for key in ("default", "example"):
+                if key in schema:
+                    check_value(name, schema, schema[key])
+            for alias in [name] + list(schema.get("aliases") or []):
+                if self._aliases.setdefault(alias.lower(), name) != name:
+                    raise TemplateError(f"alias '{alias}' is used by two params")
+
+        placeholders = self._parts[1::2]
+        for name in placeholders:
+            if name not in self.params and name not in BUILTINS:
+                raise TemplateError(f"placeholder '{{{{{name}}}}}' is not in the param schema")
+        for name in list(self.params) + list(BUILTINS):
+            assignment = re.compile(r"^[ \t]*" + name + r"[ \t]*=[ \t]*\{\{\s*" + name + r"\s*\}\};", re.MULTILINE)
+            if placeholders.count(name) != 1 or not assignment.search(source):
+                raise TemplateError(f"'{name}' must be assigned exactly once, as '{name} = {{{{{name}}}}};'")
+
+        # The script must pass the static check untouched in every mode
+        values = {name: schema.get("default", schema.get("example")) for name, schema in self.params.items()}
+        for want_gif, transport in ((False, "png"), (True, "png"), (True, "raw")):
+            spec = {"task": self.tasks[0], "want_gif": want_gif, "frame_transport": transport}
+            try:
+                _, findings = preflight(self._join(values, spec), spec)
+            except PreflightError as e:
+                raise TemplateError(f"preflight failed: {e}")
+            if findings:
+                raise TemplateError(f"preflight would change the script: {findings[0]['detail']}")
+
+    def fill(self, spec: dict) -> Dict[str, Any]:
+        """
+        The param values for a spec: its params, under their names or
+        aliases, plus defaults for the ones it leaves out.
+
+        Raises:
+            TemplateError: if the spec has params the template does not
+                know, lacks required ones, or has values that do not fit
+                (swept values also in their exact form, e.g. lower case).
+        """
+        values = {}
+        for key, value in (spec.get("params") or {}).items():
+            name = self._aliases.get(str(key).lower())
+            if name is None:
+                raise TemplateError(f"unknown param '{key}'")
+            if name in values:
+                raise TemplateError(f"'{name}' is given twice")
+            values[name] = check_value(name, self.params[name], value)
+        for name, schema in self.params.items():
+            if name not in values:
+                if "default" not in schema:
+                    raise TemplateError(f"missing param '{name}'")
+                values[name] = schema["default"]
+
+        # Swept values are injected under the spec's names, at execution time
+        sweep = spec.get("sweep") or {}
+        for name in sweep:
+            if name not in self.params:
+                raise TemplateError(f"cannot sweep '{name}'")
+        try:
+            combos = combinations(sweep)
+        except ValueError as e:
+            raise TemplateError(f"invalid sweep: {e}")
+        # The executor injects swept values as given, so they must already be
+        # in the form the template expects (e.g. 'sine', not 'Sine')
+        for combo in combos:
+            for name, value in combo.items():
+                canonical = check_value(name, self.params[name], value)
+                if canonical != value:
+                    raise TemplateError(f"swept value {value!r} of '{name}' must be written as {canonical!r}")
+        return values
+
+    def render(self, spec: dict) -> str:
+        """The script for a spec; raises TemplateError if the spec does not fit (see fill)."""
+        script = self._join(self.fill(spec), spec)
+        if spec.get("sweep"):
+            script = guard_assignments(script, list(spec["sweep"]))
+        return script
+
+    def _join(self, values: Dict[str, Any], spec: dict) -> str:
+        values = dict(values, want_gif=bool(spec.get("want_gif")),
+                      raw_frames=spec.get("frame_transport", "png") == "raw")
+        parts = list(self._parts)
+        for i in range(1, len(parts), 2):
+            parts[i] = octave_literal(values[parts[i]])
+        return "".join(parts)
+
+
+def load_template(directory: str, name: str) -> Template:
+    """Load and validate <directory>/<name>.m and its <name>.json schema; raises TemplateError."""
+    try:
+        with open(os.path.join(directory, name + ".json")) as f:
+            schema = json.load(f)
+        with open(os.path.join(directory, name + ".m")) as f:
+            source = f.read()
+    except (OSError, json.JSONDecodeError) as e:
+        raise TemplateError(str(e))
+    return Template(name, source, schema)
+
+
+class TemplateRegistry:
+    """
+    The templates of a directory, by task, validated once when loaded.
+    Invalid templates are reported and left out, so their tasks go to the
+    LLM. Lookups are counted per task and outcome ('hit', 'unknown_task',
+    'schema_mismatch'), which shows the tasks worth templating next.
+    """
+
+    def __init__(self, directory: str = TEMPLATES_DIR):
+        self.directory = directory
+        self.templates: Dict[str, Template] = {}
+        self.errors: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._lookups: Dict[str, Dict[str, int]] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.isdir(self.directory):
+            return
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(".json"):
+                continue
+            name = filename[:-len(".json")]
+            try:
+                template = load_template(self.directory, name)
+                for task in template.tasks:
+                    if task in self.templates:
+                        raise TemplateError(f"task '{task}' already has the {self.templates[task].name} template")
+            except TemplateError as e:
+                self.errors[name] = str(e)
+                print(f"Error loading template {name}: {e}")
+                continue
+            for task in template.tasks:
+                self.templates[task] = template
+
+    def lookup(self, spec: dict) -> Tuple[Optional[str], str, Optional[str]]:
+        """
+        Render the template for a spec's task.
+
+        Returns:
+            (script, outcome, reason): the script, or None when the task has
+            no template or the spec does not fit its schema; the outcome;
+            and why the spec did not fit, for a schema mismatch.
+        """
+        task = task_key(spec.get("task"))
+        template = self.templates.get(task)
+        script, reason = None, None
+        if template is None:
+            outcome = UNKNOWN_TASK
+        else:
+            try:
+                script = template.render(spec)
+                outcome = HIT
+            except TemplateError as e:
+                outcome, reason = SCHEMA_MISMATCH, str(e)
+
+        with self._lock:
+            counts = self._lookups.setdefault(task, {})
+            counts[outcome] = counts.get(outcome, 0) + 1
+        registry.inc("octcoder_template_lookups_total", 1,
+                     "Codegen template lookups by task and outcome.", task=task, outcome=outcome)
+        return script, outcome, reason
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Lookups per task, most LLM fallbacks first: the tasks worth templating next."""
+        with self._lock:
+            rows = [dict(counts, task=task) for task, counts in self._lookups.items()]
+        for row in rows:
+            total = sum(row.get(outcome, 0) for outcome in (HIT, UNKNOWN_TASK, SCHEMA_MISMATCH))
+            row["lookups"] = total
+            row["hit_rate"] = row.get(HIT, 0) / total
+        return sorted(rows, key=lambda row: (row["lookups"] - row.get(HIT, 0), row["lookups"]), reverse=True)
+
+
+@lru_cache(maxsize=None)
+def get_template_registry() -> TemplateRegistry:
+    """Process-wide template registry, loaded from TEMPLATES_DIR on first use."""
+    return TemplateRegistry()
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python -m tools.templates [list | render <spec-json>]
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    templates = get_template_registry()
+    if command == "list":
+        for template in dict.fromkeys(templates.templates.values()):
+            print(f"{template.name}: tasks {', '.join(template.tasks)}; params {', '.join(template.params)}")
+        for name, error in templates.errors.items():
+            print(f"{name}: INVALID ({error})")
+        sys.exit(1 if templates.errors else 0)
+    elif command == "render" and len(sys.argv) > 2:
+        script, outcome, reason = templates.lookup(json.loads(sys.argv[2]))
+        if script is None:
+            sys.exit(f"{outcome}: {reason}" if reason else outcome)
+        print(script)
+    else:
+        sys.exit(f"Unknown command: {' '.join(sys.argv[1:])}")
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import inspect
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from tools.metrics import registry
+
+TRACE_FILE = "trace.json"
+
+# Spans finished so far by the node running in this context, the node's name,
+# and the innermost open span (for `annotate`)
+_spans = contextvars.ContextVar("octcoder_spans", default=None)
+_node = contextvars.ContextVar("octcoder_node", default=None)
+_current = contextvars.ContextVar("octcoder_current_span", default=None)
+
+# Span attributes that feed process-wide counters
+_COUNTERS = {
+    "prompt_tokens": ("octcoder_llm_prompt_tokens_total", "LLM prompt tokens by node."),
+    "completion_tokens": ("octcoder_llm_completion_tokens_total", "LLM completion tokens by node."),
+    "stdout_bytes": ("octcoder_octave_stdout_bytes_total", "Bytes Octave wrote to stdout."),
+    "stderr_bytes": ("octcoder_octave_stderr_bytes_total", "Bytes Octave wrote to stderr."),
+    "frame_count": ("octcoder_frames_total", "Animation frames produced by Octave runs."),
+    "gif_bytes": ("octcoder_gif_bytes_total", "Bytes of GIF written by the executor."),
+    "preflight_rewrites": ("octcoder_preflight_rewrites_total", "Script lines rewritten by the preflight check."),
+    "preflight_rejected": ("octcoder_preflight_rejections_total", "Scripts rejected by the preflight check."),
+}
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a step of the current node.
+
+    Yields the span record, a dict that callers may add attributes to. The
+    record is appended to the node's trace (when running inside a traced
+    node) and reported to the metrics registry when the block exits.
+    """
+    record = {"node": _node.get(), "name": name, "start": time.time(), **attributes}
+    started = time.perf_counter()
+    token = _current.set(record)
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        record["wall_seconds"] = time.perf_counter() - started
+        spans = _spans.get()
+        if spans is not None:
+            spans.append(record)
+        _record_metrics(record)
+
+
+def annotate(**attributes) -> None:
+    """Add attributes to the innermost open span, if any."""
+    record = _current.get()
+    if record is not None:
+        record.update(attributes)
+
+
+def add_spans(records: List[Dict[str, Any]]) -> None:
+    """Add spans recorded elsewhere (e.g. by a job worker) to the current node's trace."""
+    spans = _spans.get()
+    if spans is not None:
+        spans.extend(records)
+
+
+def record_llm_usage(record: Dict[str, Any], message) -> None:
+    """Copy token counts from an LLM message's usage metadata onto a span."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        record["prompt_tokens"] = usage.get("input_tokens", 0)
+        record["completion_tokens"] = usage.get("output_tokens", 0)
+
+
+def write_trace(run_dir: str, spans: List[Dict[str, Any]]) -> None:
+    """Write a run's spans, in start order, to <run_dir>/trace.json."""
+    spans = sorted(spans, key=lambda s: s["start"])
+    totals = {}
+    for s in spans:
+        if s["name"] == s["node"]:
+            totals[s["node"]] = totals.get(s["node"], 0) + s["wall_seconds"]
+    with open(os.path.join(run_dir, TRACE_FILE), "w") as f:
+        json.dump({"node_seconds": totals, "spans": spans}, f, indent=2, default=str)
+
+
+def traced_node(name: str, fn):
+    """
+    Wrap a graph node so that it runs inside a span named after the node.
+
+    The wrapped node adds its spans to the state's 'trace' list and, once the
+    run directory is known, rewrites <run_dir>/trace.json with the whole
+    trace so far. Works for both sync and async nodes.
+    """
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(state: dict) -> dict:
+            spans, tokens = _enter(name)
+            try:
+                with span(name):
+                    update = await fn(state)
+            except BaseException:
+                _flush(state, None, spans)
+                raise
+            finally:
+                _exit(tokens)
+            return _flush(state, update, spans)
+    else:
+        @functools.wraps(fn)
+        def wrapper(state: dict) -> dict:
+            spans, tokens = _enter(name)
+            try:
+                with span(name):
+                    update = fn(state)
+            except BaseException:
+                _flush(state, None, spans)
+                raise
+            finally:
+                _exit(tokens)
+            return _flush(state, update, spans)
+    return wrapper
+
+
+def _enter(name: str):
+    spans = []
+    return spans, (_spans.set(spans), _node.set(name))
+
+
+def _exit(tokens) -> None:
+    spans_token, node_token = tokens
+    _node.reset(node_token)
+    _spans.reset(spans_token)
+
+
+def _flush(state: dict, update: Optional[dict], spans: List[Dict[str, Any]]) -> Optional[dict]:
+    run_dir = (update or {}).get("run_dir") or state.get("run_dir")
+    if run_dir and os.path.isdir(run_dir):
+        try:
+            write_trace(run_dir, state.get("trace", []) + spans)
+        except OSError as e:
+            print(f"Error writing trace: {e}")
+    if update is None:
+        return None
+    return {**update, "trace": spans}
+
+
+def _record_metrics(record: Dict[str, Any]) -> None:
+    node = record["node"] or ""
+    registry.observe("octcoder_stage_seconds", record["wall_seconds"],
+                     "Wall time of pipeline nodes and their steps.", node=node, step=record["name"])
+    for attribute, (metric, help_text) in _COUNTERS.items():
+        if record.get(attribute):
+            registry.inc(metric, record[attribute], help_text, node=node)
+    if record.get("peak_rss_bytes"):
+        registry.set("octcoder_octave_peak_rss_bytes", record["peak_rss_bytes"],
+                     "Peak resident memory of the most recent Octave run.")
+    if record.get("limit"):
+        registry.inc("octcoder_octave_limit_kills_total", 1,
+                     "Octave runs stopped for exceeding a resource limit.", limit=record["limit"])
+    if "error" in record:
+        registry.inc("octcoder_stage_errors_total", 1,
+                     "Nodes and steps that raised an exception.", node=node, step=record["name"])
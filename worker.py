@@ -0,0 +1,378 @@
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import socket
+import sqlite3
+import asyncio
+import argparse
+import traceback
+import contextlib
+import contextvars
+import multiprocessing
+from functools import lru_cache
+from dotenv import load_dotenv
+from tools.job_queue import (get_job_queue, QueueFull, LLM_LANE, EXECUTE_LANE, FINAL_STATUSES,
+                             lease_seconds, poll_interval, max_queued)
+
+# Load environment variables (GOOGLE_API_KEY, etc.)
+load_dotenv()
+
+# Finished jobs are deleted from the queue after this many seconds
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))
+
+# Latest frame of a running execute job, written into its run directory
+PREVIEW_FILE = "preview.png"
+
+# Keys of the final pipeline state kept as a pipeline job's result
+RESULT_KEYS = ("ack", "spec", "script", "run_dir", "gif", "animation", "response")
+
+# The pipeline job the current task is running (see queued_execute)
+_current_job = contextvars.ContextVar("job_id", default=None)
+
+
+def execute_workers() -> int:
+    """Execute-lane worker processes (JOB_EXECUTE_WORKERS, default one per CPU core)."""
+    return int(os.getenv("JOB_EXECUTE_WORKERS", str(os.cpu_count() or 1)))
+
+
+def llm_workers() -> int:
+    """LLM-lane worker processes (JOB_LLM_WORKERS, default 1)."""
+    return int(os.getenv("JOB_LLM_WORKERS", "1"))
+
+
+def llm_jobs() -> int:
+    """Pipeline jobs in flight per LLM-lane worker (JOB_LLM_CONCURRENCY, default LLM_CONCURRENCY)."""
+    from tools.concurrency import llm_concurrency
+    return int(os.getenv("JOB_LLM_CONCURRENCY", str(llm_concurrency())))
+
+
+def worker_id(lane: str, pid: int = None) -> str:
+    return f"{socket.gethostname()}:{pid or os.getpid()}:{lane}"
+
+
+# --- Worker loop ---
+
+async def serve_lane(lane: str, concurrency: int, handler) -> None:
+    """
+    Claim jobs of `lane` and run up to `concurrency` of them at once with
+    `handler(job) -> result`. Leases are renewed while jobs run, and a job
+    whose cancellation was requested has its task cancelled.
+
+    Queue calls block on SQLite (up to its busy timeout while another
+    process writes), so they run in threads, here and in the handlers,
+    rather than stalling every job of the worker.
+    """
+    queue = get_job_queue()
+    worker = worker_id(lane)
+    lease = lease_seconds()
+    tasks = {}
+    cancelling = set()
+    while True:
+        try:
+            if tasks:
+                for job_id in await asyncio.to_thread(queue.heartbeat, worker, lease):
+                    if job_id in tasks and job_id not in cancelling:
+                        cancelling.add(job_id)
+                        tasks[job_id].cancel()
+            while len(tasks) < concurrency:
+                job = await asyncio.to_thread(queue.claim, lane, worker, lease)
+                if job is None:
+                    break
+                tasks[job["job_id"]] = asyncio.create_task(_run_job(queue, worker, job, handler))
+        except sqlite3.Error as e:
+            print(f"Error polling job queue: {e}")
+
+        if tasks:
+            await asyncio.wait(tasks.values(), timeout=poll_interval())
+        else:
+            await asyncio.sleep(poll_interval())
+        for job_id in [job_id for job_id, task in tasks.items() if task.done()]:
+            del tasks[job_id]
+            cancelling.discard(job_id)
+
+
+async def _run_job(queue, worker: str, job: dict, handler) -> None:
+    job_id = job["job_id"]
+    try:
+        result = await handler(job)
+    except asyncio.CancelledError:
+        # Stop the job's sub-jobs too
+        await asyncio.to_thread(queue.cancel, job_id)
+        await asyncio.to_thread(queue.finish, job_id, worker, "cancelled")
+        return
+    except Exception as e:
+        print(f"Error running job {job_id}: {e}")
+        await asyncio.to_thread(queue.finish, job_id, worker, "failed", error=traceback.format_exc())
+        return
+    await asyncio.to_thread(queue.finish, job_id, worker, "done", result)
+
+
+# --- Execute lane ---
+
+@lru_cache(maxsize=None)
+def _execute_graph():
+    from pipeline import build_execute_graph
+    return build_execute_graph()
+
+
+async def run_execute_job(job: dict) -> dict:
+    """
+    Execute lane: run a job's script (or sweep) with the executor agent,
+    reporting frame previews as the job's progress.
+    """
+    queue = get_job_queue()
+    result = {}
+    # Cancelling the task kills the Octave run, pooled or not
+    async for mode, payload in _execute_graph().astream(job["payload"], stream_mode=["updates", "custom"]):
+        if mode == "custom":
+            if payload.get("type") == "frame":
+                await asyncio.to_thread(_report_preview, queue, job["job_id"], payload)
+            continue
+        result.update(payload.get("execute") or {})
+    return result
+
+
+def _report_preview(queue, job_id: str, event: dict) -> None:
+    """Save the frame as the run's preview image (frames may be deleted once encoded)."""
+    path = os.path.join(event["run_dir"], PREVIEW_FILE)
+    try:
+        if isinstance(event["frame"], str):
+            shutil.copyfile(event["frame"], path + ".tmp")
+        else:
+            from PIL import Image
+            Image.fromarray(event["frame"]).save(path + ".tmp", format="PNG")
+        os.replace(path + ".tmp", path)
+    except OSError:
+        return
+    queue.update_progress(job_id, {"preview": path, "frames": event["count"], "fps": event["fps"]})
+
+
+# --- LLM lane ---
+
+async def run_pipeline_job(job: dict) -> dict:
+    """
+    LLM lane: run the pipeline for a request, with the execute stage handed
+    to the execute lane. Progress holds the last finished 'stage', the
+    chat 'ack', 'run_dir', 'gif' and the 'summary' streamed so far.
+
+    Unless CHECKPOINTS=0 the state is checkpointed under the job id (see
+    pipeline.checkpoint_path), so a job retried after its worker died
+    continues from the node it was on instead of starting over.
+    """
+    from pipeline import build_graph, checkpoints_enabled, arun_checkpointer, run_config
+    queue = get_job_queue()
+    job_id = job["job_id"]
+    _current_job.set(job_id)
+
+    final_state = {}
+    summary_tokens = []
+    last_sent = 0.0
+    async with contextlib.AsyncExitStack() as stack:
+        checkpointer = await stack.enter_async_context(arun_checkpointer(job_id)) if checkpoints_enabled() else None
+        graph = build_graph(use_async=True, execute=queued_execute, checkpointer=checkpointer)
+        config = run_config(job_id) if checkpointer else None
+        graph_input = {"user_input": job["payload"]["user_input"], "run_id": job_id}
+        if checkpointer and job["attempts"] > 1 and (await graph.aget_state(config)).next:
+            print(f"Resuming job {job_id} from its checkpoint")
+            graph_input = None
+
+        async for mode, payload in graph.astream(graph_input, config, stream_mode=["updates", "messages"]):
+            if mode == "messages":
+                message, metadata = payload
+                if metadata.get("langgraph_node") == "summarise" and isinstance(message.content, str):
+                    summary_tokens.append(message.content)
+                    if time.monotonic() - last_sent >= poll_interval():
+                        last_sent = time.monotonic()
+                        await asyncio.to_thread(queue.update_progress, job_id, {"summary": "".join(summary_tokens)})
+                continue
+
+            for node_name, update in payload.items():
+                update = update or {}
+                final_state.update(update)
+                progress = {"stage": node_name}
+                progress.update({key: update[key] for key in ("ack", "run_dir", "gif") if update.get(key)})
+                await asyncio.to_thread(queue.update_progress, job_id, progress)
+
+        # A resumed job only streams the nodes it had left
+        if checkpointer:
+            final_state = (await graph.aget_state(config)).values
+
+    return {key: final_state.get(key) for key in RESULT_KEYS}
+
+
+async def queued_execute(state: dict) -> dict:
+    """
+    Execute node of the LLM lane: runs the stage as a sub-job on the
+    execute lane and waits for it, relaying its frame previews. Takes and
+    returns the same keys as agents.executor.executor_agent.
+    """
+    from tools.tracing import add_spans, annotate
+    queue = get_job_queue()
+    parent = _current_job.get()
+    payload = {key: state[key] for key in ("script", "spec", "exec_cache", "run_id") if key in state}
+    child = await asyncio.to_thread(queue.submit, EXECUTE_LANE, payload, parent_id=parent)
+    relayed = None
+    try:
+        while True:
+            job = await asyncio.to_thread(queue.get, child)
+            if job["status"] in FINAL_STATUSES:
+                break
+            preview = {key: job["progress"].get(key) for key in ("preview", "frames", "fps")}
+            if parent and preview["preview"] and preview != relayed:
+                await asyncio.to_thread(queue.update_progress, parent, preview)
+                relayed = preview
+            await asyncio.sleep(poll_interval())
+    except asyncio.CancelledError:
+        await asyncio.to_thread(queue.cancel, child)
+        raise
+
+    if job["status"] != "done":
+        raise RuntimeError(f"Execute job {child} {job['status']}: {job['error']}")
+    result = job["result"]
+    # The remote node's inner spans (Octave, GIF encoding); its node span
+    # is covered by this node's own
+    add_spans([s for s in result.pop("trace", []) if s["name"] != s["node"]])
+    annotate(execute_job=child, queue_seconds=job["started"] - job["created"])
+    return result
+
+
+# --- Supervisor ---
+
+def _worker_main(lane: str) -> None:
+    """Entry point of a worker process."""
+    try:
+        if lane == EXECUTE_LANE:
+            # One job at a time per process, so one warm interpreter suffices
+            os.environ.setdefault("OCTAVE_POOL_SIZE", "1")
+            from tools.octave_pool import get_pool
+            pool = get_pool()
+            if pool is not None:
+                pool.warm()
+            asyncio.run(serve_lane(EXECUTE_LANE, 1, run_execute_job))
+        else:
+            asyncio.run(serve_lane(LLM_LANE, llm_jobs(), run_pipeline_job))
+    except KeyboardInterrupt:
+        pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _release_dead(queue) -> None:
+    """Requeue jobs held by workers of this host that no longer exist (e.g. after a crash)."""
+    host = socket.gethostname()
+    for worker in queue.workers():
+        worker_host, pid, _ = worker.rsplit(":", 2)
+        if worker_host == host and not _pid_alive(int(pid)):
+            requeued, failed = queue.release(worker)
+            print(f"Recovered jobs of {worker}: {requeued} requeued, {failed} failed")
+
+
+def serve(llm: int, execute: int) -> None:
+    """
+    Run `llm` LLM-lane and `execute` execute-lane worker processes until
+    SIGINT/SIGTERM, restarting any that die (with backoff). The jobs of a
+    dead worker are requeued at once; jobs of a hung worker are requeued
+    when their lease expires.
+    """
+    queue = get_job_queue()
+    _release_dead(queue)
+    context = multiprocessing.get_context("spawn")
+    lanes = [LLM_LANE] * llm + [EXECUTE_LANE] * execute
+    procs = [None] * len(lanes)
+    started = [0.0] * len(lanes)
+    failures = [0] * len(lanes)
+    restart_at = [0.0] * len(lanes)
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"Serving {queue.db_path} with {llm} LLM and {execute} execute worker(s)")
+
+    last_sweep = 0.0
+    while not stopping:
+        now = time.monotonic()
+        for i, lane in enumerate(lanes):
+            proc = procs[i]
+            if proc is not None and proc.is_alive():
+                continue
+            if proc is not None:
+                requeued, failed = queue.release(worker_id(lane, proc.pid))
+                print(f"The {lane} worker {proc.pid} exited with code {proc.exitcode}: "
+                      f"{requeued} job(s) requeued, {failed} failed")
+                # Back off when a worker keeps dying right after it starts
+                failures[i] = failures[i] + 1 if now - started[i] < 60 else 0
+                restart_at[i] = now + min(60, 2 ** failures[i] - 1)
+                procs[i] = None
+            if now >= restart_at[i]:
+                procs[i] = context.Process(target=_worker_main, args=(lane,), name=f"octcoder-{lane}-{i}")
+                procs[i].start()
+                started[i] = now
+        if now - last_sweep >= lease_seconds():
+            last_sweep = now
+            try:
+                queue.recover()
+                queue.purge(JOB_RETENTION)
+            except sqlite3.Error as e:
+                print(f"Error sweeping job queue: {e}")
+        time.sleep(poll_interval())
+
+    for proc in procs:
+        if proc is not None:
+            proc.terminate()
+    for lane, proc in zip(lanes, procs):
+        if proc is not None:
+            proc.join()
+            queue.release(worker_id(lane, proc.pid))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the job workers, or submit, inspect and cancel jobs.")
+    commands = parser.add_subparsers(dest="command")
+    serve_parser = commands.add_parser("serve", help="Run the worker processes (the default).")
+    serve_parser.add_argument("--llm-workers", type=int, help="LLM-lane processes (JOB_LLM_WORKERS).")
+    serve_parser.add_argument("--execute-workers", type=int, help="Execute-lane processes (JOB_EXECUTE_WORKERS).")
+    submit_parser = commands.add_parser("submit", help="Queue a simulation request and print its job id.")
+    submit_parser.add_argument("query", help="The natural language request for the Octave simulation.")
+    status_parser = commands.add_parser("status", help="Print a job's status, progress and result.")
+    status_parser.add_argument("job_id")
+    cancel_parser = commands.add_parser("cancel", help="Cancel a job.")
+    cancel_parser.add_argument("job_id")
+    commands.add_parser("stats", help="Print job counts by lane and status.")
+    args = parser.parse_args()
+
+    queue = get_job_queue()
+    if args.command in (None, "serve"):
+        serve(getattr(args, "llm_workers", None) or llm_workers(),
+              getattr(args, "execute_workers", None) or execute_workers())
+    elif args.command == "submit":
+        try:
+            print(queue.submit(LLM_LANE, {"user_input": args.query}, limit=max_queued()))
+        except QueueFull as e:
+            sys.exit(f"Rejected: {e}")
+    elif args.command == "status":
+        job = queue.get(args.job_id)
+        if job is None:
+            sys.exit(f"Unknown job: {args.job_id}")
+        print(json.dumps(job, indent=2, default=str))
+    elif args.command == "cancel":
+        if not queue.cancel(args.job_id):
+            sys.exit(f"Job {args.job_id} has already finished or does not exist")
+        print(f"Cancelling {args.job_id}")
+    elif args.command == "stats":
+        print(json.dumps(queue.stats()))